@@ -0,0 +1,304 @@
+# agentSandbox.py
+# ---------------
+# Runs capture agents in long-lived subprocesses.
+
+"""
+Optional execution mode in which every agent lives in its own subprocess.
+
+A SandboxedAgent stands in for the real agent inside Game.run.  The first
+call to registerInitialState starts a child process that owns the real
+agent and receives the full starting state once.  From then on, each turn
+only a compact delta of what changed since the agent last moved is sent over
+a pipe: the agents that moved, flipped food cells, capsules, score and time
+left.  The child keeps a mirror of the game state, applies the delta, runs
+the agent's own observationFunction (visibility and sonar) and getAction on
+it, and sends the action and the sonar readings back.  With pondering
+enabled, the child then calls the agent's ponder method with the same
+observation until the next request arrives.
+
+A child is forked once and plays every game of a run, so it does not share
+the random state of the engine.  When the games are seeded, every game sends
+its seed along with the starting state, and the child seeds its own global
+random and the sonar noise of its observations from the seed and the agent's
+index before registerInitialState.  A seeded game therefore plays the same
+in the sandbox every time.
+
+A crashing or memory-hungry agent only takes down its own child; the engine
+sees that as an ordinary agent crash.  Time limits are still enforced by the
+engine around getAction, exactly like for in-process agents.
+"""
+
+from game import Agent, Configuration
+import multiprocessing
+import random
+import threading
+import time
+import traceback
+
+if 'fork' in multiprocessing.get_all_start_methods():
+    _CONTEXT = multiprocessing.get_context('fork')
+else:
+    _CONTEXT = multiprocessing.get_context()
+
+# How long close() waits for a child to exit by itself before killing it.
+CLOSE_TIMEOUT = 1.0
+
+
+class SandboxError(Exception):
+    """Raised in the engine when a sandboxed agent crashed or vanished"""
+    pass
+
+
+def _agentKey(agentState):
+    config = agentState.configuration
+    return (config.pos, config.direction, agentState.isPacman,
+            agentState.scaredTimer, agentState.numCarrying,
+            agentState.numReturned)
+
+
+def encodeDelta(old, new):
+    """
+    Returns the changes needed to turn GameState old into GameState new.
+
+    Only game-varying data is encoded; the layout and team assignment are
+    known to the receiver from the initial state.
+    """
+    agents = []
+    for index, (a, b) in enumerate(zip(old.data.agentStates, new.data.agentStates)):
+        key = _agentKey(b)
+        if _agentKey(a) != key:
+            agents.append((index,) + key)
+
+    food = []
+    oldFood, newFood = old.data.food.data, new.data.food.data
+    if oldFood is not newFood:
+        for x, (oldColumn, newColumn) in enumerate(zip(oldFood, newFood)):
+            if oldColumn != newColumn:
+                food.extend((x, y) for y, (a, b) in enumerate(zip(oldColumn, newColumn)) if a != b)
+
+    capsules = None
+    if old.data.capsules != new.data.capsules:
+        capsules = new.data.capsules[:]
+
+    return (tuple(agents), tuple(food), capsules, new.data.score,
+            new.data.timeleft, new.data._win, new.data._agentMoved)
+
+
+def applyDelta(state, delta):
+    """
+    Returns a new GameState: state with delta (see encodeDelta) applied.
+    """
+    agents, food, capsules, score, timeleft, win, agentMoved = delta
+    state = state.__class__(state)
+    for index, pos, direction, isPacman, scaredTimer, numCarrying, numReturned in agents:
+        agentState = state.data.agentStates[index]
+        agentState.configuration = Configuration(pos, direction)
+        agentState.isPacman = isPacman
+        agentState.scaredTimer = scaredTimer
+        agentState.numCarrying = numCarrying
+        agentState.numReturned = numReturned
+    if food:
+        grid = state.data.food = state.data.food.copy()
+        for x, y in food:
+            grid[x][y] = not grid[x][y]
+    if capsules is not None:
+        state.data.capsules = capsules
+    state.data.score = score
+    state.data.timeleft = timeleft
+    state.data._win = win
+    state.data._agentMoved = agentMoved
+    return state
+
+
+def _ponder(connection, agent, observation):
+    """
+    Lets the agent ponder on the observation of its last move until the
+    engine sends the next request.
+    """
+    thread = threading.current_thread()
+    thread.ponderStopCheck = connection.poll
+    try:
+        agent.ponder(observation)
+    except Exception:
+        traceback.print_exc()
+    finally:
+        del thread.ponderStopCheck
+
+
+def _sandboxMain(connection, agent, ponder):
+    """
+    Main loop of the child process owning a single agent.
+
+    Every request is (sequence, kind, payload); every reply is
+    (sequence, ok, value, cpuTime).
+    """
+    # Agents must not draw on the parent's window from another process.
+    import __main__
+    __main__.__dict__.pop('_display', None)
+
+    state = None
+    observation = None
+    # The random of the sonar noise, kept out of the states the agent sees
+    rng = random
+    while True:
+        try:
+            sequence, kind, payload = connection.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if kind == 'close':
+            break
+        start = time.thread_time()
+        try:
+            value = None
+            if kind == 'init':
+                state, seed = payload
+                if seed is not None:
+                    # Fork reseeds the global random of the child
+                    rng = random.Random('%s-%d' % (seed, agent.index))
+                    random.seed(rng.getrandbits(64))
+                if hasattr(agent, 'registerInitialState'):
+                    agent.registerInitialState(state.deepCopy())
+            elif kind == 'act':
+                state = applyDelta(state, payload)
+                if hasattr(agent, 'observationFunction'):
+                    observation = agent.observationFunction(state.observedBy(agent.index, rng))
+                else:
+                    observation = state.deepCopy()
+                value = (agent.getAction(observation), getattr(observation, 'agentDistances', None))
+            elif kind == 'final':
+                state = applyDelta(state, payload)
+                if hasattr(agent, 'final'):
+                    agent.final(state)
+            reply = (sequence, True, value, time.thread_time() - start)
+        except Exception:
+            reply = (sequence, False, traceback.format_exc(), time.thread_time() - start)
+        try:
+            connection.send(reply)
+        except (BrokenPipeError, EOFError):
+            break
+        if ponder and kind == 'act' and reply[1] and hasattr(agent, 'ponder'):
+            _ponder(connection, agent, observation)
+    connection.close()
+
+
+class SandboxedAgent(Agent):
+    """
+    Engine-side proxy for an agent that runs in its own subprocess.
+    """
+
+    def __init__(self, agent, ponder=False):
+        Agent.__init__(self, agent.index)
+        self.agent = agent
+        # Not called 'ponder': the engine would take that for the agent hook
+        self.ponderInChild = ponder
+        self.connection = None
+        self.process = None
+        self.lastState = None
+        self.sequence = 0
+        # Seed of the next game, see seedAgents
+        self.seed = None
+        # Sonar readings the agent was given on its last move
+        self.lastSonar = None
+        # CPU time the child spent on the last request, so the engine can
+        # charge it even though the proxy itself only waits.
+        self.remoteCpuTime = 0.0
+
+    def _start(self):
+        parentEnd, childEnd = _CONTEXT.Pipe()
+        self.process = _CONTEXT.Process(target=_sandboxMain,
+                                        args=(childEnd, self.agent, self.ponderInChild),
+                                        name='agent-%d' % self.index,
+                                        daemon=True)
+        self.process.start()
+        childEnd.close()
+        self.connection = parentEnd
+
+    def _call(self, kind, payload):
+        if self.process is None:
+            self._start()
+        self.sequence += 1
+        self.remoteCpuTime = 0.0
+        try:
+            self.connection.send((self.sequence, kind, payload))
+            while True:
+                sequence, ok, value, cpuTime = self.connection.recv()
+                # Replies to requests the engine gave up on (timeouts) are stale.
+                if sequence == self.sequence:
+                    break
+        except (EOFError, OSError):
+            raise SandboxError('Agent %d: sandbox process exited (code %s)'
+                               % (self.index, self.process.exitcode))
+        self.remoteCpuTime = cpuTime
+        if not ok:
+            raise SandboxError('Agent %d crashed in its sandbox:\n%s' % (self.index, value))
+        return value
+
+    def registerInitialState(self, state):
+        self.lastState = state
+        self._call('init', (state, self.seed))
+
+    def getAction(self, state):
+        delta = encodeDelta(self.lastState, state)
+        self.lastState = state
+        action, self.lastSonar = self._call('act', delta)
+        return action
+
+    def final(self, state):
+        if self.lastState is None:
+            return
+        delta = encodeDelta(self.lastState, state)
+        self.lastState = None
+        self._call('final', delta)
+
+    def close(self):
+        """
+        Stops the child process, killing it if it does not stop by itself.
+        """
+        if self.process is None:
+            return
+        try:
+            self.connection.send((0, 'close', None))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(CLOSE_TIMEOUT)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+        self.process = None
+        self.connection = None
+
+
+def sandboxAgents(agents, keep=(), ponder=False):
+    """
+    Wraps every agent in a SandboxedAgent, except missing agents and
+    instances of the classes in keep (e.g. keyboard agents, which need the
+    display of this process).  With ponder, sandboxed agents ponder in their
+    own process between turns.
+    """
+    sandboxed = []
+    for agent in agents:
+        if agent is None or isinstance(agent, tuple(keep)):
+            sandboxed.append(agent)
+        else:
+            sandboxed.append(SandboxedAgent(agent, ponder))
+    return sandboxed
+
+
+def seedAgents(agents, seed):
+    """
+    Makes the sandboxed agents in agents seed their processes from seed when
+    the next game starts.
+    """
+    for agent in agents:
+        if isinstance(agent, SandboxedAgent):
+            agent.seed = seed
+
+
+def closeAgents(agents):
+    """
+    Stops the subprocesses of all sandboxed agents in agents.
+    """
+    for agent in agents:
+        if isinstance(agent, SandboxedAgent):
+            agent.close()
@@ -59,6 +59,9 @@ from game import Configuration
 from game import Agent
 from game import reconstituteGrid
 import sys, util, types, time, random, imp
+import os
+import struct
+import events
 import keyboardAgents
 
 # If you change these, you won't affect the server, so you can't cheat
@@ -73,8 +76,20 @@ DUMP_FOOD_ON_DEATH = True # if we have the gameplay element that dumps dots on d
 
 SCARED_TIME = 40
 
-def noisyDistance(pos1, pos2):
-  return int(util.manhattanDistance(pos1, pos2) + random.choice(SONAR_NOISE_VALUES))
+# Layout of GameState.toBytes: score, time left, win flag and number of agents,
+# then per agent x, y (-1 when unknown), direction, isPacman, scared timer,
+# carried and returned food, then the capsules and the food bits.
+_STATE = struct.Struct('<iIBB')
+_AGENT = struct.Struct('<hhBBHHH')
+_COUNT = struct.Struct('<H')
+_POSITION = struct.Struct('<HH')
+
+# Direction codes of GameState.toBytes, the same as replay.ACTIONS.
+_DIRECTIONS = (Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP)
+_DIRECTION_CODES = dict((direction, code) for code, direction in enumerate(_DIRECTIONS))
+
+def noisyDistance(pos1, pos2, rng=random):
+  return int(util.manhattanDistance(pos1, pos2) + rng.choice(SONAR_NOISE_VALUES))
 
 ###################################################
 # YOUR INTERFACE TO THE PACMAN WORLD: A GameState #
@@ -93,6 +108,10 @@ class GameState:
   than referring to the GameStateData object directly.
   """
 
+  # (index, distances): the sonar readings of agent index, drawn by the
+  # engine for its move; see observedBy
+  _sonar = None
+
   ####################################################
   # Accessor methods: use these to access state data #
   ####################################################
@@ -264,13 +283,92 @@ class GameState:
     state.agentDistances = self.agentDistances[:]
     return state
 
+  def toBytes( self ):
+    """
+    Returns the parts of the state that change during a game (agents, food,
+    capsules, score, time left) as a compact byte string.  The layout and
+    the teams are left out; fromBytes gets them from the layout again.
+    Equal states give equal bytes.
+    """
+    data = self.data
+    parts = [_STATE.pack(data.score, data.timeleft, bool(data._win), len(data.agentStates))]
+    for agentState in data.agentStates:
+      config = agentState.configuration
+      if config is None:
+        x, y, direction = -1, -1, Directions.STOP
+      else:
+        (x, y), direction = config.pos, config.direction
+      parts.append(_AGENT.pack(int(x), int(y), _DIRECTION_CODES[direction],
+                               agentState.isPacman, agentState.scaredTimer,
+                               agentState.numCarrying, agentState.numReturned))
+    parts.append(_COUNT.pack(len(data.capsules)))
+    for position in data.capsules:
+      parts.append(_POSITION.pack(*position))
+    food = data.food
+    parts.append(food.toInt().to_bytes((food.width * food.height + 7) // 8, 'little'))
+    return b''.join(parts)
+
+  def fromBytes( layoutRef, payload ):
+    """
+    Returns the GameState encoded by toBytes.  layoutRef is the layout of the
+    game, or any GameState of the same game; restoring many states is
+    cheapest with a state, which shares its layout and teams.
+    """
+    score, timeleft, win, numAgents = _STATE.unpack_from(payload)
+    if isinstance(layoutRef, GameState):
+      state = GameState(layoutRef)
+      state.agentDistances = []
+    else:
+      state = GameState()
+      state.initialize(layoutRef, numAgents)
+    data = state.data
+    data.score = score
+    data.timeleft = timeleft
+    data._win = bool(win)
+    pos = _STATE.size
+    for agentState in data.agentStates[:numAgents]:
+      x, y, direction, isPacman, scaredTimer, numCarrying, numReturned = _AGENT.unpack_from(payload, pos)
+      pos += _AGENT.size
+      if x < 0:
+        agentState.configuration = None
+      else:
+        agentState.configuration = Configuration((float(x), float(y)), _DIRECTIONS[direction])
+      agentState.isPacman = bool(isPacman)
+      agentState.scaredTimer = scaredTimer
+      agentState.numCarrying = numCarrying
+      agentState.numReturned = numReturned
+    numCapsules, = _COUNT.unpack_from(payload, pos)
+    pos += _COUNT.size
+    data.capsules = [_POSITION.unpack_from(payload, pos + i * _POSITION.size) for i in range(numCapsules)]
+    pos += numCapsules * _POSITION.size
+    data.food = Grid(data.food.width, data.food.height)
+    data.food.fromInt(int.from_bytes(payload[pos:], 'little'))
+    return state
+  fromBytes = staticmethod( fromBytes )
+
+  def observedBy(self, index, rng=random):
+    """
+    Returns a copy of the state for agent index to observe from, with its
+    sonar readings drawn from rng, which makeObservation(index) then uses.
+    The engine draws the readings of every move itself, so observing again
+    or drawing on the global random does not change them.
+    """
+    state = self.deepCopy()
+    pos = self.getAgentPosition(index)
+    state._sonar = (index, tuple(noisyDistance(pos, self.getAgentPosition(i), rng)
+                                 for i in range(self.getNumAgents())))
+    return state
+
   def makeObservation(self, index):
     state = self.deepCopy()
 
     # Adds the sonar signal
     pos = state.getAgentPosition(index)
     n = state.getNumAgents()
-    distances = [noisyDistance(pos, state.getAgentPosition(i)) for i in range(n)]
+    if self._sonar is not None and self._sonar[0] == index:
+      distances = list(self._sonar[1])
+    else:
+      distances = [noisyDistance(pos, state.getAgentPosition(i)) for i in range(n)]
     state.agentDistances = distances
 
     # Remove states of distant opponents
@@ -364,13 +462,23 @@ class CaptureRules:
 
   def __init__(self, quiet = False):
     self.quiet = quiet
+    # The random.Random of the current game for the sonar noise, or None
+    # for the global random; see newGame
+    self.rng = None
 
-  def newGame( self, layout, agents, display, length, muteAgents, catchExceptions ):
+  def newGame( self, layout, agents, display, length, muteAgents, catchExceptions, chargeCpuTime=False, allowPondering=False,
+               recordTimings=False, rng=None ):
+    """
+    rng is a random.Random for the starting team and the sonar noise of the
+    game, see observedState; without one, the global random is used.
+    """
     initState = GameState()
     initState.initialize( layout, len(agents) )
-    starter = random.randint(0,1)
+    self.rng = rng
+    starter = (rng or random).randint(0,1)
     print('%s team starts' % ['Red', 'Blue'][starter])
-    game = Game(agents, display, self, startingIndex=starter, muteAgents=muteAgents, catchExceptions=catchExceptions)
+    game = Game(agents, display, self, startingIndex=starter, muteAgents=muteAgents, catchExceptions=catchExceptions,
+                chargeCpuTime=chargeCpuTime, allowPondering=allowPondering, recordTimings=recordTimings)
     game.state = initState
     game.length = length
     game.state.data.timeleft = length
@@ -380,6 +488,52 @@ class CaptureRules:
     self._initRedFood = initState.getRedFood().count()
     return game
 
+  def observedState(self, state, agentIndex):
+    """
+    Returns the copy of state that the observationFunction of an agent gets,
+    with sonar readings drawn from the random of the game, which agents
+    cannot reach.
+    """
+    return state.observedBy(agentIndex, self.rng or random)
+
+  def moveEvents(self, game, previous, state, agentIndex, action):
+    """
+    Emits the events (see events.py) of a move that led from state previous
+    to state.  Only called when somebody listens to game.events.
+    """
+    emit = game.events.emit
+    data = state.data
+    if data._foodEaten != None:
+      emit(events.FOOD_EATEN, agent=agentIndex, position=data._foodEaten)
+    if data._capsuleEaten != None:
+      emit(events.CAPSULE, agent=agentIndex, position=data._capsuleEaten)
+
+    # Agents die by being sent back to their start, so they jump
+    before, after = previous.data.agentStates, data.agentStates
+    expected = Actions.getSuccessor(before[agentIndex].configuration.pos, action)
+    opponents = state.getBlueTeamIndices() if state.isOnRedTeam(agentIndex) else state.getRedTeamIndices()
+    for index, (old, new) in enumerate(zip(before, after)):
+      if index == agentIndex:
+        if new.configuration.pos == expected: continue
+        killers = [i for i in opponents if after[i].configuration.pos == expected]
+        killer = killers[0] if killers else None
+        position = expected
+      else:
+        if new.configuration.pos == old.configuration.pos: continue
+        killer = agentIndex
+        position = old.configuration.pos
+      carrying = old.numCarrying + (1 if index == agentIndex and data._foodEaten != None else 0)
+      emit(events.DEATH, agent=index, killer=killer, position=tuple(int(c) for c in position),
+           carrying=carrying)
+      if carrying and data._foodAdded:
+        emit(events.FOOD_DUMPED, agent=index, positions=list(data._foodAdded))
+
+    returned = after[agentIndex].numReturned - before[agentIndex].numReturned
+    if returned:
+      emit(events.FOOD_RETURNED, agent=agentIndex, amount=returned)
+    if data.scoreChange:
+      emit(events.SCORE, agent=agentIndex, change=data.scoreChange, score=data.score)
+
   def process(self, state, game):
     """
     Checks to see whether it is time to end the game.
@@ -809,12 +963,31 @@ def readCommand( argv ):
                     help='Replays a recorded game file.')
   parser.add_option('--replayq', default=None,
                     help='Replays a recorded game file without display to generate result log.')
+  parser.add_option('--playlist', default=None,
+                    help='Replays all recorded games in a directory or matching a glob pattern in one window')
+  parser.add_option('--replay-start', type='int', dest='replay_start', default=0,
+                    help=default('Move at which to start a replay'))
   parser.add_option('--delay-step', type='float', dest='delay_step',
                     help=default('Delay step in a play or replay.'), default=0.03)                      
   parser.add_option('-x', '--numTraining', dest='numTraining', type='int',
                     help=default('How many episodes are training (suppresses output)'), default=0)
   parser.add_option('-c', '--catchExceptions', action='store_true', default=False,
                     help='Catch exceptions and enforce time limits')
+  parser.add_option('--cpu-time', action='store_true', dest='cpu_time', default=False,
+                    help='Charge agents for their own CPU time instead of wall-clock time; '
+                         'a move is still cut off after %g times its limit in wall-clock time'
+                         % util.CPU_TIME_WALL_FACTOR)
+  parser.add_option('--profile', action='store_true', default=False,
+                    help='Profile every agent and the engine separately; writes profile-*.pstats and profile.collapsed')
+  parser.add_option('--events', action='store_true', default=False,
+                    help='Write the events of every game to events-<game>.jsonl')
+  parser.add_option('--timings', action='store_true', default=False,
+                    help='Write per-agent move latency histograms to timings-<game>.json/.csv')
+  parser.add_option('--ponder', action='store_true', default=False,
+                    help='Run the ponder method of agents that have one while the other agents move; '
+                         'needs --cpu-time or --sandbox')
+  parser.add_option('--sandbox', action='store_true', default=False,
+                    help='Run each agent in its own long-lived subprocess')
 
   options, otherjunk = parser.parse_args(argv)
   assert len(otherjunk) == 0, "Unrecognized options: " + str(otherjunk)
@@ -847,38 +1020,25 @@ def readCommand( argv ):
   args['redTeamName'] = options.red_name
   args['blueTeamName'] = options.blue_name
 
-  if options.fixRandomSeed: random.seed('cs188')
+  if options.fixRandomSeed:
+    random.seed('cs188')
+    args['seed'] = 'cs188'
 
   if options.recordLog:
     sys.stdout = open('log-0', 'w')
     sys.stderr = sys.stdout
 
   # Special case: recorded games don't use the runGames method or args structure
-  if options.replay != None:
-    print('Replaying recorded game %s.' % options.replay)
-    import pickle
-    recorded = pickle.load(open(options.replay,'rb'),encoding="bytes")
-    recorded['display'] = args['display']
-    recorded['delay'] = options.delay_step
-    recorded['redTeamName'] = options.red
-    recorded['blueTeamName'] = options.blue
-    recorded['waitEnd'] = False
-
-    replayGame(**recorded)
+  if options.replay != None or options.replayq != None:
+    replayFile(options.replay or options.replayq, args['display'],
+               options.delay_step if options.replay != None else 0.0, options.red, options.blue,
+               options.replay_start)
     sys.exit(0)
 
-  # Special case: recorded games don't use the runGames method or args structure
-  if options.replayq != None:
-    print('Replaying recorded game %s.' % options.replay)
-    import pickle
-    recorded = pickle.load(open(options.replayq,'rb'),encoding="bytes")
-    recorded['display'] = args['display']
-    recorded['delay'] = 0.0
-    recorded['redTeamName'] = options.red
-    recorded['blueTeamName'] = options.blue
-    recorded['waitEnd'] = False
-
-    replayGame(**recorded)
+  if options.playlist != None:
+    interactive = not (options.textgraphics or options.quiet or options.super_quiet)
+    replayPlaylist(playlistFiles(options.playlist), args['display'], options.delay_step,
+                   options.red, options.blue, interactive)
     sys.exit(0)
 
   # Choose a pacman agent
@@ -935,11 +1095,17 @@ def readCommand( argv ):
   args['record'] = options.record
   args['catchExceptions'] = options.catchExceptions
   args['delay_step'] = options.delay_step
+  args['sandboxAgents'] = options.sandbox
+  args['chargeCpuTime'] = options.cpu_time
+  args['allowPondering'] = options.ponder
+  args['recordTimings'] = options.timings
+  args['recordEvents'] = options.events
+  args['profile'] = options.profile
   return args
 
-def randomLayout(seed = None):
+def randomLayout(seed = None, rng = random):
   if not seed:
-    seed = random.randint(0,99999999)
+    seed = rng.randint(0,99999999)
   # layout = 'layouts/random%08dCapture.lay' % seed
   # print 'Generating random layout in %s' % layout
   import mazeGenerator
@@ -985,22 +1151,167 @@ def loadAgents(isRed, factory, textgraphics, cmdLineArgs):
   indices = [2*i + indexAddend for i in range(2)]
   return createTeamFunc(indices[0], indices[1], isRed, **args)
 
-def replayGame( layout, agents, actions, display, length, redTeamName, blueTeamName, waitEnd=True, delay=1):
+def replayFile( filename, display, delay, redTeamName, blueTeamName, start=0 ):
+  """
+  Replays a recorded game file, binary or pickled, from move start on.  Team
+  names stored in the replay take precedence over the given ones.
+  """
+  import replay
+  print('Replaying recorded game %s.' % filename)
+  recorded = replay.loadReplay(filename)
+  args = recorded.replayArgs()
+  args['redTeamName'] = args['redTeamName'] or redTeamName
+  args['blueTeamName'] = args['blueTeamName'] or blueTeamName
+  if start > 0:
+    args['startState'] = recorded.seek(start)
+    args['actions'] = args['actions'][start:]
+  replayGame(display=display, delay=delay, waitEnd=False, **args)
+
+def playlistFiles(pattern):
+  """
+  Returns the replay files in a directory, or matching a glob pattern, in
+  name order.
+  """
+  import glob
+  if os.path.isdir(pattern):
+    pattern = os.path.join(pattern, '*')
+  return sorted(f for f in glob.glob(pattern) if os.path.isfile(f) and not f.endswith(('.html', '.json', '.csv', '.txt')))
+
+def _namesFromFilename(filename):
+  # play-replays.sh convention: <red>_vs_<blue>_<n>.replay
+  name = os.path.splitext(os.path.basename(filename))[0]
+  if '_vs_' in name:
+    red, blue = name.split('_vs_', 1)
+    return red, blue.rsplit('_', 1)[0]
+  return None, None
+
+class PlaybackControls:
+  """
+  Keyboard controls of a replay in the graphics window:
+
+    + or Right   twice as fast      space    pause / continue
+    - or Left    twice as slow      n, Enter skip to the end of the game
+                                    q        stop the playlist
+  """
+  FASTER = ('plus', 'equal', 'Right', 'KP_Add')
+  SLOWER = ('minus', 'Left', 'KP_Subtract')
+  PAUSE = ('space', 'p')
+  SKIP = ('n', 'Return', 'KP_Enter')
+  QUIT = ('q', 'Escape')
+
+  def __init__(self, delay):
+    self.delay = delay
+    self.paused = False
+    self.skip = False
+    self.quit = False
+
+  def _handleKeys(self):
+    import graphicsUtils
+    graphicsUtils.keys_pressed()
+    for key in graphicsUtils.keys_waiting():
+      if key in self.FASTER:
+        self.delay /= 2.0
+      elif key in self.SLOWER:
+        self.delay = max(self.delay * 2.0, 0.001)
+      elif key in self.PAUSE:
+        self.paused = not self.paused
+      elif key in self.SKIP:
+        self.skip = True
+      elif key in self.QUIT:
+        self.quit = self.skip = True
+
+  def wait(self):
+    """
+    Waits between two moves, handling key presses.
+    """
+    import graphicsUtils
+    self._handleKeys()
+    if self.delay > 0 and not self.skip:
+      graphicsUtils.sleep(self.delay)
+      self._handleKeys()
+    while self.paused and not self.skip:
+      graphicsUtils.sleep(0.05)
+      self._handleKeys()
+
+def replayPlaylist( filenames, display, delay, redTeamName, blueTeamName, interactive=True ):
+  """
+  Replays several recorded games in the same display.  The next replay is
+  read in the background while the current one plays.  With interactive,
+  the graphics window takes the keys of PlaybackControls.
+  """
+  import concurrent.futures
+  import replay
+
+  def prepare(filename):
+    recorded = replay.loadReplay(filename)
+    recorded.getLayout()
+    return recorded
+
+  if not filenames:
+    print('No replays to play.')
+    return
+  controls = PlaybackControls(delay) if interactive else None
+  with concurrent.futures.ThreadPoolExecutor(max_workers=1) as reader:
+    upcoming = reader.submit(prepare, filenames[0])
+    for i, filename in enumerate(filenames):
+      try:
+        recorded = upcoming.result()
+      except Exception as e:
+        recorded = None
+        print('Skipping %s: %s' % (filename, e))
+      if i + 1 < len(filenames):
+        upcoming = reader.submit(prepare, filenames[i + 1])
+      if recorded is None:
+        continue
+      print('Replaying recorded game %s (%d of %d).' % (filename, i + 1, len(filenames)))
+      args = recorded.replayArgs()
+      red, blue = _namesFromFilename(filename)
+      args['redTeamName'] = args['redTeamName'] or red or redTeamName
+      args['blueTeamName'] = args['blueTeamName'] or blue or blueTeamName
+      if controls is not None:
+        controls.skip = controls.paused = False
+      replayGame(display=display, delay=delay, waitEnd=False, finish=False, controls=controls, **args)
+      if controls is not None and controls.quit:
+        break
+  display.finish()
+
+def replayGame( layout, agents, actions, display, length, redTeamName, blueTeamName, waitEnd=True, delay=1,
+                startState=None, finish=True, controls=None):
+    """
+    Shows a recorded game.  With startState, actions are the moves made after
+    that state rather than from the start of the game.  With controls (see
+    PlaybackControls) the pace is set by the controls instead of delay, and
+    the game can be skipped to its end.  With finish False, the display is
+    left open for the next game.
+    """
     rules = CaptureRules()
     game = rules.newGame( layout, agents, display, length, False, False )
+    if startState is not None:
+      game.state = startState
     state = game.state
-    display.redTeam = redTeamName
-    display.blueTeam = blueTeamName
+    display.redTeam = display.redName = redTeamName
+    display.blueTeam = display.blueName = blueTeamName
     display.initialize(state.data)
 
     for action in actions:
       # Execute the action
       state = state.generateSuccessor( *action )
+      if controls is not None and controls.skip:
+        continue
       # Change the display
       display.update( state.data )
       # Allow for game specific conditions (winning, losing, etc.)
       rules.process(state, game)
-      time.sleep(delay)
+      if controls is not None:
+        controls.wait()
+      else:
+        time.sleep(delay)
+
+    if controls is not None and controls.skip:
+      # Skipped to the end: show the final state at once
+      display.initialize(state.data)
+      if 'infoPane' in dir(display):
+        display.infoPane.updateScore(state.data.score, state.data.timeleft)
 
     game.gameOver = True
     if not game.rules.quiet:
@@ -1033,43 +1344,99 @@ def replayGame( layout, agents, actions, display, length, redTeamName, blueTeamN
       except:
         print("END")
 
-    display.finish()
-
+    if finish:
+      display.finish()
 
-def runGames( layouts, agents, display, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents=False, catchExceptions=False, delay_step=0):
 
+def runGames( layouts, agents, display, length, numGames, record, numTraining, redTeamName, blueTeamName, muteAgents=False, catchExceptions=False, delay_step=0, sandboxAgents=False, chargeCpuTime=False, allowPondering=False, recordTimings=False,
+              profile=False, seed=None, recordEvents=False, turnMarker=None):
+  """
+  Plays numGames games and returns the games that were not training games.
+
+  seed makes the games reproducible: it is either a list with the seed of
+  every game, or a single seed from which game i gets seed '<seed>-<i>'.  A
+  game draws its starting team and sonar noise from random.Random(its
+  seed), and the global random, which agents use, is reseeded from that for
+  every game, so a game can be played again on its own from its seed.
+  Sandboxed agents seed their own processes from the seed of the game.
+  """
   rules = CaptureRules()
   games = []
 
+  if allowPondering and not (sandboxAgents or chargeCpuTime):
+    # A pondering thread competes for the GIL with the agent whose turn it
+    # is, which would be charged for that in wall-clock time.
+    print('Pondering needs --cpu-time or --sandbox; not pondering', file=sys.stderr)
+    allowPondering = False
+
+  if sandboxAgents:
+    import agentSandbox
+    agents = agentSandbox.sandboxAgents(agents, keep=[keyboardAgents.KeyboardAgent], ponder=allowPondering)
+
+  if profile:
+    import profiling
+    profiler = profiling.GameProfiler(len(agents))
+    agents = profiler.wrapAgents(agents)
+
   if numTraining > 0:
     print ('Playing %d training games' % numTraining)
 
-  for i in range( numGames ):
-    beQuiet = i < numTraining
-    layout = layouts[i]
-    if beQuiet:
-        # Suppress output and graphics
-        import textDisplay
-        gameDisplay = textDisplay.NullGraphics()
-        rules.quiet = True
-    else:
-        gameDisplay = display
-        rules.quiet = False
-    g = rules.newGame( layout, agents, gameDisplay, length, muteAgents, catchExceptions )
-    g.run(delay=delay_step)
-    if not beQuiet: games.append(g)
-
-    g.record = None
-    if record:
-      import time, pickle, game
-      #fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
-      #f = file(fname, 'w')
-      components = {'layout': layout, 'agents': [game.Agent() for a in agents], 'actions': g.moveHistory, 'length': length, 'redTeamName': redTeamName, 'blueTeamName':blueTeamName }
-      #f.close()
-      print("recorded")
-      g.record = pickle.dumps(components)
-      with open('replay-%d'%i,'wb') as f:
-        f.write(g.record)
+  try:
+    for i in range( numGames ):
+      beQuiet = i < numTraining
+      layout = layouts[i]
+      if beQuiet:
+          # Suppress output and graphics
+          import textDisplay
+          gameDisplay = textDisplay.NullGraphics()
+          rules.quiet = True
+      else:
+          gameDisplay = display
+          rules.quiet = False
+      gameSeed = None
+      rng = None
+      if seed is not None:
+        gameSeed = seed[i] if isinstance(seed, (list, tuple)) else '%s-%d' % (seed, i)
+        rng = random.Random(gameSeed)
+        random.seed(rng.getrandbits(64))
+      if sandboxAgents:
+        agentSandbox.seedAgents(agents, gameSeed)
+      g = rules.newGame( layout, agents, gameDisplay, length, muteAgents, catchExceptions, chargeCpuTime, allowPondering,
+                        recordTimings, rng )
+      if record:
+        import replay
+        g.recorder = replay.ReplayWriter('replay-%d' % i, layout, redTeamName, blueTeamName, length,
+                                         g.startingIndex, len(agents), gameSeed)
+      if recordEvents:
+        g.events.addSink(events.JsonlSink('events-%d.jsonl' % i))
+      g.turnMarker = turnMarker
+      try:
+        if profile:
+          profiler.startEngine()
+          try:
+            g.run(delay=delay_step)
+          finally:
+            profiler.stopEngine()
+        else:
+          g.run(delay=delay_step)
+      finally:
+        g.events.close()
+      if not beQuiet: games.append(g)
+
+      if recordTimings:
+        g.timings.writeJson('timings-%d.json' % i)
+        g.timings.writeCsv('timings-%d.csv' % i)
+        if not beQuiet: print(g.timings)
+
+      if record:
+        g.recorder.close(g.state.data.score, g.agentCrashed, g.agentTimeout)
+        print("recorded")
+  finally:
+    if sandboxAgents:
+      agentSandbox.closeAgents(agents)
+
+  if profile:
+    print('Profiles written to', ', '.join(profiler.write('profile')))
 
   if numGames > 1:
     scores = [game.state.data.score for game in games]
@@ -1103,5 +1470,3 @@ if __name__ == '__main__':
 
   save_score(games[0])
   print('\nTotal Time Game: %s'% round(time.time() - start_time, 0))
-  # import profile
-  # profile.run('runGames( **options )', 'profile')
@@ -17,6 +17,7 @@
 """
 
 from game import Agent
+import game
 import distanceCalculator
 from util import nearestPoint
 import util
@@ -168,6 +169,18 @@ class CaptureAgent(Agent):
     """
     util.raiseNotDefined()
 
+  def shouldStopPondering(self):
+    """
+    If you define ponder(self, gameState), games started with --ponder call it in
+    the background after each of your moves, while the other agents move, with
+    the gameState your move was chosen on.  Check
+    this method regularly from ponder and return as soon as it is True: your turn
+    has arrived and chooseAction is about to be called.  Store whatever ponder
+    computes on self so chooseAction can use it.  An agent that is still
+    pondering a move timeout after its turn arrived loses the game.
+    """
+    return game.shouldStopPondering()
+
   #######################
   # Convenience Methods #
   #######################
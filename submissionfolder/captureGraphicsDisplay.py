@@ -250,8 +250,9 @@ class PacmanGraphics:
   def drawStaticObjects(self, state):
     layout = self.layout
     self.drawWalls(layout.walls)
-    self.food = self.drawFood(layout.food)
-    self.capsules = self.drawCapsules(layout.capsules)
+    # Food and capsules of the state, which may be from halfway a game
+    self.food = self.drawFood(state.food)
+    self.capsules = self.drawCapsules(state.capsules)
     refresh()
 
   def drawAgentObjects(self, state):
@@ -1,14 +1,29 @@
 import capture
+import distanceCalculator
+import journal
+import latency
 import layout
+import matchLog
+import ratings
+import remoteWorkers
+import replay
+import resultsCache
+import sequentialTest
+import supervisor
 import textDisplay
+import util
 
 import argparse
 import collections
+import concurrent.futures
 import datetime
 import email.utils
+import hashlib
+import importlib
 import inspect
 import itertools
 import logging
+import logging.handlers
 import math
 import mimetypes
 import multiprocessing
@@ -20,9 +35,10 @@ import smtplib
 import sys
 import tempfile
 import time
+import traceback
 import urllib.request as request
 import zipfile
-from contextlib import contextmanager
+from contextlib import closing, contextmanager
 from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -31,10 +47,8 @@ DEFAULT_SECRETS = os.path.join(os.path.dirname(__file__), 'hva.secrets')
 
 LOG_FILENAME = "log.txt"
 
-logging.basicConfig(filename=LOG_FILENAME,
-        filemode="w+",
-        format="%(asctime)s %(module)s %(levelname)s %(message)s",
-        level=logging.DEBUG)
+# Log of a --worker, so that workers next to the server keep their own logs.
+WORKER_LOG_FILENAME = "log-worker-{}.txt"
 
 SECRETS_KEYS = [
         ('course_name', "Course name"),
@@ -50,25 +64,18 @@ SECRETS_KEYS = [
 
 TIMESTAMP_FMT = "%Y-%m-%d.%H-%M-%S"
 
-# GMail has a attachment size limit of 24 MB, in bytes.
-ATTACHMENT_SIZE_LIMIT = 24e6
+# Finished tasks of a tournament, in its output directory; see journal.Journal.
+JOURNAL_NAME = "journal.jsonl"
 
+# Results of earlier tournaments, see resultsCache.ResultsCache.
+CACHE_FILENAME = os.path.join("results", "cache.sqlite")
 
-class LogAsStream:
-    """
-    Change a log into a streamable object.
-
-    This is a utility for @contextmanager.
-    """
-    def __init__(self, log_name, log_level, prefix=''):
-        self._logger = logging.getLogger(log_name)
-        self._level = log_level
-        self._prefix = prefix or ''
+# Seconds a game may take beyond the time limits of its agents, for the
+# engine itself; see game_time_limit.
+GAME_TIME_MARGIN = 60
 
-    def write(self, buf):
-        lines = buf.rstrip().splitlines()
-        for line in lines:
-            self._logger.log(self._level, self._prefix + line.rstrip())
+# GMail has a attachment size limit of 24 MB, in bytes.
+ATTACHMENT_SIZE_LIMIT = 24e6
 
 
 @contextmanager
@@ -95,18 +102,6 @@ def replace_stderr(stream):
         sys.stderr = old_stderr
 
 
-def log_stdout(prefix=''):
-    """
-    Temporarily let the output of print() be logged.
-    """
-    return replace_stdout(LogAsStream('STDOUT', logging.DEBUG, prefix=prefix))
-
-def log_stderr(prefix=''):
-    """
-    """
-    return replace_stderr(LogAsStream('STDERR', logging.WARN, prefix=prefix))
-
-
 def silence_stdout():
     """
     Temporarily set the output of print() to nothing.
@@ -114,19 +109,24 @@ def silence_stdout():
     return replace_stdout(open(os.devnull, 'w'))
 
 
-def mute_agents(agents):
+def mute_agents(agents, streams):
     """
-    When agents want to print(), do nothing instead.
+    When agents print() in registerInitialState or chooseAction, write to
+    their stream in streams instead of stdout and stderr.
     """
-    def silencer(fn):
-        def silenced(*args, **kwargs):
-            with silence_stdout():
+    def redirect(fn, stream):
+        def redirected(*args, **kwargs):
+            old_stdout, old_stderr = sys.stdout, sys.stderr
+            sys.stdout = sys.stderr = stream
+            try:
                 return fn(*args, **kwargs)
-        return silenced
+            finally:
+                sys.stdout, sys.stderr = old_stdout, old_stderr
+        return redirected
     muted_agents = []
-    for agent in agents:
-        agent.registerInitialState = silencer(agent.registerInitialState)
-        agent.chooseAction = silencer(agent.chooseAction)
+    for agent, stream in zip(agents, streams):
+        agent.registerInitialState = redirect(agent.registerInitialState, stream)
+        agent.chooseAction = redirect(agent.chooseAction, stream)
         muted_agents.append(agent)
     return muted_agents
 
@@ -343,7 +343,12 @@ def parse_arguments():
             help="Number of games to play.")
     parser.add_argument("-f", "--fixRandomSeed", dest="fixRandomSeed",
             action="store_true",
-            help="Fixes the random seed to always play the same game.")
+            help="Fixes the random seed to always play the same game; the same as --seed cs188.")
+    parser.add_argument("--seed", dest="seed",
+            default=None,
+            help="""Seed of the tournament, from which every game gets its
+            own seed (default: a random seed, which is shown in the
+            report).""")
     parser.add_argument("--record", dest="record",
             action="store_true", default=True,
             help="Writes game histories to a file (named RedTeam-BlueTeam).")
@@ -353,6 +358,88 @@ def parse_arguments():
     parser.add_argument("-c", "--catch-exceptions", dest="catchExceptions",
             action="store_true", default=True,
             help="Catch exceptions and enforce time limits.")
+    parser.add_argument("--cpu-time", dest="cpu_time",
+            action="store_true", default=False,
+            help="""Charge agents for their own CPU time instead of wall-clock
+            time.  A move is still cut off after {:g} times its limit in
+            wall-clock time, so an agent that blocks cannot stall the
+            game.""".format(util.CPU_TIME_WALL_FACTOR))
+    parser.add_argument("--timings", dest="record_timings",
+            action="store_true", default=False,
+            help="""Record per-move latency histograms of every agent and
+            summarize them per team in timings.json/.csv and the report.""")
+    parser.add_argument("--events", dest="record_events",
+            action="store_true", default=False,
+            help="""Write the engine events of every game as JSON lines to
+            RedTeam-BlueTeam-events-N.jsonl.""")
+    parser.add_argument("--ponder", dest="ponder",
+            action="store_true", default=False,
+            help="""Let agents with a ponder method compute while others move.
+            Needs --cpu-time or --sandbox.""")
+    parser.add_argument("--sandbox", dest="sandbox",
+            action="store_true", default=False,
+            help="Run each agent in its own long-lived subprocess.")
+    parser.add_argument("--game-timeout", dest="game_timeout",
+            type=check_positive_or_zero, default=None, metavar="SECONDS",
+            help="""Kill a game that runs longer than this, and count it as
+            an error of the team whose agent was moving (default: the
+            longest a game can last under the time limits of its agents;
+            0: play games without a supervising process).""")
+    parser.add_argument("--memory-limit", dest="memory_limit",
+            type=check_positive_or_zero, default=4096, metavar="MB",
+            help="""Address space limit of the process playing a game, in
+            megabytes (0: no limit).""")
+    parser.add_argument("--log-limit", dest="log_limit",
+            type=check_positive, default=64, metavar="KB",
+            help="""Output of the engine and of every agent kept per match,
+            in kilobytes, in RedTeam-BlueTeam-N-output.txt.gz.""")
+    parser.add_argument("--swiss", dest="swiss",
+            action="store_true", default=False,
+            help="""Play Swiss-system rounds, pairing teams of similar
+            rating, instead of a full round robin.""")
+    parser.add_argument("--rounds", dest="rounds",
+            type=check_positive, default=None,
+            help="""Maximum number of Swiss rounds (default: twice the
+            base-2 logarithm of the number of teams).""")
+    parser.add_argument("--max-deviation", dest="max_deviation",
+            type=float, default=100.0,
+            help="""Stop the Swiss rounds early once the rating deviation
+            of every team is at most this.""")
+    parser.add_argument("--sprt", dest="sprt",
+            action="store_true", default=False,
+            help="""End a match early once a sequential probability ratio
+            test has settled its winner; --numGames is then the maximum
+            number of games per match.""")
+    parser.add_argument("--sprt-p", dest="sprt_p",
+            type=float, default=0.75,
+            help="""Win probability of the better team that the sequential
+            test should detect.""")
+    parser.add_argument("--sprt-alpha", dest="sprt_alpha",
+            type=float, default=0.01,
+            help="Probability that the sequential test picks the wrong winner.")
+    parser.add_argument("--incremental", dest="incremental",
+            action="store_true", default=False,
+            help="""Reuse the results of earlier runs with the same --seed
+            for pairings of unchanged teams, and only play the others.
+            Results, replays and agent output are kept in {}.""".format(CACHE_FILENAME))
+    parser.add_argument("--resume", dest="resume", nargs="?", const="",
+            default=None, metavar="RESULTS_DIR",
+            help="""Resume an interrupted competition from the journal in
+            RESULTS_DIR (default: the latest directory in results/). Only
+            the games missing from the journal are played.""")
+    parser.add_argument("--serve", dest="serve",
+            default=None, metavar="[HOST:]PORT",
+            help="""Do not play games here but hand them out to workers
+            started with --worker on this or other machines.""")
+    parser.add_argument("--worker", dest="worker",
+            default=None, metavar="HOST:PORT",
+            help="""Play games for the competition served at HOST:PORT,
+            --threads at a time, instead of running a competition. Needs the
+            same code and students/ directory as the server.""")
+    parser.add_argument("--authkey", dest="authkey",
+            default=None,
+            help="""Shared key of --serve and --worker (default: the
+            COMPETITION_AUTHKEY environment variable).""")
     parser.add_argument("-s", "--secrets", dest="secrets",
             type=check_is_file, default=DEFAULT_SECRETS,
             help="File containing the 'secret' infomation.")
@@ -362,6 +449,12 @@ def parse_arguments():
                         help="Only test mail server settings.")
 
     args = parser.parse_args()
+    if args.fixRandomSeed and args.seed is None:
+        args.seed = "cs188"
+    if args.ponder and not (args.cpu_time or args.sandbox):
+        parser.error("--ponder needs --cpu-time or --sandbox")
+    if args.incremental and args.seed is None:
+        parser.error("--incremental needs --seed: games are only the same with the same seed")
 
     if args.display_type == "quiet":
         args.display_fn = textDisplay.NullGraphics
@@ -381,7 +474,7 @@ def parse_arguments():
         args.layout_type = ("random", seed)
     else:
         if args.layout == "RANDOM":
-            args.layout = getRandomLayout()
+            args.layout = getRandomLayout(random.Random(args.seed) if args.seed else random)
         l = layout.getLayout(args.layout)
         if l is None:
             raise Exception("The layout '{}' cannot be found in "
@@ -395,11 +488,11 @@ def parse_arguments():
     return args
 
 
-def getRandomLayout():
+def getRandomLayout(rng=random):
     layouts_dir = os.path.join(os.path.dirname(__file__), 'layouts')
-    layouts = list(filter(lambda f: not f.startswith('.'),
-                          os.listdir(layouts_dir)))
-    random_layout = random.choice(layouts)
+    layouts = sorted(filter(lambda f: not f.startswith('.'),
+                            os.listdir(layouts_dir)))
+    random_layout = rng.choice(layouts)
     # Strip extension, if present
     name_elements = random_layout.split(os.extsep)
     if name_elements[-1] == 'lay':
@@ -408,17 +501,21 @@ def getRandomLayout():
 
 
 
-def update_arguments(args, red_name, red_agents, blue_name, blue_agents):
+def update_arguments(args, red_name, red_agents, blue_name, blue_agents, num_games=None):
     """
     Give a matchup-specific update on the command line arguments.
 
-    Again, these will be in a form that the original game can process.
+    Again, these will be in a form that the original game can process.  By
+    default all args.numGames games of the match are played; num_games
+    overrides that.
     """
     # This will be a list of agents [r1, b1, r2, b2, ...].
     agents = sum([list(el) for el in zip(red_agents, blue_agents)], [])
+    if num_games is None:
+        num_games = args.numGames
 
     layouts = []
-    for _ in range(args.numGames):
+    for _ in range(num_games):
         if args.layout_type[0] == "random":
             seed = args.layout_type[1]
             l = layout.Layout(capture.randomLayout(seed).split('\n'))
@@ -432,7 +529,7 @@ def update_arguments(args, red_name, red_agents, blue_name, blue_agents):
             "agents": agents,
             "display": args.display_fn(),
             "length": args.length,
-            "numGames": args.numGames,
+            "numGames": num_games,
             "record": args.record,
             "numTraining": args.numTraining,
             "redTeamName": red_name,
@@ -440,6 +537,11 @@ def update_arguments(args, red_name, red_agents, blue_name, blue_agents):
             "muteAgents": vargs.get("muteAgent", False),
             "catchExceptions": vargs.get("catchExceptions", False),
             "delay_step": vargs.get("delay_step", 0),
+            "sandboxAgents": vargs.get("sandbox", False),
+            "chargeCpuTime": vargs.get("cpu_time", False),
+            "allowPondering": vargs.get("ponder", False),
+            "recordTimings": vargs.get("record_timings", False),
+            "recordEvents": vargs.get("record_events", False),
             }
 
 
@@ -484,6 +586,19 @@ class Result:
 
         return r1, r2
 
+    @classmethod
+    def game_score(cls, points, leftResult=None, rightResult=None):
+        """
+        Returns 1, 0.5 or 0 as the left team won, tied or lost a game, from
+        the arguments of Scoreboard.add_result.  A game both teams lost by
+        an error counts as a tie.
+        """
+        if leftResult is None:
+            leftResult, rightResult = cls.from_points(points)
+        leftWon = leftResult == cls.WIN
+        rightWon = rightResult == cls.WIN
+        return 0.5 if leftWon == rightWon else float(leftWon)
+
 
 class StudentError:
     """
@@ -527,6 +642,10 @@ class Record:
     def error(self):
         return self._counter[Result.ERROR]
 
+    @property
+    def games(self):
+        return sum(self._counter.values())
+
     def score(self):
         """
         Computes the score of this team.
@@ -618,11 +737,19 @@ class Record:
 
 
 class Scoreboard:
-    def __init__(self):
+    def __init__(self, rank_by_rating=False, games_per_match=None):
         self.disqualified_teams = {}
         self._participating_teams = {}
         self.records = collections.defaultdict(
                 lambda: collections.defaultdict(Record))
+        self.ratings = ratings.Ratings()
+        self.rank_by_rating = rank_by_rating
+        self.games_per_match = games_per_match
+        self.skipped_games = collections.Counter()
+        self.cached_games = 0
+        # Decides the home sides of pairings; a random.Random seeded from
+        # the tournament seed makes them reproducible.
+        self.rng = random
         self._lock = multiprocessing.Lock()
 
     def disqualify(self, teams):
@@ -644,23 +771,65 @@ class Scoreboard:
         """
         with self._lock:
             self._participating_teams.update(teams)
+            for team in teams:
+                self.ratings.add(team)
 
     def add_result(self, leftTeam, rightTeam, points,
             leftResult=None, rightResult=None):
         """
-        Adds scores to the score board.
+        Adds scores to the score board, and adds the game to the current
+        rating period, see end_rating_period.
         """
+        score = Result.game_score(points, leftResult, rightResult)
+        if leftResult is None:
+            leftResult, rightResult = Result.from_points(points)
         with self._lock:
             self.records[leftTeam][rightTeam].update(points, leftResult)
             self.records[rightTeam][leftTeam].update(-points, rightResult)
+            self.ratings.add_game(leftTeam, rightTeam, score)
+
+    def end_rating_period(self):
+        """
+        Updates the ratings with the games added since the last rating
+        period.  Within a period the order of the games does not matter, so
+        the ratings do not depend on which worker finishes first.
+        """
+        with self._lock:
+            self.ratings.end_period()
+
+    def skip_games(self, leftTeam, rightTeam, games):
+        """
+        Registers games of a match that are not played because the match
+        was ended early.
+        """
+        with self._lock:
+            self.skipped_games[frozenset((leftTeam, rightTeam))] += games
+
+    def _scaled_score(self, team):
+        # Competition score and points as if every match had been played
+        # to games_per_match games at the rates observed.
+        score = points = 0.0
+        for record in self.records[team].values():
+            if record.games:
+                scale = self.games_per_match / record.games
+                score += record.score() * scale
+                points += record.points * scale
+        return score, points
 
     def ranking(self):
         """
-        Returns a list of team names, sorted by highest-ranking teams first.
+        Returns a list of (team name, Record), sorted by highest-ranking teams
+        first.  With rank_by_rating teams are ranked by rating instead of
+        by competition score.  With games_per_match, matches that ended
+        early count as if they were played to the end at the same rates.
         """
         totals = []
         for team in self.records.keys():
             totals.append((team, sum(self.records[team].values(), Record())))
+        if self.rank_by_rating:
+            return sorted(totals, key=lambda x: self.ratings.rating(x[0])[0], reverse=True)
+        if self.games_per_match:
+            return sorted(totals, key=lambda x: self._scaled_score(x[0]), reverse=True)
         return sorted(totals, key=lambda x: x[1], reverse=True)
 
     def make_pairings(self):
@@ -670,17 +839,40 @@ class Scoreboard:
         Each team plays against each other team a single time.  The team's home
         side is randomized.
 
-        The returned value is a multiprocessing.Queue.
+        The returned value is a list of [(red_name, red_factory),
+        (blue_name, blue_factory)] pairs.
         """
         def _shuffled(x):
             y = list(x)
-            random.shuffle(y)
+            self.rng.shuffle(y)
             return y
         combinations = itertools.combinations(self._participating_teams.items(), 2)
-        queue = multiprocessing.Queue()
-        for match in combinations:
-            queue.put(_shuffled(match))
-        return queue
+        return [_shuffled(match) for match in combinations]
+
+    def make_swiss_pairings(self, played=()):
+        """
+        Generate the pairings of one Swiss-system round.
+
+        Teams are sorted by rating and every team plays the next highest
+        rated team it has not played yet (played is a collection of
+        frozensets of two team names), or the next team if it has played all
+        of them.  With an odd number of teams the lowest rated one sits the
+        round out.  Returns a list like make_pairings.
+        """
+        teams = sorted(self._participating_teams.items(),
+                key=lambda team: self.ratings.rating(team[0])[0], reverse=True)
+        pairings = []
+        while len(teams) > 1:
+            team = teams.pop(0)
+            for i, rival in enumerate(teams):
+                if frozenset((team[0], rival[0])) not in played:
+                    break
+            else:
+                i = 0
+            match = [team, teams.pop(i)]
+            self.rng.shuffle(match)
+            pairings.append(match)
+        return pairings
 
     @property
     def participants(self):
@@ -695,7 +887,36 @@ class Scoreboard:
             self._participating_teams.keys())))
 
 
-def generate_html_report(scoreboard, report_file, courseName, timestamp_start, timestamp_finish, layout, **args):
+def match_timings(games, red_name, blue_name):
+    """
+    Merges the latency histograms of the games of one match per team.
+    """
+    names = {'0': red_name, '2': red_name, '1': blue_name, '3': blue_name}
+    timings = latency.GameTimings()
+    for game in games:
+        if game.timings is not None:
+            timings.merge(game.timings.relabel(names))
+    return timings
+
+
+def aggregate_timings(output_dir):
+    """
+    Merges all timing files of the games in output_dir into timings.json and
+    timings.csv.  Returns the merged timings, or None if there are none.
+    """
+    suffix = "-timings.json"
+    timings = None
+    for filename in sorted(os.listdir(output_dir)):
+        if filename.endswith(suffix):
+            match = latency.GameTimings.readJson(os.path.join(output_dir, filename))
+            timings = match if timings is None else timings.merge(match)
+    if timings is not None:
+        timings.writeJson(os.path.join(output_dir, "timings.json"))
+        timings.writeCsv(os.path.join(output_dir, "timings.csv"))
+    return timings
+
+
+def generate_html_report(scoreboard, report_file, courseName, timestamp_start, timestamp_finish, layout, timings=None, **args):
     """
     Make an HTML document that will represent the score in scoreboard.
     """
@@ -704,6 +925,7 @@ def generate_html_report(scoreboard, report_file, courseName, timestamp_start, t
     fmt['timestamp_start'] = timestamp_start
     fmt['timestamp_finish'] = timestamp_finish
     fmt['layout'] = layout
+    fmt['seed'] = args.get('seed')
     fmt['argv'] = sys.argv
 
     fmt['title'] = "{} Capture the Flag results of {:%d-%m-%Y}".format(courseName, timestamp_start)
@@ -727,17 +949,47 @@ def generate_html_report(scoreboard, report_file, courseName, timestamp_start, t
         fmt['ranking'] = ""
         for i, (n, r) in enumerate(scoreboard.ranking()):
             s = r.score()
+            rating, deviation = scoreboard.ratings.rating(n)
             fmt['ranking'] += """    <tr>
           <td>{i}</td>
           <td>{n}</td>
+          <td>{r.games}</td>
           <td class="points">{r.points}</td>
           <td class="win">{r.win}</td>
           <td class="tie">{r.tie}</td>
           <td class="lost">{r.lost}</td>
           <td class="error">{r.error}</td>
           <td class="score">{s}</td>
+          <td class="rating">{rating:.0f} &plusmn; {interval:.0f}</td>
         </tr>
-    """.format(i=i+1, n=n, r=r, s=s)
+    """.format(i=i+1, n=n, r=r, s=s, rating=rating, interval=2 * deviation)
+        if scoreboard.rank_by_rating:
+            fmt['ranking_rule'] = """The team ranking is based on ratings.
+Teams played Swiss-system rounds against teams of similar rating, so they did
+not all play the same opponents, and their competition scores cannot be
+compared directly.  Each rating is shown with its 95% confidence interval;
+teams whose intervals overlap may well be equally strong."""
+        else:
+            fmt['ranking_rule'] = """The team ranking is based on a total competition score.  Each result type is
+worth a number of points, as can be seen in the table below.  In case of equal
+competition scores, teams with more points collected will be ranked higher.
+Ratings are shown with their 95% confidence interval."""
+        if scoreboard.games_per_match:
+            played = sum(r.games for n, r in scoreboard.ranking()) // 2
+            skipped = sum(scoreboard.skipped_games.values())
+            fmt['ranking_rule'] += """
+<p>Matches ended early once a sequential test had settled their winner: {played}
+of {total} games were played, and {matches} matches stopped before their last
+game.  Competition scores count every match as if it had been played to {n}
+games at the rates observed.</p>""".format(played=played, total=played + skipped,
+                    matches=len(scoreboard.skipped_games), n=scoreboard.games_per_match)
+        if scoreboard.cached_games:
+            played = sum(r.games for n, r in scoreboard.ranking()) // 2
+            fmt['ranking_rule'] += """
+<p>{cached} of these {played} games were not played again: their results,
+replays and output come from earlier runs with the same code of both teams and
+the same seed.</p>""".format(
+                    cached=scoreboard.cached_games, played=played)
 
         participants = scoreboard.participants
         header = ''
@@ -750,9 +1002,7 @@ def generate_html_report(scoreboard, report_file, courseName, timestamp_start, t
     """
         fmt['game_outcomes'] = """
 <h2>Team ranking</h2>
-The team ranking is based on a total competition score.  Each result type is
-worth a number of points, as can be seen in the table below.  In case of equal
-competition scores, teams with more points collected will be ranked higher.
+{ranking_rule}
 <table>
   <thead>
     <tr>
@@ -786,12 +1036,14 @@ competition scores, teams with more points collected will be ranked higher.
     <tr>
       <th>Position</th>
       <th>Team name</th>
+      <th>Games</th>
       <th>Points</th>
       <th>Win</th>
       <th>Tie</th>
       <th>Lost</th>
       <th>Failed</th>
       <th>Competition score</th>
+      <th>Rating</th>
     </tr>
   </thead>
   <tbody>
@@ -837,9 +1089,43 @@ competition scores, teams with more points collected will be ranked higher.
 {results}
 </table>""".format(**fmt)
 
+    if timings is not None:
+        rows = ''
+        for team, phase, s in timings.rows():
+            if phase != 'action':
+                continue
+            rows += """    <tr>
+          <th scope="row">{team}</th>
+          <td>{s[count]}</td>
+          <td>{p50:.1f}</td>
+          <td>{p95:.1f}</td>
+          <td>{p99:.1f}</td>
+          <td>{max:.1f}</td>
+        </tr>
+    """.format(team=team, s=s, p50=s['p50'] * 1e3, p95=s['p95'] * 1e3,
+                    p99=s['p99'] * 1e3, max=s['max'] * 1e3)
+        fmt['game_outcomes'] += """
+
+<h2>Move latency</h2>
+<table>
+  <caption>Time per move (getAction) in milliseconds, over all agents of a team.</caption>
+  <thead>
+    <tr>
+      <th>Team name</th>
+      <th>Moves</th>
+      <th>p50</th>
+      <th>p95</th>
+      <th>p99</th>
+      <th>Max</th>
+    </tr>
+  </thead>
+  <tbody>
+{rows}
+  </tbody>
+</table>""".format(rows=rows)
+
+    matchLog.flush_log()
     log_contents = "".join(open(LOG_FILENAME, 'r').readlines())
-    # TODO: Track down where all NUL characters come from in the log
-    log_contents = log_contents.replace("\0", "")
     fmt['log'] = """<h2>Log file</h2>
     <pre>{}</pre>""".format(log_contents)
 
@@ -897,7 +1183,8 @@ competition, part of the course {courseName}. The simulation
 started at {timestamp_start:%d-%m-%Y, %H:%M:%S}, and ended at
 {timestamp_finish:%d-%m-%Y, %H:%M:%S}.
 Running all simulations took {duration} time.  It was played on
-the <strong>{layout}</strong> map.</p>
+the <strong>{layout}</strong> map, with tournament seed <code>{seed}</code>;
+the seed of every game is stored in its replay.</p>
 
 {disqualified_teams}
 
@@ -1075,14 +1362,28 @@ def select_file(directory, extension):
 def zip_results(output_dir, remove_src=False):
     """
     Create a zip archive of the results.html and replay files.
+
+    Replays are stored without their layout.  Every layout is stored once,
+    as layouts/<fingerprint>.lay, which is where replay.loadReplay looks for
+    it after unpacking.
     """
     zip_name = output_dir + ".zip"
     archive_dir = output_dir.split(os.sep)[-1]
-    zf = zipfile.ZipFile(zip_name, mode='w')
+    layouts = {}
+    zf = zipfile.ZipFile(zip_name, mode='w', compression=zipfile.ZIP_DEFLATED)
     for f in os.listdir(output_dir):
         full_name = os.path.join(output_dir, f)
         archive_name = os.path.join(archive_dir, f)
-        zf.write(full_name, archive_name)
+        if replay.isBinaryReplay(full_name):
+            with open(full_name, 'rb') as replay_file:
+                fingerprint, layout_text, data = replay.detachLayout(replay_file.read())
+            if layout_text is not None:
+                layouts[fingerprint] = layout_text
+            zf.writestr(archive_name, data)
+        else:
+            zf.write(full_name, archive_name)
+    for fingerprint, layout_text in sorted(layouts.items()):
+        zf.writestr(os.path.join(archive_dir, replay.LAYOUT_DIR, fingerprint + '.lay'), layout_text)
     zf.close()
 
     if remove_src:
@@ -1188,89 +1489,418 @@ AI Capture the Flag Competition Bot"""))
     smtp.quit()
 
 
-def run_match(runner_id, args, output_dir, match_queue, results, is_done):
+# The arguments of the tournament in a worker process, set by init_worker.
+_worker_args = None
+
+
+def tournament_layouts(args):
+    """
+    Returns the layouts the games of the tournament are played on: the map
+    of --layout, or the maze of RANDOM<seed>.
     """
-    Worker for multithreading, runs a single match at a time.
+    kind, value = args.layout_type
+    if kind == "random":
+        with silence_stdout():
+            return [layout.Layout(capture.randomLayout(value).split('\n'))]
+    return [value]
 
-    This function will prepare everything to make a call to capture.runGames
-    for the matches in match_queue, a multiprocessing.Queue.  Results of
-    capture.runGames are put into results, another multiprocessing.Queue.
+
+def preload_layouts(layouts):
+    """
+    Computes the maze distances of layouts into the cache of
+    distanceCalculator, where the Distancer of every agent finds them.
     """
-    while not match_queue.empty():
+    for l in layouts:
+        if l.walls not in distanceCalculator.distanceMap:
+            distanceCalculator.distanceMap[l.walls] = distanceCalculator.computeDistances(l)
+
+
+def init_worker(args, module_names, log_queue=None):
+    """
+    Initializer of the worker processes.  Imports the student modules and
+    preloads the tournament layouts once, so that a game only has to create
+    its agents.  Under the fork start method the worker inherits both from
+    the parent and this costs nothing.  With log_queue, the worker logs to
+    the queue of matchLog.start_logging.
+    """
+    global _worker_args
+    _worker_args = args
+    if log_queue is not None:
+        logging.getLogger().handlers = [logging.handlers.QueueHandler(log_queue)]
+    for name in module_names:
         try:
-            matchno = match_queue.qsize()
-            (red_name, red_factory), (blue_name, blue_factory) = match_queue.get(timeout=1)
-            logging.info("Playing match {}: {} vs {}".format(matchno, red_name, blue_name))
-            red_result = Result.WIN
-            blue_result = Result.WIN
-
-            if args.fixRandomSeed:
-                random.seed('cs188')
-
-            # Create agents, check on errors in this part.
-            red_agents = None
-            blue_agents = None
-            try:
-                with silence_stdout():
-                    red_agents = mute_agents(red_factory(0, 2, True,
-                        **args.agentArgs))
-            except:
-                red_result = Result.ERROR
+            importlib.import_module(name)
+        except Exception as e:
+            logging.error("Worker could not import {}: {!r}".format(name, e))
+    preload_layouts(tournament_layouts(args))
+
+
+def play_task(output_dir, task):
+    """
+    Runs play_games in a worker started with init_worker, supervised by
+    play_supervised unless --game-timeout is 0.
+    """
+    if _worker_args.game_timeout == 0 or not hasattr(os, "fork"):
+        return play_games(_worker_args, output_dir, task)
+    return play_supervised(_worker_args, output_dir, task)
+
+
+def game_time_limit(args, num_games):
+    """
+    Returns the wall-clock seconds a task of num_games games may take: the
+    longest a game can last when all its agents use their startup time,
+    their time warnings and one second for every other move, plus
+    GAME_TIME_MARGIN.
+    """
+    if args.game_timeout:
+        return num_games * args.game_timeout
+    rules = capture.CaptureRules()
+    agents = range(4)
+    game_time = args.length * max(rules.getMoveWarningTime(i) for i in agents)
+    game_time += sum(rules.getMaxStartupTime(i)
+            + rules.getMaxTimeWarnings(i) * rules.getMoveTimeout(i) for i in agents)
+    return num_games * (game_time + GAME_TIME_MARGIN)
+
+
+def play_supervised(args, output_dir, task):
+    """
+    Plays a task with play_games under supervisor.run, which kills it when
+    it exceeds game_time_limit and limits its address space to
+    --memory-limit.  Agents that block signals or hang in C code can thus
+    not hang the tournament.
+
+    A killed or dead task counts as an error of the team whose agent the
+    game was calling, see Game.turnMarker, or of both teams if it died
+    outside agent code.  An exception that escapes play_games, such as a
+    MemoryError in the engine, counts as an error of both teams, so that
+    its games still end up on the scoreboard and in the journal.
+    """
+    matchno, (red_name, _), (blue_name, _), game_numbers = task
+    limit = game_time_limit(args, len(game_numbers))
+    try:
+        return supervisor.run(lambda turn: play_games(args, output_dir, task, turn_marker=turn),
+                limit, args.memory_limit)
+    except supervisor.Killed as e:
+        reason, turn = e.reason, e.turn
+    except RuntimeError as e:
+        reason, turn = "failed: {}".format(e), None
+
+    points = 0
+    culprit = "{} and {}".format(red_name, blue_name)
+    if turn is not None:
+        points = -1 if turn % 2 == 0 else 1
+        culprit = "agent {} of {}".format(turn, red_name if turn % 2 == 0 else blue_name)
+    logging.error("Match {} ({} vs {}, games {}) {}; charged to {}".format(
+        matchno, red_name, blue_name, list(game_numbers), reason, culprit))
+    red_result, blue_result = Result.from_points(points, error=True)
+    return [(red_name, blue_name, points, red_result, blue_result)
+            for _ in range(len(game_numbers) - args.numTraining)]
+
+
+def make_tasks(matches, args, first_match=1, first_game=0):
+    """
+    Splits matches into the tasks run by play_games: one task per game, so
+    that the games of one slow match spread over all workers.  When the
+    first games of a match are training games, the agents must play all of
+    them, so the whole match is a single task.
+
+    Every task is (matchno, (red_name, red_factory), (blue_name,
+    blue_factory), games), where games is a tuple of game numbers.  Matches
+    are numbered from first_match and games from first_game.
+    """
+    tasks = []
+    games = range(first_game, first_game + args.numGames)
+    for matchno, (red, blue) in enumerate(matches, first_match):
+        if args.numTraining > 0:
+            tasks.append((matchno, red, blue, tuple(games)))
+        else:
+            tasks.extend((matchno, red, blue, (game,)) for game in games)
+    return tasks
+
+
+def game_seed(tournament_seed, red_name, blue_name, game):
+    """
+    Returns the seed of game number game of red_name against blue_name, see
+    capture.runGames.  It depends on nothing else, so the results of a
+    tournament do not depend on the order in which games are played or on
+    the number of workers, and any game can be played again on its own.
+    """
+    key = "{}:{}:{}:{}".format(tournament_seed, red_name, blue_name, game)
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def play_games(args, output_dir, task, turn_marker=None):
+    """
+    Worker for multiprocessing, plays the games of a single task (see
+    make_tasks).
+
+    This function will prepare everything to make a call to capture.runGames
+    and moves the files it writes to output_dir.  Returns the results of the
+    games as arguments for Scoreboard.add_result.  turn_marker becomes the
+    Game.turnMarker of every game.
+    """
+    matchno, (red_name, red_factory), (blue_name, blue_factory), game_numbers = task
+    task_name = "{}.{}".format(matchno, game_numbers[0]) if len(game_numbers) == 1 else str(matchno)
+    logging.info("Playing match {}: {} vs {}".format(task_name, red_name, blue_name))
+    red_result = Result.WIN
+    blue_result = Result.WIN
+
+    # What the engine and the agents print goes to output_name instead of
+    # the log.
+    match_log = matchLog.MatchLog(args.log_limit * 1024)
+    output_name = os.path.join(output_dir, "{}-{}-{}-output.txt.gz".format(
+        red_name, blue_name, game_numbers[0]))
+    red_streams = [match_log.stream("agent {} ({})".format(i, red_name)) for i in (0, 2)]
+    blue_streams = [match_log.stream("agent {} ({})".format(i, blue_name)) for i in (1, 3)]
+
+    # Create agents, check on errors in this part.
+    red_agents = None
+    blue_agents = None
+    try:
+        with replace_stdout(red_streams[0]), replace_stderr(red_streams[0]):
+            red_agents = mute_agents(red_factory(0, 2, True,
+                **args.agentArgs), red_streams)
+    except:
+        traceback.print_exc(file=red_streams[0])
+        red_result = Result.ERROR
+    try:
+        with replace_stdout(blue_streams[0]), replace_stderr(blue_streams[0]):
+            blue_agents = mute_agents(blue_factory(1, 3, False,
+                **args.agentArgs), blue_streams)
+    except:
+        traceback.print_exc(file=blue_streams[0])
+        blue_result = Result.ERROR
+
+    if Result.ERROR in (red_result, blue_result):
+        err_msg = "Match {}: An error occured during {}'s createTeam"
+        if red_result == Result.ERROR:
+            logging.error(err_msg.format(task_name, red_name))
+        if blue_result == Result.ERROR:
+            logging.error(err_msg.format(task_name, blue_name))
+        logging.info("{} vs {} ended in {}-{} with {} pts".format(
+            red_name, blue_name,
+            Result.get_name(red_result), Result.get_name(blue_result),
+            0))
+        match_log.write(output_name)
+        return [(red_name, blue_name, 0, red_result, blue_result)
+                for _ in range(len(game_numbers) - args.numTraining)]
+
+    # Play the game!
+    _args = update_arguments(args, red_name, red_agents, blue_name, blue_agents,
+            num_games=len(game_numbers))
+    _args["seed"] = [game_seed(args.seed, red_name, blue_name, game) for game in game_numbers]
+    _args["turnMarker"] = turn_marker
+    engine = match_log.stream("engine")
+    with tempfile.TemporaryDirectory(prefix="pacman-{}-{}-{}-".format(task_name, red_name, blue_name)) as tmpdirname:
+        curdir = os.path.abspath(os.curdir)
+        with replace_stdout(engine), replace_stderr(engine):
+            os.chdir(tmpdirname)
             try:
-                with silence_stdout():
-                    blue_agents = mute_agents(blue_factory(1, 3, False,
-                        **args.agentArgs))
-            except:
-                blue_result = Result.ERROR
-
-            if Result.ERROR in (red_result, blue_result):
-                err_msg = "Match {}: An error occured during {}'s createTeam"
-                if red_result == Result.ERROR:
-                    logging.error(err_msg.format(matchno, red_name))
-                if blue_result == Result.ERROR:
-                    logging.error(err_msg.format(matchno, blue_name))
-                logging.info("{} vs {} ended in {}-{} with {} pts".format(
-                    red_name, blue_name,
-                    Result.get_name(red_result), Result.get_name(blue_result),
-                    0))
-                for _ in range(args.numGames):
-                    results.put((red_name, blue_name, 0, red_result, blue_result))
+                games = capture.runGames(**_args)
+            finally:
+                os.chdir(curdir)
+                match_log.write(output_name)
+
+        # Collect the results for the global score card.
+        results = []
+        for game in games:
+            point, error = game.state.data.score, game.agentCrashed or game.agentTimeout
+            red_result, blue_result = Result.from_points(point, error)
+            logging.info("{} vs {} ended in {}-{} with {} pts".format(
+                red_name, blue_name,
+                Result.get_name(red_result), Result.get_name(blue_result),
+                point))
+            results.append((red_name, blue_name, point, red_result, blue_result))
+
+        if args.record_timings:
+            timings_name = os.path.join(output_dir, "{}-{}-{}-timings.json".format(
+                red_name, blue_name, game_numbers[0]))
+            match_timings(games, red_name, blue_name).writeJson(timings_name)
+
+        # Move all replay-%d files to results/red_name-blue_name-N, and
+        # events-%d.jsonl files to results/red_name-blue_name-events-N.jsonl,
+        # where N is the number of the game in the match.
+        match_name = os.path.join(output_dir, "{}-{}".format(red_name, blue_name))
+        for index, game in enumerate(game_numbers):
+            moves = (("replay-{}".format(index), "{}-{}".format(match_name, game)),
+                     ("events-{}.jsonl".format(index), "{}-events-{}.jsonl".format(match_name, game)))
+            for filename, new_name in moves:
+                filename = os.path.join(tmpdirname, filename)
+                if os.path.exists(filename):
+                    shutil.move(filename, os.path.join(curdir, new_name))
+    return results
+
+
+def task_files(output_dir, task):
+    """
+    Returns the names of the files in output_dir that play_games wrote for
+    task.
+    """
+    _, (red_name, _), (blue_name, _), game_numbers = task
+    match_name = "{}-{}".format(red_name, blue_name)
+    names = ["{}-{}-output.txt.gz".format(match_name, game_numbers[0]),
+             "{}-{}-timings.json".format(match_name, game_numbers[0])]
+    for game in game_numbers:
+        names += ["{}-{}".format(match_name, game),
+                  "{}-events-{}.jsonl".format(match_name, game)]
+    return [name for name in names if os.path.exists(os.path.join(output_dir, name))]
+
+
+def resume_tasks(entries, scoreboard, tasks, sequential=None):
+    """
+    Adds the results of the journal entries to scoreboard, and to the
+    sequentialTest.SequentialTest sequential if given, and returns the
+    tasks that are not in the journal.
+
+    Tasks are matched on their teams and games.  Entries of teams that no
+    longer participate are left out.  Missing games of a pair that already
+    played keep the sides of the journal, so all replays of a match are
+    named the same.
+    """
+    participants = set(scoreboard.participants)
+    done = set()
+    sides = {}
+    for entry in entries:
+        red_name, blue_name = entry["red"], entry["blue"]
+        if red_name not in participants or blue_name not in participants:
+            continue
+        pair = frozenset((red_name, blue_name))
+        games = tuple(entry["games"])
+        if (pair, games) in done:
+            continue
+        done.add((pair, games))
+        sides[pair] = (red_name, blue_name)
+        for result in entry["results"]:
+            scoreboard.add_result(*result)
+            if sequential is not None:
+                sequential.add_game(result[0], result[1], Result.game_score(*result[2:]))
+
+    remaining = []
+    for matchno, red, blue, game_numbers in tasks:
+        pair = frozenset((red[0], blue[0]))
+        if (pair, tuple(game_numbers)) in done:
+            continue
+        if pair in sides and sides[pair][0] != red[0]:
+            red, blue = blue, red
+        remaining.append((matchno, red, blue, game_numbers))
+    return remaining
+
+
+def latest_results_dir(directory="results"):
+    """
+    Returns the most recent tournament directory in directory.
+    """
+    names = []
+    for name in os.listdir(directory):
+        try:
+            datetime.datetime.strptime(name, TIMESTAMP_FMT)
+        except ValueError:
+            continue
+        if os.path.isdir(os.path.join(directory, name)):
+            names.append(name)
+    if not names:
+        raise ValueError("No unfinished competition found in {}".format(directory))
+    return os.path.join(directory, max(names))
+
+
+def schedule_tasks(tasks, workers, submit, on_done, skip=None):
+    """
+    Runs tasks on at most workers workers, blocking until all are done.
+    workers may also be a function returning the current number of workers,
+    for workers that come and go; it is checked at least every second.
+
+    submit(task) must return a concurrent.futures.Future and on_done(task,
+    future) is called as soon as a task finishes.  The longest expected task
+    goes first: a task costs its number of games times the mean time of a
+    game of its two teams, measured as games finish, so the games of slow
+    teams are not left for the end of the tournament.
+
+    The order is sorted again whenever a number of tasks proportional to
+    the remaining ones have been started, so choosing the next task stays
+    cheap in tournaments of many thousands of games.
+
+    Tasks for which skip(task) is true when their turn comes are dropped.
+    With skip, matches are also interleaved: first games of all matches go
+    first, then second games and so on, so later games of a match only start
+    when its earlier games had a chance to settle it.
+    """
+    team_time = collections.defaultdict(float)
+    team_games = collections.defaultdict(int)
+    totals = [0.0, 0]
+
+    def expected(task, default):
+        _, (red_name, _), (blue_name, _), game_numbers = task
+        cost = 0.0
+        for name in (red_name, blue_name):
+            cost += team_time[name] / team_games[name] if team_games[name] else default
+        return len(game_numbers) * cost
+
+    def order(tasks):
+        # Sorted so that the next task to start is the last one.
+        default = totals[0] / totals[1] if totals[1] else 1.0
+        if skip is None:
+            return sorted(tasks, key=lambda task: expected(task, default))
+        return sorted(tasks, key=lambda task: (-task[3][0], expected(task, default)))
+
+    pending = order(tasks)
+    started = 0
+    running = {}
+    timeout = 1.0 if callable(workers) else None
+    while pending or running:
+        capacity = max(workers(), 1) if callable(workers) else workers
+        while pending and len(running) < capacity:
+            if started >= max(capacity, len(pending) // 16):
+                pending = order(pending)
+                started = 0
+            task = pending.pop()
+            if skip is not None and skip(task):
                 continue
+            started += 1
+            running[submit(task)] = (task, time.perf_counter())
+        if not running:
+            break
+        done, _ = concurrent.futures.wait(running, timeout=timeout,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            task, start = running.pop(future)
+            _, (red_name, _), (blue_name, _), game_numbers = task
+            elapsed = (time.perf_counter() - start) / len(game_numbers)
+            for name in (red_name, blue_name):
+                team_time[name] += elapsed
+                team_games[name] += 1
+            totals[0] += 2 * elapsed
+            totals[1] += 2
+            on_done(task, future)
+
+
+def play_swiss_rounds(scoreboard, args, run_round, played=(), first_round=1):
+    """
+    Plays Swiss-system rounds of make_swiss_pairings.
 
-            # Play the game!
-            _args = update_arguments(args, red_name, red_agents, blue_name, blue_agents)
-            log_prefix = "{} ({} vs {}): ".format(matchno, red_name, blue_name)
-            with tempfile.TemporaryDirectory(prefix="pacman-{}-{}-{}-".format(matchno, red_name, blue_name)) as tmpdirname:
-                curdir = os.path.abspath(os.curdir)
-                with log_stdout(prefix=log_prefix):
-                    with log_stderr(prefix=log_prefix):
-                        os.chdir(tmpdirname)
-                        games = capture.runGames(**_args)
-                        os.chdir(curdir)
-
-                # Update the global score card.
-                points = [(game.state.data.score, game.agentCrashed or game.agentTimeout)
-                        for game in games]
-
-                for point, error in points:
-                    red_result, blue_result = Result.from_points(point, error)
-                    logging.info("{} vs {} ended in {}-{} with {} pts".format(
-                        red_name, blue_name,
-                        Result.get_name(red_result), Result.get_name(blue_result),
-                        0))
-                    results.put((red_name, blue_name, point, red_result, blue_result))
-
-                # Move all replay-% files to results/red_name-blue_name-%d
-                match_name = os.path.join(output_dir, "{}-{}".format(red_name, blue_name))
-                replay_prefix = 'replay'
-                replay_files = filter(lambda s: s.startswith(replay_prefix + '-'),
-                        os.listdir(tmpdirname))
-                for filename in replay_files:
-                    new_name = match_name + filename[len(replay_prefix):]
-                    shutil.move(os.path.join(tmpdirname, filename), os.path.join(curdir, new_name))
-        except multiprocessing.queues.Empty:
+    run_round(round_number, tasks) must play the tasks of a round and add
+    their results to scoreboard; every round is one rating period.  Rounds stop after args.rounds rounds, by
+    default twice the base-2 logarithm of the number of teams, or earlier
+    once every rating deviation is at most args.max_deviation.  A round has
+    about n / 2 matches, so the whole tournament plays O(n log n) games.
+    """
+    played = set(played)
+    n = len(scoreboard.participants)
+    max_rounds = args.rounds or max(1, 2 * math.ceil(math.log2(n)))
+    for round_number in range(first_round, max_rounds + 1):
+        deviation = scoreboard.ratings.max_deviation()
+        if deviation <= args.max_deviation:
+            logging.info("Ratings converged after {} rounds (deviation {:.0f}).".format(
+                round_number - 1, deviation))
             break
-    is_done.put(runner_id)
+        matches = scoreboard.make_swiss_pairings(played)
+        played.update(frozenset((red[0], blue[0])) for red, blue in matches)
+        tasks = make_tasks(matches, args, first_match=(round_number - 1) * (n // 2) + 1,
+                first_game=(round_number - 1) * args.numGames)
+        logging.info("Swiss round {} of at most {}: {} matches ({} tasks), deviation {:.0f}.".format(
+            round_number, max_rounds, len(matches), len(tasks), deviation))
+        run_round(round_number, tasks)
+        scoreboard.end_rating_period()
+
 
 def run_competition(args):
     """
@@ -1282,7 +1912,13 @@ def run_competition(args):
     """
     logging.info("Starting.")
     args.timestamp_start = datetime.datetime.now()
-    scoreboard = Scoreboard()
+    resume_dir = None
+    if args.resume is not None:
+        resume_dir = args.resume.rstrip(os.sep) or latest_results_dir()
+        args.timestamp_start = datetime.datetime.strptime(
+                os.path.basename(resume_dir), TIMESTAMP_FMT)
+    scoreboard = Scoreboard(rank_by_rating=args.swiss,
+            games_per_match=args.numGames if args.sprt else None)
     secrets = load_secrets(args.secrets)
 
     if not args.no_download:
@@ -1311,40 +1947,164 @@ def run_competition(args):
             os.mkdir("results")
         except OSError:
             pass
-        output_dir = args.timestamp_start.strftime(os.path.join("results",
+        output_dir = resume_dir or args.timestamp_start.strftime(os.path.join("results",
             TIMESTAMP_FMT))
         try:
             os.mkdir(output_dir)
         except OSError:
             pass
 
-        matches = scoreboard.make_pairings()
-        match_runners = {}
-        results = multiprocessing.Queue()
-        is_done = multiprocessing.Queue()
+        # With --sprt a match ends once its winner is settled.  A Swiss
+        # tournament starts a new test every round.
+        sequential = {}
+        if args.sprt:
+            if args.numTraining > 0:
+                logging.warning("--sprt is ignored with training games.")
+            else:
+                sequential["test"] = sequentialTest.SequentialTest(args.sprt_p, args.sprt_alpha)
+
+        journal_name = os.path.join(output_dir, JOURNAL_NAME)
+        entries = journal.Journal.read(journal_name) if args.resume is not None else []
+
+        # Every game is seeded from the tournament seed, see game_seed.  A
+        # resumed tournament keeps the seed in its journal.
+        if args.seed is None:
+            args.seed = next((e["seed"] for e in entries if "seed" in e),
+                    "{:016x}".format(random.getrandbits(64)))
+        logging.info("Tournament seed: {}".format(args.seed))
+        scoreboard.rng = random.Random(args.seed)
+        if args.swiss:
+            # Rounds depend on earlier results; a resumed Swiss tournament
+            # continues after the last round in the journal.
+            rounds = collections.defaultdict(list)
+            for entry in entries:
+                rounds[entry.get("round", 0)].append(entry)
+            for round_number in sorted(rounds):
+                resume_tasks(rounds[round_number], scoreboard, [])
+                scoreboard.end_rating_period()
+            played = set(frozenset((e["red"], e["blue"])) for e in entries)
+            first_round = max([e.get("round", 0) for e in entries], default=0) + 1
+            if entries:
+                logging.info("Resuming {} at Swiss round {}.".format(output_dir, first_round))
+        else:
+            matches = scoreboard.make_pairings()
+            tasks = make_tasks(matches, args)
+            if args.resume is not None:
+                planned = len(tasks)
+                tasks = resume_tasks(entries, scoreboard, tasks, sequential.get("test"))
+                logging.info("Resuming {}: {} of {} tasks already played.".format(
+                    output_dir, planned - len(tasks), planned))
+            logging.info("A total of {} matches ({} tasks) will be played.".format(len(matches), len(tasks)))
+        results_journal = journal.Journal(journal_name)
+        journal_extra = {"seed": args.seed}
         if not args.no_mail:
             logging.info("Emailing {} participants the results".format(len(email_addresses)))
-        logging.info("A total of {} matches will be played. Counting down".format(matches.qsize()))
-        for i in range(args.threads):
-            p = multiprocessing.Process(target=run_match,
-                    args=(i, args, output_dir, matches, results, is_done))
-            match_runners[i] = p
-            p.start()
-
-        while match_runners:
-            if not is_done.empty():
-                name = is_done.get(timeout=1)
-                match_runners[name].join()
-                del match_runners[name]
-            # Periodically move results to scoreboard, so that results is not overflowing.
-            while not results.empty():
-                scoreboard.add_result(*results.get())
-            time.sleep(0.1)
+
+        # With --incremental, tasks whose teams did not change since an
+        # earlier run take their results from the cache.
+        cache = None
+        if args.incremental:
+            team_hashes = {team: resultsCache.source_fingerprint(inspect.getmodule(factory))
+                    for team, factory in agent_factories.items()}
+            # Besides the engine source, the game options change the outcome:
+            # pondering and sandboxes change what agents compute, and the
+            # limits of play_supervised which games end in errors.
+            options = (args.length, args.numGames, args.numTraining, args.catchExceptions,
+                    args.cpu_time, args.ponder, args.sandbox, args.game_timeout,
+                    args.memory_limit, sorted(args.agentArgs.items()))
+            cache = resultsCache.ResultsCache(CACHE_FILENAME, team_hashes,
+                    tournament_layouts(args)[0].fingerprint(),
+                    lambda red, blue, games: [game_seed(args.seed, red, blue, game) for game in games],
+                    resultsCache.engine_fingerprint(options))
+
+        def record_results(task, results, **extra):
+            for result in results:
+                scoreboard.add_result(*result)
+                if sequential:
+                    sequential["test"].add_game(result[0], result[1],
+                            Result.game_score(*result[2:]))
+            results_journal.append(task, results, **dict(journal_extra, **extra))
+
+        def task_done(task, future):
+            # Results go to the scoreboard as soon as a task finishes.
+            matchno, (red_name, _), (blue_name, _), game_numbers = task
+            try:
+                results = future.result()
+            except Exception as e:
+                logging.error("Match {} ({} vs {}, games {}) failed: {!r}".format(
+                    matchno, red_name, blue_name, list(game_numbers), e))
+                return
+            record_results(task, results)
+            if cache is not None:
+                cache.store(task, results, output_dir, task_files(output_dir, task))
+            logging.info("Finished match {} ({} vs {}, games {})".format(
+                matchno, red_name, blue_name, list(game_numbers)))
+
+        def from_cache(tasks):
+            # Records the cached tasks and returns the others.
+            remaining = []
+            for task in tasks:
+                results = cache.lookup(task, output_dir)
+                if results is None:
+                    remaining.append(task)
+                else:
+                    record_results(task, results, cached=True)
+                    scoreboard.cached_games += len(results)
+            logging.info("{} of {} tasks were cached.".format(len(tasks) - len(remaining), len(tasks)))
+            return remaining
+
+        def settled(task):
+            # Games of a settled match are skipped and counted as such.
+            matchno, (red_name, _), (blue_name, _), game_numbers = task
+            if not sequential["test"].settled(red_name, blue_name):
+                return False
+            scoreboard.skip_games(red_name, blue_name, len(game_numbers))
+            return True
+
+        # Workers live for the whole tournament.  Whatever is loaded here
+        # before they start is shared with them by fork.
+        module_names = sorted(set(factory.__module__ for factory in agent_factories.values()))
+        preload_layouts(tournament_layouts(args))
+        workers = max(args.threads, 1)
+        try:
+            # With --serve the games are played by remote workers instead.
+            if args.serve is not None:
+                executor = remoteWorkers.TaskServer(remoteWorkers.parseAddress(args.serve),
+                        get_authkey(args), (args, module_names), output_dir)
+                workers = executor.capacity
+                submit = executor.submit
+            else:
+                executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                        initializer=init_worker,
+                        initargs=(args, module_names, matchLog.log_queue()))
+                submit = lambda task: executor.submit(play_task, output_dir, task)
+            with closing(executor) if args.serve is not None else executor:
+                def run_tasks(tasks):
+                    if cache is not None:
+                        tasks = from_cache(tasks)
+                    schedule_tasks(tasks, workers, submit,
+                            task_done, settled if sequential else None)
+
+                if args.swiss:
+                    def run_round(round_number, tasks):
+                        journal_extra["round"] = round_number
+                        if sequential:
+                            sequential["test"] = sequentialTest.SequentialTest(args.sprt_p, args.sprt_alpha)
+                        run_tasks(tasks)
+                    play_swiss_rounds(scoreboard, args, run_round, played, first_round)
+                else:
+                    run_tasks(tasks)
+                    scoreboard.end_rating_period()
+        finally:
+            results_journal.close()
+            if cache is not None:
+                cache.close()
 
         args.timestamp_finish = datetime.datetime.now()
+        timings = aggregate_timings(output_dir) if args.record_timings else None
         report_file = os.path.join(output_dir, "report.html")
         generate_html_report(scoreboard, report_file, secrets['course_name'],
-                **vars(args))
+                timings=timings, **vars(args))
         zip_name = zip_results(output_dir, remove_src=True)
     else:
         if not args.no_mail:
@@ -1360,14 +2120,48 @@ def run_competition(args):
     logging.info("Done!")
 
 
+def get_authkey(args):
+    """
+    Returns the key shared by --serve and --worker.
+    """
+    key = args.authkey or os.environ.get("COMPETITION_AUTHKEY")
+    if not key:
+        raise ValueError("--serve and --worker need --authkey or COMPETITION_AUTHKEY")
+    return key.encode()
+
+
+def run_worker(args):
+    """
+    Plays the games of a competition served with --serve, args.threads at a
+    time, until the competition is over.  The worker plays with the options
+    of the server; its own options other than --threads are ignored.
+    """
+    address = remoteWorkers.parseAddress(args.worker)
+    logging.info("Working for {}:{}".format(*address))
+    remoteWorkers.runWorker(address, get_authkey(args), max(args.threads, 1),
+            init_worker, play_task)
+    logging.info("Done!")
+
+
 if __name__ == "__main__":
     args = parse_arguments()
-    if args.edit_secrets:
-        create_secrets(args.secrets)
-    elif args.test_mail:
-        test_mail_settings(args.secrets)
-    else:
-        try:
-            run_competition(args)
-        except Exception as e:
-            logging.error("{}".format(e))
+    matchLog.start_logging(LOG_FILENAME if args.worker is None
+            else WORKER_LOG_FILENAME.format(os.getpid()),
+            append=args.resume is not None)
+    try:
+        if args.edit_secrets:
+            create_secrets(args.secrets)
+        elif args.worker is not None:
+            try:
+                run_worker(args)
+            except Exception as e:
+                logging.error("{}".format(e))
+        elif args.test_mail:
+            test_mail_settings(args.secrets)
+        else:
+            try:
+                run_competition(args)
+            except Exception as e:
+                logging.error("{}".format(e))
+    finally:
+        matchLog.stop_logging()
@@ -0,0 +1,134 @@
+# events.py
+# ---------
+# Structured events from the game engine.
+
+"""
+An event bus for Game and the game rules.
+
+Every Game has an EventBus in game.events.  Without sinks the bus is
+inactive and the engine skips building events altogether, so a game that
+nobody listens to pays one attribute check per move.  Sinks receive every
+event as a dict with at least 'type' and 'move' (the number of moves made so
+far); the other keys depend on the type, see EVENT_TYPES.
+
+Sinks: ListSink keeps events in memory, CallbackSink calls a function for
+each event and JsonlSink buffers events and writes them as JSON lines.
+"""
+
+import json
+
+GAME_START = 'gameStart'
+MOVE = 'move'
+FOOD_EATEN = 'foodEaten'
+FOOD_DUMPED = 'foodDumped'
+FOOD_RETURNED = 'foodReturned'
+CAPSULE = 'capsule'
+DEATH = 'death'
+SCORE = 'score'
+WARNING = 'warning'
+CRASH = 'crash'
+END = 'end'
+
+# Type of an event and the other keys it has.
+EVENT_TYPES = {
+    GAME_START: ('agents', 'starter', 'length', 'layout'),
+    MOVE: ('agent', 'action', 'position', 'time'),
+    FOOD_EATEN: ('agent', 'position'),
+    FOOD_DUMPED: ('agent', 'positions'),
+    FOOD_RETURNED: ('agent', 'amount'),
+    CAPSULE: ('agent', 'position'),
+    DEATH: ('agent', 'killer', 'position', 'carrying'),
+    SCORE: ('agent', 'change', 'score'),
+    WARNING: ('agent', 'time', 'warnings'),
+    CRASH: ('agent', 'timeout'),
+    END: ('score', 'crashed', 'timedOut'),
+}
+
+
+class EventBus:
+    """
+    Passes events on to a list of sinks.  Check active before building an
+    event; emit is only worth calling when somebody listens.
+    """
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self.active = bool(self.sinks)
+        self.move = 0
+
+    def addSink(self, sink):
+        self.sinks.append(sink)
+        self.active = True
+        return sink
+
+    def emit(self, type, **fields):
+        fields['type'] = type
+        fields['move'] = self.move
+        for sink in self.sinks:
+            sink.write(fields)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class ListSink:
+    def __init__(self):
+        self.events = []
+
+    def write(self, event):
+        self.events.append(event)
+
+    def close(self):
+        pass
+
+
+class CallbackSink:
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, event):
+        self.callback(event)
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """
+    Writes events to a file, one JSON object per line.  Events are encoded
+    in batches of bufferSize.
+    """
+
+    def __init__(self, filename, bufferSize=1024):
+        self.filename = filename
+        self.bufferSize = bufferSize
+        self._buffer = []
+        self._file = open(filename, 'w')
+
+    def write(self, event):
+        self._buffer.append(event)
+        if len(self._buffer) >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write(''.join(json.dumps(event) + '\n' for event in self._buffer))
+            self._buffer = []
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+
+
+def readJsonl(filename):
+    """
+    Yields the events of a file written by JsonlSink.
+    """
+    with open(filename) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,226 @@
+# exportDataset.py
+# ----------------
+# Turns replays into feature tensors for training.
+
+"""
+Exports recorded games as fixed-shape feature planes, one sample per move.
+
+Every sample is the full game state before a move, as a stack of PLANES
+planes of height x width cells (plane[y][x] is cell (x, y) of the layout),
+together with the agent that moved and the action it took.  Smaller layouts
+are padded with walls.  Samples are written in shards of at most
+--shard-size moves:
+
+  <prefix>-00000-planes.npy   uint8 array (moves, len(PLANES), height, width)
+  <prefix>-00000-moves.npy    structured array with MOVE_FIELDS per move
+
+Both are plain .npy files; open them with numpy.load(..., mmap_mode='r') to
+stream datasets much larger than memory.  Scared timers and carried food are
+clipped to 255.
+
+Replays are re-simulated in a pool of worker processes; the main process
+only copies the finished arrays into the current shard.  Requires numpy.
+
+Usage: python exportDataset.py dataset results/*.zip
+"""
+
+import argparse
+import os
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import replay
+import verifyReplays
+
+AGENT_PLANES = ('position', 'scared', 'carrying', 'pacman')
+
+PLANES = ('walls', 'redFood', 'blueFood', 'redCapsules', 'blueCapsules') + tuple(
+    'agent%d.%s' % (index, plane) for index in range(4) for plane in AGENT_PLANES)
+
+MOVE_FIELDS = [('game', '<u4'), ('move', '<u2'), ('agent', 'u1'), ('action', 'u1'),
+               ('score', '<i2'), ('timeleft', '<u2')]
+
+DEFAULT_WIDTH = 32
+DEFAULT_HEIGHT = 16
+DEFAULT_SHARD_SIZE = 1 << 16
+
+
+def _requireNumpy():
+    if numpy is None:
+        raise ImportError('exportDataset needs numpy: pip install numpy')
+
+
+def gameTensors(data, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT):
+    """
+    Re-simulates a replay.  Returns (planes, moves) for all its moves, with
+    moves['game'] left at 0.
+    """
+    recorded = verifyReplays.loadReplay(data)
+    layout = recorded.getLayout()
+    if layout.width > width or layout.height > height:
+        raise ValueError('layout of %dx%d does not fit in %dx%d' % (layout.width, layout.height, width, height))
+
+    numMoves = len(recorded.actions)
+    planes = numpy.zeros((numMoves, len(PLANES), height, width), dtype=numpy.uint8)
+    moves = numpy.zeros(numMoves, dtype=MOVE_FIELDS)
+
+    # Planes for cells of the layout, (height, width) like the output.
+    walls = numpy.ones((height, width), dtype=numpy.uint8)
+    walls[:layout.height, :layout.width] = numpy.array(layout.walls.data, dtype=numpy.uint8).T
+    redSide = numpy.zeros((layout.height, layout.width), dtype=bool)
+    redSide[:, :layout.width // 2] = True
+    capsulePlane = {True: PLANES.index('redCapsules'), False: PLANES.index('blueCapsules')}
+    agentBase = len(PLANES) - 4 * len(AGENT_PLANES)
+
+    state = recorded.initialState()
+    for number, (agentIndex, action) in enumerate(recorded.actions):
+        sample = planes[number]
+        sample[0] = walls
+        food = numpy.array(state.data.food.data, dtype=bool).T
+        sample[1, :layout.height, :layout.width] = food & redSide
+        sample[2, :layout.height, :layout.width] = food & ~redSide
+        for x, y in state.data.capsules:
+            sample[capsulePlane[x < layout.width // 2], y, x] = 1
+        for index, agentState in enumerate(state.data.agentStates[:4]):
+            x, y = (int(c) for c in agentState.configuration.pos)
+            base = agentBase + index * len(AGENT_PLANES)
+            sample[base, y, x] = 1
+            sample[base + 1, y, x] = min(agentState.scaredTimer, 255)
+            sample[base + 2, y, x] = min(agentState.numCarrying, 255)
+            sample[base + 3, y, x] = agentState.isPacman
+        moves[number] = (0, number, agentIndex, replay.ACTION_CODES[action],
+                         state.data.score, state.data.timeleft)
+        state = state.generateSuccessor(agentIndex, action)
+    return planes, moves
+
+
+def _tensorsTask(task):
+    name, data, width, height = task
+    try:
+        return name, gameTensors(data, width, height), None
+    except Exception as e:
+        return name, None, '%s: %s' % (type(e).__name__, e)
+
+
+class ShardWriter:
+    """
+    Appends samples to memory-mapped shards of a fixed maximum size.
+    """
+
+    def __init__(self, prefix, width, height, shardSize=DEFAULT_SHARD_SIZE):
+        self.prefix = prefix
+        self.shape = (len(PLANES), height, width)
+        self.shardSize = shardSize
+        self.shards = []
+        self.count = 0
+        self._planes = None
+        self._moves = None
+        self._used = 0
+
+    def _filenames(self, number):
+        return ('%s-%05d-planes.npy' % (self.prefix, number),
+                '%s-%05d-moves.npy' % (self.prefix, number))
+
+    def _open(self):
+        planesName, movesName = self._filenames(len(self.shards))
+        self._planes = numpy.lib.format.open_memmap(planesName, mode='w+', dtype=numpy.uint8,
+                                                    shape=(self.shardSize,) + self.shape)
+        self._moves = numpy.lib.format.open_memmap(movesName, mode='w+', dtype=MOVE_FIELDS,
+                                                   shape=(self.shardSize,))
+        self._used = 0
+
+    def _close(self):
+        if self._planes is None:
+            return
+        planesName, movesName = self._filenames(len(self.shards))
+        self._planes.flush()
+        self._moves.flush()
+        if self._used < self.shardSize:
+            # The last shard is cut to the number of samples it holds.
+            for name, array in ((planesName, self._planes), (movesName, self._moves)):
+                trimmed = numpy.lib.format.open_memmap(name + '.tmp', mode='w+', dtype=array.dtype,
+                                                       shape=(self._used,) + array.shape[1:])
+                trimmed[:] = array[:self._used]
+                trimmed.flush()
+                del trimmed
+                os.replace(name + '.tmp', name)
+        self.shards.append((planesName, movesName))
+        self._planes = self._moves = None
+
+    def write(self, planes, moves):
+        done = 0
+        while done < len(planes):
+            if self._planes is None:
+                self._open()
+            n = min(len(planes) - done, self.shardSize - self._used)
+            self._planes[self._used:self._used + n] = planes[done:done + n]
+            self._moves[self._used:self._used + n] = moves[done:done + n]
+            self._used += n
+            self.count += n
+            done += n
+            if self._used == self.shardSize:
+                self._close()
+
+    def close(self):
+        self._close()
+        return self.shards
+
+
+def export(paths, prefix, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT,
+           shardSize=DEFAULT_SHARD_SIZE, processes=None):
+    """
+    Exports all replays in paths.  Returns the shard filenames, the number
+    of games and samples, and a list of (name, error) for skipped replays.
+    """
+    _requireNumpy()
+    import multiprocessing
+    writer = ShardWriter(prefix, width, height, shardSize)
+    errors = []
+    games = 0
+    tasks = ((name, data, width, height) for name, data in verifyReplays.findReplays(paths))
+    with multiprocessing.Pool(processes) as pool:
+        for name, tensors, error in pool.imap(_tensorsTask, tasks):
+            if error is not None:
+                errors.append((name, error))
+                continue
+            planes, moves = tensors
+            moves['game'] = games
+            writer.write(planes, moves)
+            games += 1
+    return writer.close(), games, writer.count, errors
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="""Exports replays as
+            feature planes per move in memory-mapped .npy shards.""")
+    parser.add_argument('prefix', help="Prefix of the shard files.")
+    parser.add_argument('paths', nargs='+',
+            help="Replay files, directories, glob patterns or result zips.")
+    parser.add_argument('--width', type=int, default=DEFAULT_WIDTH,
+            help="Width of the planes; smaller layouts are padded.")
+    parser.add_argument('--height', type=int, default=DEFAULT_HEIGHT,
+            help="Height of the planes; smaller layouts are padded.")
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE,
+            help="Maximum number of moves per shard.")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+            help="Number of worker processes (default: number of CPUs).")
+    args = parser.parse_args(argv)
+
+    try:
+        shards, games, samples, errors = export(args.paths, args.prefix, args.width,
+                args.height, args.shard_size, args.jobs)
+    except ImportError as e:
+        print(e, file=sys.stderr)
+        return 2
+    for name, error in errors:
+        print('%s: %s' % (name, error), file=sys.stderr)
+    print('Exported %d moves of %d games into %d shards' % (samples, games, len(shards)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -24,6 +24,9 @@ from util import *
 import time, os
 import traceback
 import sys
+import threading
+import events
+import latency
 
 #######################
 # Parts worth reading #
@@ -173,7 +176,7 @@ class Grid:
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        self.data = [[initialValue] * height for x in range(width)]
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
@@ -232,19 +235,49 @@ class Grid:
 
         (width, height, bitPackedInts...)
         """
+        cells = self.toBitString()
+        size = self.CELLS_PER_INT
         bits = [self.width, self.height]
-        currentInt = 0
-        for i in range(self.height * self.width):
-            bit = self.CELLS_PER_INT - (i % self.CELLS_PER_INT) - 1
-            x, y = self._cellIndexToPosition(i)
-            if self[x][y]:
-                currentInt += 2 ** bit
-            if (i + 1) % self.CELLS_PER_INT == 0:
-                bits.append(currentInt)
-                currentInt = 0
-        bits.append(currentInt)
+        bits.extend(int(cells[i:i + size].ljust(size, '0'), 2) for i in range(0, len(cells), size))
+        if len(cells) % size == 0:
+            bits.append(0)
         return tuple(bits)
 
+    def toBitString(self):
+        """
+        Returns the cells as a string of '0' and '1', column by column
+        (cell (x, y) is character x * height + y).
+        """
+        return b''.join(bytes(column) for column in self.data).translate(_BITS_TO_CHARS).decode('ascii')
+
+    def toInt(self):
+        """
+        Returns the cells as one int, cell (x, y) in bit x * height + y.
+        """
+        cells = self.toBitString()
+        return int(cells[::-1], 2) if cells else 0
+
+    def fromInt(self, bits):
+        """
+        Fills in data from an int made by toInt.
+        """
+        height = self.height
+        mask = (1 << height) - 1
+        data = []
+        for x in range(self.width):
+            key = (height, bits >> (x * height) & mask)
+            column = _columns.get(key)
+            if column is None:
+                if len(_columns) >= MAX_CACHED_COLUMNS: _columns.clear()
+                column = _columns[key] = tuple(bool(key[1] >> y & 1) for y in range(height))
+            data.append(list(column))
+        self.data = data
+
+    def _fromBitString(self, cells):
+        cells = cells.encode('ascii').translate(_CHARS_TO_BITS)
+        height = self.height
+        self.data = [list(map(bool, cells[x * height:(x + 1) * height])) for x in range(self.width)]
+
     def _cellIndexToPosition(self, index):
         x = index // self.height
         y = index % self.height
@@ -254,13 +287,11 @@ class Grid:
         """
         Fills in data from a bit-level representation
         """
-        cell = 0
+        size = self.CELLS_PER_INT
         for packed in bits:
-            for bit in self._unpackInt(packed, self.CELLS_PER_INT):
-                if cell == self.width * self.height: break
-                x, y = self._cellIndexToPosition(cell)
-                self[x][y] = bit
-                cell += 1
+            if packed < 0: raise ValueError("must be a positive integer")
+        cells = ''.join(format(packed, '0%db' % size)[-size:] for packed in bits)
+        self._fromBitString(cells[:self.width * self.height].ljust(self.width * self.height, '0'))
 
     def _unpackInt(self, packed, size):
         bools = []
@@ -274,6 +305,15 @@ class Grid:
                 bools.append(False)
         return bools
 
+# Columns decoded by Grid.fromInt, by (height, bits).  Games only have a few
+# distinct food columns, so restoring states mostly copies cached columns.
+MAX_CACHED_COLUMNS = 1 << 16
+_columns = {}
+
+# Translation tables between cells as bytes 0/1 and as characters '0'/'1'.
+_BITS_TO_CHARS = bytes.maketrans(b'\x00\x01', b'01')
+_CHARS_TO_BITS = bytes.maketrans(b'01', b'\x00\x01')
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -504,6 +544,44 @@ class GameStateData:
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
 
+def shouldStopPondering():
+    """
+    Returns True when an agent's ponder method should return, because the
+    agent's own turn has arrived.  Outside of pondering this is always True.
+    """
+    check = getattr(threading.current_thread(), 'ponderStopCheck', None)
+    return check is None or check()
+
+class PonderThread(threading.Thread):
+    """
+    Runs agent.ponder(observation) in the background while the other agents
+    move, with the observation the agent got for its last move; observing
+    again would draw more sonar noise.  Cancellation is cooperative: stop()
+    sets a flag that the agent sees through shouldStopPondering().
+    """
+    def __init__(self, agent, observation):
+        threading.Thread.__init__(self, name='ponder-%d' % agent.index, daemon=True)
+        self.agent = agent
+        self.observation = observation
+        self.stopEvent = threading.Event()
+        self.ponderStopCheck = self.stopEvent.is_set
+
+    def run(self):
+        try:
+            self.agent.ponder(self.observation)
+        except Exception:
+            # Pondering is best effort; the agent's turn decides the game
+            traceback.print_exc()
+
+    def stop(self, timeout=None):
+        """
+        Asks the agent to stop pondering and waits at most timeout seconds.
+        Returns whether the thread stopped.
+        """
+        self.stopEvent.set()
+        self.join(timeout)
+        return not self.is_alive()
+
 try:
     import boinc
     _BOINC_ENABLED = True
@@ -515,7 +593,7 @@ class Game:
     The Game manages the control flow, soliciting actions from agents.
     """
 
-    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False ):
+    def __init__( self, agents, display, rules, startingIndex=0, muteAgents=False, catchExceptions=False, chargeCpuTime=False, allowPondering=False, recordTimings=False ):
         self.agentCrashed = False
         self.agents = agents
         self.display = display
@@ -525,7 +603,25 @@ class Game:
         self.muteAgents = muteAgents
         self.catchExceptions = catchExceptions
         self.moveHistory = []
+        # Optional object with a recordMove(agentIndex, action, state) method,
+        # e.g. a replay.ReplayWriter, that receives every move and the state
+        # it led to
+        self.recorder = None
+        # Structured events of the game, see events.py
+        self.events = events.EventBus()
+        # Optional object with a writable value, e.g. a multiprocessing.Value,
+        # set to the index of an agent before the game calls into it, so that
+        # a supervisor in another process can tell whose code hung
+        self.turnMarker = None
+        self.chargeCpuTime = chargeCpuTime
+        self.allowPondering = allowPondering
+        self.ponderThreads = {}
+        self.timings = None
+        if recordTimings:
+            self.timings = latency.GameTimings()
         self.totalAgentTimes = [0 for agent in agents]
+        self.totalAgentWallTimes = [0 for agent in agents]
+        self.totalAgentCpuTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
         import io
@@ -540,10 +636,55 @@ class Game:
     def _agentCrash( self, agentIndex, quiet=False):
         "Helper method for handling agent crashes"
         if not quiet: traceback.print_exc()
+        if self.events.active:
+            self.events.emit(events.CRASH, agent=agentIndex, timeout=self.agentTimeout)
         self.gameOver = True
         self.agentCrashed = True
         self.rules.agentCrash(self, agentIndex)
 
+    def _chargeTime(self, agentIndex, agent, timedFunc):
+        """
+        Books the wall-clock and CPU time of the last call of timedFunc and
+        returns the time the agent is charged for.
+        """
+        wallTime = timedFunc.wallTime
+        # Sandboxed agents report the CPU time of their own process
+        cpuTime = timedFunc.cpuTime + getattr(agent, 'remoteCpuTime', 0.0)
+        self.totalAgentWallTimes[agentIndex] += wallTime
+        self.totalAgentCpuTimes[agentIndex] += cpuTime
+        if self.chargeCpuTime:
+            return cpuTime
+        return wallTime
+
+    def _recordTiming(self, agentIndex, phase, start):
+        if self.timings is not None:
+            self.timings.record(agentIndex, phase, time.perf_counter() - start)
+
+    def _startPondering(self, agentIndex, agent, observation):
+        thread = PonderThread(agent, observation)
+        self.ponderThreads[agentIndex] = thread
+        thread.start()
+
+    def _stopPondering(self, agentIndex):
+        """
+        Cancels the pondering of an agent.  Returns whether it stopped within
+        the agent's move timeout, and the time spent waiting for it, which
+        is charged to the agent's move on wall-clock time; on CPU time the
+        waiting costs the agent nothing.
+        """
+        thread = self.ponderThreads.pop(agentIndex, None)
+        if thread is None:
+            return True, 0
+        start = time.perf_counter()
+        stopped = thread.stop(self.rules.getMoveTimeout(agentIndex))
+        if self.chargeCpuTime:
+            return stopped, 0
+        return stopped, time.perf_counter() - start
+
+    def _stopAllPondering(self):
+        for agentIndex in list(self.ponderThreads):
+            self._stopPondering(agentIndex)
+
     OLD_STDOUT = None
     OLD_STDERR = None
 
@@ -568,13 +709,28 @@ class Game:
         """
         Main control loop for game play.
         """
+        try:
+            self._run(delay)
+        finally:
+            self._stopAllPondering()
+            if self.events.active:
+                self.events.emit(events.END, score=self.state.data.score,
+                                 crashed=self.agentCrashed, timedOut=self.agentTimeout)
+
+    def _run( self, delay ):
         self.display.initialize(self.state.data)
         self.numMoves = 0
+        if self.events.active:
+            self.events.emit(events.GAME_START, agents=len(self.agents), starter=self.startingIndex,
+                             length=getattr(self, 'length', None),
+                             layout=self.state.data.layout.fingerprint())
 
         ###self.display.initialize(self.state.makeObservation(1).data)
         # inform learning agents of the game start
         for i in range(len(self.agents)):
             agent = self.agents[i]
+            if self.turnMarker is not None:
+                self.turnMarker.value = i
             if not agent:
                 self.mute(i)
                 # this is a null agent, meaning it failed to load
@@ -587,12 +743,10 @@ class Game:
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                        timed_func = TimeoutFunction(agent.registerInitialState, self.rules.getMaxStartupTime(i), self.chargeCpuTime)
                         try:
-                            start_time = time.time()
                             timed_func(self.state.deepCopy())
-                            time_taken = time.time() - start_time
-                            self.totalAgentTimes[i] += time_taken
+                            self.totalAgentTimes[i] += self._chargeTime(i, agent, timed_func)
                         except TimeoutFunctionException:
                             print("Agent %d ran out of time on startup!" % i, file=sys.stderr)
                             self.unmute()
@@ -615,42 +769,66 @@ class Game:
             time.sleep(delay)
             # Fetch the next agent
             agent = self.agents[agentIndex]
+            if self.turnMarker is not None:
+                self.turnMarker.value = agentIndex
             move_time = 0
+            move_slow = False
             skip_action = False
+            if agentIndex in self.ponderThreads:
+                stopped, waited = self._stopPondering(agentIndex)
+                move_time += waited
+                if not stopped:
+                    # The agent is still running in the ponder thread, so
+                    # asking it for a move would race with it
+                    self.mute(agentIndex)
+                    print("Agent %d did not stop pondering in time!" % agentIndex, file=sys.stderr)
+                    self.unmute()
+                    self.agentTimeout = True
+                    self._agentCrash(agentIndex, quiet=True)
+                    return
             # Generate an observation of the state
+            phase_start = move_start = time.perf_counter()
             if 'observationFunction' in dir( agent ):
+                # Rules may prepare what an agent observes, e.g. draw its sonar noise
+                if 'observedState' in dir(self.rules):
+                    observedState = self.rules.observedState(self.state, agentIndex)
+                else:
+                    observedState = self.state.deepCopy()
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(agent.observationFunction, self.rules.getMoveTimeout(agentIndex), self.chargeCpuTime)
                         try:
-                            start_time = time.time()
-                            observation = timed_func(self.state.deepCopy())
+                            observation = timed_func(observedState)
                         except TimeoutFunctionException:
                             skip_action = True
-                        move_time += time.time() - start_time
+                        move_time += self._chargeTime(agentIndex, agent, timed_func)
                         self.unmute()
                     except Exception as data:
                         self._agentCrash(agentIndex, quiet=False)
                         self.unmute()
                         return
                 else:
-                    observation = agent.observationFunction(self.state.deepCopy())
+                    observation = agent.observationFunction(observedState)
                 self.unmute()
             else:
                 observation = self.state.deepCopy()
+            self._recordTiming(agentIndex, 'observation', phase_start)
 
             # Solicit an action
+            phase_start = time.perf_counter()
             action = None
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    timed_func = TimeoutFunction(agent.getAction, self.rules.getMoveTimeout(agentIndex) - move_time, self.chargeCpuTime)
                     try:
-                        start_time = time.time()
                         if skip_action:
                             raise TimeoutFunctionException()
                         action = timed_func( observation )
+                        move_time += self._chargeTime(agentIndex, agent, timed_func)
+                        if move_time > self.rules.getMoveTimeout(agentIndex):
+                            raise TimeoutFunctionException()
                     except TimeoutFunctionException:
                         print("Agent %d timed out on a single move!" % agentIndex, file=sys.stderr)
                         self.agentTimeout = True
@@ -658,10 +836,12 @@ class Game:
                         self.unmute()
                         return
 
-                    move_time += time.time() - start_time
-
                     if move_time > self.rules.getMoveWarningTime(agentIndex):
+                        move_slow = True
                         self.totalAgentTimeWarnings[agentIndex] += 1
+                        if self.events.active:
+                            self.events.emit(events.WARNING, agent=agentIndex, time=move_time,
+                                             warnings=self.totalAgentTimeWarnings[agentIndex])
                         print("Agent %d took too long to make a move! This is warning %d" % (agentIndex, self.totalAgentTimeWarnings[agentIndex]), file=sys.stderr)
                         if self.totalAgentTimeWarnings[agentIndex] > self.rules.getMaxTimeWarnings(agentIndex):
                             print("Agent %d exceeded the maximum number of warnings: %d" % (agentIndex, self.totalAgentTimeWarnings[agentIndex]), file=sys.stderr)
@@ -685,10 +865,14 @@ class Game:
                     return
             else:
                 action = agent.getAction(observation)
+                move_time += time.perf_counter() - move_start
             self.unmute()
+            self._recordTiming(agentIndex, 'action', phase_start)
 
             # Execute the action
+            phase_start = time.perf_counter()
             self.moveHistory.append( (agentIndex, action) )
+            previous_state = self.state
             if self.catchExceptions:
                 try:
                     self.state = self.state.generateSuccessor( agentIndex, action )
@@ -699,14 +883,33 @@ class Game:
                     return
             else:
                 self.state = self.state.generateSuccessor( agentIndex, action )
+            if self.recorder is not None:
+                # Sandboxed agents observe in their own process and report
+                # their sonar readings back
+                sonar = getattr(observation, 'agentDistances', None) or getattr(agent, 'lastSonar', None)
+                self.recorder.recordMove(agentIndex, action, self.state, computeTime=move_time,
+                                         slow=move_slow, sonar=sonar)
+            if self.events.active:
+                self.events.move = len(self.moveHistory)
+                position = self.state.data.agentStates[agentIndex].getPosition()
+                self.events.emit(events.MOVE, agent=agentIndex, action=action,
+                                 position=position and tuple(int(c) for c in position), time=move_time)
+                if 'moveEvents' in dir(self.rules):
+                    self.rules.moveEvents(self, previous_state, self.state, agentIndex, action)
+            self._recordTiming(agentIndex, 'successor', phase_start)
 
             # Change the display
+            phase_start = time.perf_counter()
             self.display.update( self.state.data )
+            self._recordTiming(agentIndex, 'display', phase_start)
             ###idx = agentIndex - agentIndex % 2 + 1
             ###self.display.update( self.state.makeObservation(idx).data )
 
             # Allow for game specific conditions (winning, losing, etc.)
             self.rules.process(self.state, self)
+            # Let the agent think ahead while the others move
+            if self.allowPondering and not self.gameOver and 'ponder' in dir(agent):
+                self._startPondering(agentIndex, agent, observation)
             # Track progress
             if agentIndex == numAgents + 1: self.numMoves += 1
             # Next agent
@@ -716,8 +919,11 @@ class Game:
                 boinc.set_fraction_done(self.getProgress())
 
         # inform a learning agent of the game result
+        self._stopAllPondering()
         for agentIndex, agent in enumerate(self.agents):
             if "final" in dir( agent ) :
+                if self.turnMarker is not None:
+                    self.turnMarker.value = agentIndex
                 try:
                     self.mute(agentIndex)
                     agent.final( self.state )
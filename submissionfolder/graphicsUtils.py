@@ -60,6 +60,13 @@ def begin_graphics(width=640, height=480, color=formatColor(0, 0, 0), title=None
 
     # Check for duplicate call
     if _root_window is not None:
+        if (_canvas_xs, _canvas_ys) == (width - 1, height - 1):
+            # Same size: keep the window and only wipe it.
+            _bg_color = color
+            clear_screen()
+            _root_window.title(title or 'Graphics Window')
+            _clear_keys()
+            return
         # Lose the window.
         _root_window.destroy()
 
@@ -0,0 +1,85 @@
+# journal.py
+# ----------
+# The record of finished tasks from which a tournament resumes.
+
+"""
+The results journal of competition.py.
+
+Every finished task of a tournament is appended to journal.jsonl in the
+output directory as soon as its results are known.  competition.py --resume
+reads the journal back, adds its results to the scoreboard and only plays
+the tasks that are not in it.
+"""
+
+import json
+import logging
+import os
+import time
+
+
+class Journal:
+    """
+    An append-only record of the finished tasks of a tournament, one JSON
+    object per line with the match number, teams, game numbers and the
+    results of the task as passed to competition.Scoreboard.add_result.
+
+    Lines are flushed as they are written, and synced to disk every
+    sync_every lines or sync_interval seconds, whichever comes first.  A
+    crash loses at most the tasks since the last sync; --resume plays those
+    again.
+    """
+    def __init__(self, filename, sync_every=16, sync_interval=5.0):
+        self.filename = filename
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._file = open(filename, "a")
+        if self._file.tell() > 0:
+            # Start on a new line if the last run crashed halfway a line.
+            with open(filename, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write("\n")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def append(self, task, results, **extra):
+        matchno, (red_name, _), (blue_name, _), game_numbers = task
+        entry = {"match": matchno, "red": red_name, "blue": blue_name,
+                 "games": list(game_numbers), "results": [list(r) for r in results]}
+        entry.update(extra)
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if (self._unsynced >= self.sync_every
+                or time.monotonic() - self._last_sync >= self.sync_interval):
+            self.sync()
+
+    def sync(self):
+        if self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if not self._file.closed:
+            self.sync()
+            self._file.close()
+
+    @staticmethod
+    def read(filename):
+        """
+        Returns the entries in the journal filename, skipping lines that
+        were cut off by a crash.
+        """
+        entries = []
+        if not os.path.exists(filename):
+            return entries
+        with open(filename) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    logging.warning("Skipping incomplete line in journal {}".format(filename))
+        return entries
@@ -0,0 +1,189 @@
+# latency.py
+# ----------
+# Per-agent, per-phase move latency histograms.
+
+"""
+Latency instrumentation for Game.run.
+
+A LatencyHistogram stores durations in HDR style: exact microsecond buckets
+below 2 ** SIGNIFICANT_BITS microseconds, and for larger values log2 buckets
+that are each split in 2 ** (SIGNIFICANT_BITS - 1) linear sub-buckets.  That
+keeps the relative error below 1/32 at any magnitude, while a histogram of a
+whole tournament stays a few hundred integers.  Histograms merge by adding
+their bucket counts.
+
+GameTimings keeps one histogram per (agent, phase).  Game.run records the
+phases in PHASES for every move.  The results can be written as JSON, to be
+merged again later, or as CSV with p50/p95/p99/max per agent and phase.
+"""
+
+import collections
+import csv
+import json
+
+PHASES = ('observation', 'action', 'successor', 'display')
+
+SIGNIFICANT_BITS = 6
+
+_SUB_BUCKETS = 1 << SIGNIFICANT_BITS
+
+
+def _bucketIndex(value):
+    if value < _SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SIGNIFICANT_BITS
+    return (shift << SIGNIFICANT_BITS) + (value >> shift)
+
+
+def _bucketUpperBound(index):
+    shift, mantissa = index >> SIGNIFICANT_BITS, index & (_SUB_BUCKETS - 1)
+    if shift == 0:
+        return index
+    return ((mantissa + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """
+    A histogram of durations, recorded in seconds with microsecond
+    resolution.
+    """
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        micros = max(0, int(seconds * 1e6))
+        self.counts[_bucketIndex(micros)] += 1
+        self.count += 1
+        self.total += micros
+        if micros > self.max:
+            self.max = micros
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile(self, p):
+        """
+        Returns the duration in seconds below which p percent of the
+        recorded durations fall.
+        """
+        if not self.count:
+            return 0.0
+        rank = max(1, int(round(p / 100.0 * self.count)))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(_bucketUpperBound(index), self.max) / 1e6
+        return self.max / 1e6
+
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / 1e6 / self.count
+
+    def summary(self):
+        return collections.OrderedDict([
+            ('count', self.count),
+            ('mean', self.mean()),
+            ('p50', self.percentile(50)),
+            ('p95', self.percentile(95)),
+            ('p99', self.percentile(99)),
+            ('max', self.max / 1e6),
+        ])
+
+    def toDict(self):
+        return {'counts': sorted(self.counts.items()), 'count': self.count,
+                'total': self.total, 'max': self.max}
+
+    @classmethod
+    def fromDict(cls, data):
+        histogram = cls()
+        histogram.counts.update(dict((int(i), c) for i, c in data['counts']))
+        histogram.count = data['count']
+        histogram.total = data['total']
+        histogram.max = data['max']
+        return histogram
+
+
+class GameTimings:
+    """
+    Latency histograms per agent and phase.
+
+    Agents are keyed by their index during a game; relabel() renames them,
+    e.g. to team names, before timings of many games are merged.
+    """
+
+    def __init__(self):
+        self.histograms = collections.defaultdict(LatencyHistogram)
+
+    def record(self, agent, phase, seconds):
+        self.histograms[(str(agent), phase)].record(seconds)
+
+    def merge(self, other):
+        for key, histogram in other.histograms.items():
+            self.histograms[key].merge(histogram)
+        return self
+
+    def relabel(self, names):
+        """
+        Returns new timings where agent keys are replaced by names[key].
+        Agents mapped to the same name are merged.
+        """
+        timings = GameTimings()
+        for (agent, phase), histogram in self.histograms.items():
+            timings.histograms[(names.get(agent, agent), phase)].merge(histogram)
+        return timings
+
+    def rows(self):
+        """
+        Yields (agent, phase, summary) sorted by agent and phase.
+        """
+        order = dict((phase, i) for i, phase in enumerate(PHASES))
+        for agent, phase in sorted(self.histograms, key=lambda k: (k[0], order.get(k[1], len(order)), k[1])):
+            yield agent, phase, self.histograms[(agent, phase)].summary()
+
+    def toDict(self):
+        data = collections.defaultdict(dict)
+        for (agent, phase), histogram in self.histograms.items():
+            data[agent][phase] = histogram.toDict()
+        return data
+
+    @classmethod
+    def fromDict(cls, data):
+        timings = cls()
+        for agent, phases in data.items():
+            for phase, histogram in phases.items():
+                timings.histograms[(agent, phase)] = LatencyHistogram.fromDict(histogram)
+        return timings
+
+    def writeJson(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.toDict(), f, sort_keys=True)
+
+    @classmethod
+    def readJson(cls, filename):
+        with open(filename) as f:
+            return cls.fromDict(json.load(f))
+
+    def writeCsv(self, filename):
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['agent', 'phase', 'count', 'mean', 'p50', 'p95', 'p99', 'max'])
+            for agent, phase, summary in self.rows():
+                writer.writerow([agent, phase] + ['%.6f' % v if isinstance(v, float) else v
+                                                  for v in summary.values()])
+
+    def __str__(self):
+        lines = ['%-20s %-12s %7s %9s %9s %9s %9s' % ('agent', 'phase', 'count', 'p50', 'p95', 'p99', 'max')]
+        for agent, phase, s in self.rows():
+            lines.append('%-20s %-12s %7d %8.1fms %8.1fms %8.1fms %8.1fms' % (
+                agent, phase, s['count'], s['p50'] * 1e3, s['p95'] * 1e3, s['p99'] * 1e3, s['max'] * 1e3))
+        return '\n'.join(lines)
@@ -14,6 +14,7 @@
 
 from util import manhattanDistance
 from game import Grid
+import hashlib
 import os
 import random
 
@@ -89,6 +90,12 @@ class Layout:
     def __str__(self):
         return "\n".join(self.layoutText)
 
+    def fingerprint(self):
+        """
+        Returns a hex digest that identifies this layout by its text.
+        """
+        return layoutFingerprint(self.layoutText)
+
     def deepCopy(self):
         return Layout(self.layoutText[:])
 
@@ -128,6 +135,9 @@ class Layout:
         elif layoutChar in  ['1', '2', '3', '4']:
             self.agentPositions.append( (int(layoutChar), (x,y)))
             self.numGhosts += 1
+def layoutFingerprint(layoutText):
+    return hashlib.sha256("\n".join(layoutText).encode('utf-8')).hexdigest()
+
 def getLayout(name, back = 2):
     if name.endswith('.lay'):
         layout = tryToLoad('layouts/' + name)
@@ -0,0 +1,151 @@
+# matchLog.py
+# -----------
+# The tournament log and what the agents print during a match.
+
+"""
+Logging for competition.py.
+
+start_logging sends the log records of the tournament and of its worker
+processes through a single writer to the log file.  MatchLog keeps what the
+engine and every agent print during a task, up to a limit, for the
+RedTeam-BlueTeam-N-output.txt.gz files.
+"""
+
+import collections
+import gzip
+import logging
+import logging.handlers
+import multiprocessing
+import threading
+
+# Number of log records written to the log file at once, and the most
+# seconds a record waits to be written, see start_logging.
+LOG_BATCH = 256
+LOG_FLUSH_INTERVAL = 1.0
+
+
+# The queue, QueueListener and the Event that stops the flushing thread of
+# start_logging.
+_log_queue = None
+_log_listener = None
+_log_flusher = None
+
+
+def start_logging(filename, append=False):
+    """
+    Sets up logging to filename for this process and the worker processes
+    it forks: loggers put their records on a queue, and a thread of this
+    process writes them to the file in batches of LOG_BATCH, or at once for
+    errors.  Another thread writes what is left every LOG_FLUSH_INTERVAL
+    seconds, so a killed tournament leaves a log behind.  There is a single
+    writer, so records of different processes are never interleaved within
+    a line.  With append, the file is added to instead of replaced.
+    """
+    global _log_queue, _log_listener, _log_flusher
+    handler = logging.FileHandler(filename, mode="a" if append else "w")
+    handler.setFormatter(logging.Formatter(
+            "%(asctime)s %(module)s %(levelname)s %(message)s"))
+    buffered = logging.handlers.MemoryHandler(LOG_BATCH,
+            flushLevel=logging.ERROR, target=handler)
+    _log_queue = multiprocessing.Queue()
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(_log_queue)]
+    root.setLevel(logging.DEBUG)
+    _log_listener = logging.handlers.QueueListener(_log_queue, buffered)
+    _log_listener.start()
+    _log_flusher = threading.Event()
+
+    def flush_periodically():
+        while not _log_flusher.wait(LOG_FLUSH_INTERVAL):
+            buffered.flush()
+    threading.Thread(target=flush_periodically, name="log-flusher", daemon=True).start()
+
+
+def flush_log():
+    """
+    Writes all records logged so far to the log file.
+    """
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.flush()
+        _log_listener.start()
+
+
+def log_queue():
+    """
+    Returns the queue of start_logging, or None before it is called.  Worker
+    processes log to it with a QueueHandler.
+    """
+    return _log_queue
+
+
+def stop_logging():
+    if _log_listener is not None:
+        _log_flusher.set()
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+
+
+class BoundedStream:
+    """
+    A text stream that keeps the first limit characters written to it and
+    only counts the others, so that a chatty agent costs little time and
+    memory.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self.dropped = 0
+        self._parts = []
+
+    def write(self, text):
+        room = self.limit - self.size
+        if room >= len(text):
+            self._parts.append(text)
+            self.size += len(text)
+        else:
+            if room > 0:
+                self._parts.append(text[:room])
+                self.size = self.limit
+            self.dropped += len(text) - max(room, 0)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        text = "".join(self._parts)
+        if self.dropped:
+            text += "\n[{} more characters dropped]\n".format(self.dropped)
+        return text
+
+
+class MatchLog:
+    """
+    What the engine and every agent printed during a task, each in its own
+    BoundedStream of limit characters.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.streams = collections.OrderedDict()
+
+    def stream(self, name):
+        if name not in self.streams:
+            self.streams[name] = BoundedStream(self.limit)
+        return self.streams[name]
+
+    def write(self, filename):
+        """
+        Writes the non-empty streams gzipped to filename.
+        """
+        streams = [(name, stream) for name, stream in self.streams.items()
+                if stream.size or stream.dropped]
+        if not streams:
+            return
+        with gzip.open(filename, "wt") as f:
+            for name, stream in streams:
+                f.write("==> {} <==\n".format(name))
+                f.write(stream.getvalue())
+                f.write("\n")
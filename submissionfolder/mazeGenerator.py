@@ -82,7 +82,7 @@ class Maze:
       s += '\n'
     return s[:-1]
 
-  def add_wall(self, i, gaps=1, vert=True):
+  def add_wall(self, i, gaps=1, vert=True, rng=random):
     """
     add a wall with gaps
     """
@@ -96,7 +96,7 @@ class Maze:
       if not self.root.c-1 in slots:
         if self.root.grid[max(slots)+1][add_c+i] == E: slots.remove(max(slots))
       if len(slots) <= gaps: return 0
-      random.shuffle(slots)
+      rng.shuffle(slots)
       for row in slots[int(round(gaps)):]:
         self.root.grid[row][add_c+i] = W
       self.rooms.append(Maze(self.r, i, (add_r,add_c), self.root))
@@ -110,7 +110,7 @@ class Maze:
       if not self.root.r-1 in slots:
         if self.root.grid[add_r+i][max(slots)+1] == E: slots.remove(max(slots))
       if len(slots) <= gaps: return 0
-      random.shuffle(slots)
+      rng.shuffle(slots)
       for col in slots[int(round(gaps)):]:
         self.root.grid[add_r+i][col] = W
       self.rooms.append(Maze(i, self.c, (add_r,add_c), self.root))
@@ -118,12 +118,12 @@ class Maze:
 
     return 1
 
-def make_with_prison(room, depth, gaps=1, vert=True, min_width=1, gapfactor=0.5):
+def make_with_prison(room, depth, gaps=1, vert=True, min_width=1, gapfactor=0.5, rng=random):
   """
   Build a maze with 0,1,2 layers of prison (randomly)
   """
-  p = random.randint(0,2)
-  proll = random.random()
+  p = rng.randint(0,2)
+  proll = rng.random()
   if proll < 0.5:
     p = 1
   elif proll < 0.7:
@@ -147,11 +147,11 @@ def make_with_prison(room, depth, gaps=1, vert=True, min_width=1, gapfactor=0.5)
 
   room.rooms.append(Maze(room.r, room.c-(2*p), (add_r, add_c+(2*p)), room.root))
   for sub_room in room.rooms:
-    make(sub_room, depth+1, gaps, vert, min_width, gapfactor)
+    make(sub_room, depth+1, gaps, vert, min_width, gapfactor, rng)
 
   return 2*p
 
-def make(room, depth, gaps=1, vert=True, min_width=1, gapfactor=0.5):
+def make(room, depth, gaps=1, vert=True, min_width=1, gapfactor=0.5, rng=random):
   """
   recursively build a maze
   TODO: randomize number of gaps?
@@ -172,15 +172,15 @@ def make(room, depth, gaps=1, vert=True, min_width=1, gapfactor=0.5):
   if depth==0: wall_slots = [num-2]  ## fix the first wall
   else: wall_slots = range(1, num-1)
   if len(wall_slots) == 0: return
-  choice = random.choice(wall_slots)
-  if not room.add_wall(choice, gaps, vert): return
+  choice = rng.choice(wall_slots)
+  if not room.add_wall(choice, gaps, vert, rng): return
 
   ## recursively add walls
   # if random.random() < 0.8:
   #     vert = not vert
   for sub_room in room.rooms:
     make(sub_room, depth+1, max(1,gaps*gapfactor), not vert,
-         min_width, gapfactor)
+         min_width, gapfactor, rng)
   # for sub_room in room.rooms:
   #     make(sub_room, depth+1, max(1,gaps/2), not vert, min_width)
 
@@ -192,7 +192,7 @@ def copy_grid(grid):
       new_grid[row].append(grid[row][col])
   return new_grid
 
-def add_pacman_stuff(maze, max_food=60, max_capsules=4, toskip=0):
+def add_pacman_stuff(maze, max_food=60, max_capsules=4, toskip=0, rng=random):
   """
   add pacmen starting position
   add food at dead ends plus some extra
@@ -231,8 +231,8 @@ def add_pacman_stuff(maze, max_food=60, max_capsules=4, toskip=0):
   ## add capsules
   total_capsules = 0
   while total_capsules < max_capsules:
-    row = random.randint(1, maze.r-1)
-    col = random.randint(1+toskip, (maze.c//2)-2)
+    row = rng.randint(1, maze.r-1)
+    col = rng.randint(1+toskip, (maze.c//2)-2)
     if (row > maze.r-6) and (col < 6): continue
     if(abs(col - maze.c/2) < 3): continue
     if maze.grid[row][col] == E:
@@ -242,8 +242,8 @@ def add_pacman_stuff(maze, max_food=60, max_capsules=4, toskip=0):
 
   ## extra random food
   while total_food < max_food:
-    row = random.randint(1, maze.r-1)
-    col = random.randint(1+toskip, (maze.c//2)-1)
+    row = rng.randint(1, maze.r-1)
+    col = rng.randint(1+toskip, (maze.c//2)-1)
     if (row > maze.r-6) and (col < 6): continue
     if(abs(col - maze.c//2) < 3): continue
     if maze.grid[row][col] == E:
@@ -253,15 +253,20 @@ def add_pacman_stuff(maze, max_food=60, max_capsules=4, toskip=0):
 
 MAX_DIFFERENT_MAZES = 10000
 
-def generateMaze(seed = None):
+def generateMaze(seed = None, rng = random):
+  """
+  Returns the maze of seed as layout text.  Without a seed, one is drawn from
+  rng.  The maze is generated with its own random.Random(seed), so the same
+  seed always gives the same maze and rng is not disturbed.
+  """
   if not seed:
-    seed = random.randint(1,MAX_DIFFERENT_MAZES)
-  random.seed(seed)
+    seed = rng.randint(1,MAX_DIFFERENT_MAZES)
+  mazeRng = random.Random(seed)
   maze = Maze(16,16)
-  gapfactor = min(0.65,random.gauss(0.5,0.1))
-  skip = make_with_prison(maze, depth=0, gaps=3, vert=True, min_width=1, gapfactor=gapfactor)
+  gapfactor = min(0.65,mazeRng.gauss(0.5,0.1))
+  skip = make_with_prison(maze, depth=0, gaps=3, vert=True, min_width=1, gapfactor=gapfactor, rng=mazeRng)
   maze.to_map()
-  add_pacman_stuff(maze, 2*(maze.r*maze.c//20), 4, skip)
+  add_pacman_stuff(maze, 2*(maze.r*maze.c//20), 4, skip, rng=mazeRng)
   return str(maze)
 
 if __name__ == '__main__':
@@ -0,0 +1,166 @@
+# profiling.py
+# ------------
+# Separate profiles for the engine and for every agent.
+
+"""
+Profiling support for capture.py --profile.
+
+GameProfiler keeps one cProfile.Profile for the engine and one per agent.
+The agents' registerInitialState, observationFunction and getAction are
+wrapped so that, while they run, the engine profile is paused and the
+agent's own profile records.  Only one profile is active at any time, so
+every function call ends up in exactly one of them.
+
+write() stores one .pstats file per profile (for pstats, snakeviz, ...) and
+a single collapsed-stack text file for flame graph tools such as
+flamegraph.pl or speedscope.  Each stack in it starts with the name of its
+profile, so engine overhead and agent hot spots sit side by side in one
+graph.
+"""
+
+import cProfile
+import os
+import pstats
+
+AGENT_METHODS = ('registerInitialState', 'observationFunction', 'getAction')
+
+# Call paths that took less than this fraction of their profile's total time
+# are left out of the collapsed stacks.
+COLLAPSE_THRESHOLD = 1e-4
+
+MAX_STACK_DEPTH = 256
+
+
+class GameProfiler:
+    """
+    One profile for the engine and one per agent.
+    """
+
+    def __init__(self, numAgents):
+        self.engine = cProfile.Profile()
+        self.agents = [cProfile.Profile() for i in range(numAgents)]
+        self._stack = []
+
+    def _enter(self, profile):
+        if self._stack:
+            self._stack[-1].disable()
+        self._stack.append(profile)
+        profile.enable()
+
+    def _exit(self):
+        self._stack.pop().disable()
+        if self._stack:
+            self._stack[-1].enable()
+
+    def startEngine(self):
+        self._enter(self.engine)
+
+    def stopEngine(self):
+        self._exit()
+
+    def _wrap(self, profile, function):
+        def profiled(*args, **kwargs):
+            self._enter(profile)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._exit()
+        return profiled
+
+    def wrapAgents(self, agents):
+        """
+        Makes the agents' entry points record into their own profiles.
+        Agents are changed in place and returned.
+        """
+        for index, agent in enumerate(agents):
+            if agent is None:
+                continue
+            for name in AGENT_METHODS:
+                if name in dir(agent):
+                    setattr(agent, name, self._wrap(self.agents[index], getattr(agent, name)))
+        return agents
+
+    def profiles(self):
+        """
+        Returns (name, profile) for the engine and every agent.
+        """
+        named = [('engine', self.engine)]
+        for index, profile in enumerate(self.agents):
+            named.append(('agent%d-%s' % (index, ['red', 'blue'][index % 2]), profile))
+        return named
+
+    def write(self, prefix='profile'):
+        """
+        Writes <prefix>-<name>.pstats for every profile and <prefix>.collapsed
+        with the stacks of all of them.  Returns the names of the files.
+        """
+        filenames = []
+        with open(prefix + '.collapsed', 'w') as collapsed:
+            for name, profile in self.profiles():
+                profile.create_stats()
+                if not profile.stats:
+                    continue
+                filename = '%s-%s.pstats' % (prefix, name)
+                profile.dump_stats(filename)
+                filenames.append(filename)
+                for stack, micros in collapsedStacks(pstats.Stats(profile), name):
+                    collapsed.write('%s %d\n' % (stack, micros))
+        filenames.append(prefix + '.collapsed')
+        return filenames
+
+
+def _frameName(func):
+    filename, line, name = func
+    if filename == '~':
+        label = name
+    else:
+        label = '%s (%s:%d)' % (name, os.path.basename(filename), line)
+    return label.replace(';', ',')
+
+
+def collapsedStacks(stats, root):
+    """
+    Yields (stack, microseconds) pairs approximating the call stacks in a
+    pstats.Stats object.
+
+    cProfile only records caller/callee pairs, not whole stacks.  The time of
+    a function is therefore split over its callees in proportion to the
+    time spent on each call edge, starting from the functions nobody called.
+    """
+    entries = stats.stats
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, {})[func] = edge[3]
+    total = sum(tt for cc, nc, tt, ct, callers in entries.values())
+    threshold = total * COLLAPSE_THRESHOLD
+
+    results = {}
+
+    def visit(func, timeOnPath, path, names):
+        cc, nc, tt, ct, callers = entries[func]
+        share = timeOnPath / ct if ct > 0 else 0.0
+        own = tt * share
+        if own > 0:
+            stack = ';'.join(names)
+            results[stack] = results.get(stack, 0.0) + own
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edgeTime in callees.get(func, {}).items():
+            callTime = edgeTime * share
+            if callee in path or callTime < threshold:
+                continue
+            path.add(callee)
+            names.append(_frameName(callee))
+            visit(callee, callTime, path, names)
+            names.pop()
+            path.remove(callee)
+
+    for func, (cc, nc, tt, ct, callers) in entries.items():
+        if not callers and ct >= threshold:
+            visit(func, ct, set([func]), [root, _frameName(func)])
+
+    for stack in sorted(results):
+        micros = int(results[stack] * 1e6)
+        if micros > 0:
+            yield stack, micros
@@ -0,0 +1,99 @@
+# ratings.py
+# ----------
+# Glicko ratings of the teams of a tournament.
+
+"""
+Glicko ratings for competition.py.
+
+The ratings pair and rank the teams of --swiss tournaments, and their
+deviations decide when a Swiss tournament has played enough rounds.  The
+update rule is Glickman's, "Parameter estimation in large dynamic paired
+comparison experiments" (1999), without the growth of deviations over time.
+"""
+
+import collections
+import math
+
+# Glicko rating and rating deviation of a team without games.
+INITIAL_RATING = 1500.0
+INITIAL_DEVIATION = 350.0
+
+
+class Ratings:
+    """
+    Glicko ratings of teams, updated once per rating period with all games
+    of the period, such as a Swiss round.
+
+    Every team has a rating and a rating deviation, the uncertainty of the
+    rating.  A team's strength lies within two deviations of its rating
+    with about 95% confidence.  Deviations shrink with every game played.
+    """
+    Q = math.log(10) / 400
+
+    def __init__(self):
+        self._ratings = {}
+        self._games = []
+
+    def add(self, team):
+        self._ratings.setdefault(team, (INITIAL_RATING, INITIAL_DEVIATION))
+
+    def rating(self, team):
+        """
+        Returns (rating, deviation) of team.
+        """
+        return self._ratings.get(team, (INITIAL_RATING, INITIAL_DEVIATION))
+
+    @classmethod
+    def _g(cls, deviation):
+        return 1 / math.sqrt(1 + 3 * (cls.Q * deviation / math.pi) ** 2)
+
+    @classmethod
+    def expected(cls, rating, opponent):
+        """
+        Returns the expected score of a (rating, deviation) against another.
+        """
+        return 1 / (1 + 10 ** (-cls._g(opponent[1]) * (rating[0] - opponent[0]) / 400))
+
+    def add_game(self, leftTeam, rightTeam, score):
+        """
+        Adds a game that leftTeam won (score 1), tied (0.5) or lost (0) to
+        the current rating period.  The ratings change at end_period.
+        """
+        self._games.append((leftTeam, rightTeam, score))
+
+    def end_period(self):
+        """
+        Updates the ratings of all teams that played in the current rating
+        period with their games, against the ratings of their opponents from
+        before the period.  The order in which the games were added does not
+        matter.
+        """
+        games = collections.defaultdict(list)
+        for leftTeam, rightTeam, score in self._games:
+            games[leftTeam].append((self.rating(rightTeam), score))
+            games[rightTeam].append((self.rating(leftTeam), 1 - score))
+        self._games = []
+        updated = {team: self._updated(self.rating(team), results)
+                for team, results in games.items()}
+        self._ratings.update(updated)
+
+    @classmethod
+    def _updated(cls, rating, results):
+        # fsum rounds exactly, so that the sums do not depend on the order
+        # of the games.
+        terms = [(cls._g(opponent[1]), cls.expected(rating, opponent), score)
+                for opponent, score in results]
+        precision = 1 / rating[1] ** 2 + cls.Q ** 2 * math.fsum(
+                g * g * e * (1 - e) for g, e, score in terms)
+        return (rating[0] + cls.Q / precision * math.fsum(g * (score - e) for g, e, score in terms),
+                math.sqrt(1 / precision))
+
+    def ranking(self):
+        """
+        Returns (team, rating, deviation) tuples, highest rating first.
+        """
+        return sorted(((team, r, rd) for team, (r, rd) in self._ratings.items()),
+                key=lambda x: x[1], reverse=True)
+
+    def max_deviation(self):
+        return max((rd for r, rd in self._ratings.values()), default=INITIAL_DEVIATION)
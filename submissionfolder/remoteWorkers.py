@@ -0,0 +1,316 @@
+# remoteWorkers.py
+# ----------------
+# Plays tournament tasks on other machines over TCP.
+
+"""
+A coordinator that hands out tournament tasks to worker processes on other
+machines, and the worker side of it.
+
+The coordinator (competition.py --serve) listens on a TCP port.  Workers
+(competition.py --worker host:port) connect with
+multiprocessing.connection, which authenticates both sides with a shared
+key, and say how many tasks they play at once.  The coordinator answers
+with the setup of the tournament and then sends every worker tasks until
+its slots are full.  A worker plays each task in its own process pool and
+sends back the results together with the files the games wrote (replays,
+events, timings), which the coordinator saves in its output directory.
+
+Messages are pickled tuples:
+
+  worker -> coordinator   ('hello', slots, hostname)
+                          ('result', jobId, results, files)
+                          ('error', jobId, message)
+                          ('heartbeat',)
+  coordinator -> worker   ('setup', setup)
+                          ('job', jobId, task)
+                          ('stop',)
+
+Workers send a heartbeat every HEARTBEAT_INTERVAL seconds.  A worker that
+is silent for HEARTBEAT_TIMEOUT seconds or loses its connection is dropped,
+and its tasks go back to the front of the queue for another worker.  A task
+that ends up being played twice is harmless: only the first result counts.
+
+Tasks name their team factories by reference, so every worker needs the same
+code and students/ directory as the coordinator.
+"""
+
+import collections
+import concurrent.futures
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+HEARTBEAT_INTERVAL = 5.0
+HEARTBEAT_TIMEOUT = 30.0
+CONNECT_TIMEOUT = 60.0
+
+
+def parseAddress(text, defaultHost=''):
+    """
+    Returns (host, port) for 'host:port' or 'port'.
+    """
+    host, _, port = text.rpartition(':')
+    return (host or defaultHost, int(port))
+
+
+class _Worker:
+    def __init__(self, connection, slots, name):
+        self.connection = connection
+        self.slots = slots
+        self.name = name
+        self.jobs = set()
+        self.lastSeen = time.monotonic()
+        self.sendLock = threading.Lock()
+        self.alive = True
+
+    def send(self, message):
+        with self.sendLock:
+            self.connection.send(message)
+
+
+class TaskServer:
+    """
+    The coordinator.  submit(task) returns a concurrent.futures.Future with
+    the results of the task, as play_games returns them.  Files sent back
+    by workers are written to outputDir.
+    """
+
+    def __init__(self, address, authkey, setup, outputDir):
+        self.setup = setup
+        self.outputDir = outputDir
+        self._listener = Listener(address, authkey=authkey)
+        self.address = self._listener.address
+        self._lock = threading.Lock()
+        self._queue = collections.deque()
+        self._jobs = {}
+        self._workers = []
+        self._nextJob = 0
+        self._closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+        threading.Thread(target=self._reap, daemon=True).start()
+        logging.info("Waiting for workers on {}:{}".format(*self.address))
+
+    def capacity(self):
+        """
+        Returns the number of tasks the connected workers play at once.
+        """
+        with self._lock:
+            return sum(worker.slots for worker in self._workers)
+
+    def submit(self, task):
+        future = concurrent.futures.Future()
+        with self._lock:
+            jobId = self._nextJob
+            self._nextJob += 1
+            self._jobs[jobId] = (task, future)
+            self._queue.append(jobId)
+            assigned = self._assign()
+        self._send(assigned)
+        return future
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+        for worker in workers:
+            try:
+                worker.send(('stop',))
+            except (OSError, EOFError):
+                pass
+        self._listener.close()
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except Exception as e:
+                # Includes failed authentication; keep listening.
+                if not self._closed:
+                    logging.warning("Rejected worker connection: {!r}".format(e))
+                continue
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, connection):
+        worker = None
+        try:
+            message = connection.recv()
+            if message[0] != 'hello':
+                connection.close()
+                return
+            _, slots, name = message
+            worker = _Worker(connection, max(int(slots), 1), name)
+            worker.send(('setup', self.setup))
+            with self._lock:
+                self._workers.append(worker)
+                logging.info("Worker {} joined with {} slots".format(name, worker.slots))
+                assigned = self._assign()
+            self._send(assigned)
+            while True:
+                message = connection.recv()
+                worker.lastSeen = time.monotonic()
+                if message[0] == 'result':
+                    _, jobId, results, files = message
+                    self._finish(worker, jobId, results, files)
+                elif message[0] == 'error':
+                    _, jobId, error = message
+                    self._finish(worker, jobId, None, None, error)
+        except (EOFError, OSError) as e:
+            if worker is not None and not self._closed:
+                logging.warning("Lost worker {}: {!r}".format(worker.name, e))
+        finally:
+            if worker is not None:
+                self._drop(worker)
+
+    def _finish(self, worker, jobId, results, files, error=None):
+        with self._lock:
+            worker.jobs.discard(jobId)
+            task, future = self._jobs.pop(jobId, (None, None))
+            assigned = self._assign()
+        self._send(assigned)
+        if future is None or future.done():
+            # Already finished by another worker after a reassignment.
+            return
+        if error is not None:
+            future.set_exception(RuntimeError("{} on worker {}".format(error, worker.name)))
+            return
+        for name, data in files.items():
+            with open(os.path.join(self.outputDir, os.path.basename(name)), 'wb') as f:
+                f.write(data)
+        future.set_result(results)
+
+    def _drop(self, worker):
+        with self._lock:
+            if not worker.alive:
+                return
+            worker.alive = False
+            if worker in self._workers:
+                self._workers.remove(worker)
+            # Reassign the tasks of the worker before any new ones.
+            lost = sorted(jobId for jobId in worker.jobs if jobId in self._jobs)
+            self._queue.extendleft(reversed(lost))
+            worker.jobs.clear()
+            if lost:
+                logging.warning("Reassigning {} tasks of worker {}".format(len(lost), worker.name))
+            assigned = self._assign()
+        self._send(assigned)
+        try:
+            worker.connection.close()
+        except OSError:
+            pass
+
+    def _assign(self):
+        """
+        Takes queued jobs for the free slots of the workers and returns them
+        as (worker, jobId, task).  Called with the lock held; the jobs are
+        sent by _send after the lock is released, so that a slow connection
+        does not hold up the other workers.
+        """
+        assigned = []
+        for worker in self._workers:
+            while self._queue and len(worker.jobs) < worker.slots:
+                jobId = self._queue.popleft()
+                if jobId not in self._jobs:
+                    continue
+                worker.jobs.add(jobId)
+                assigned.append((worker, jobId, self._jobs[jobId][0]))
+        return assigned
+
+    def _send(self, assigned):
+        for worker, jobId, task in assigned:
+            try:
+                worker.send(('job', jobId, task))
+            except (OSError, EOFError):
+                # _serve notices the broken connection and reassigns the
+                # jobs of the worker, this one included.
+                pass
+
+    def _reap(self):
+        while not self._closed:
+            time.sleep(HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            with self._lock:
+                silent = [w for w in self._workers if now - w.lastSeen > HEARTBEAT_TIMEOUT]
+            for worker in silent:
+                logging.warning("Worker {} missed its heartbeats".format(worker.name))
+                self._drop(worker)
+
+
+def runWorker(address, authkey, slots, initializer, play):
+    """
+    Connects to a TaskServer, waiting up to CONNECT_TIMEOUT seconds for it
+    to start, and plays its tasks until it says stop.
+
+    initializer(*setup) is run in every process of the worker's pool with
+    the setup of the coordinator; play(outputDir, task) plays a task in the
+    pool and writes its files to outputDir.
+    """
+    # The coordinator may still be starting up.
+    deadline = time.monotonic() + CONNECT_TIMEOUT
+    while True:
+        try:
+            connection = Client(address, authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1.0)
+    connection.send(('hello', slots, '{}:{}'.format(socket.gethostname(), os.getpid())))
+    message = connection.recv()
+    if message[0] != 'setup':
+        raise RuntimeError("Unexpected message from coordinator: {!r}".format(message[0]))
+    setup = message[1]
+    sendLock = threading.Lock()
+    stopped = threading.Event()
+
+    def send(message):
+        with sendLock:
+            connection.send(message)
+
+    def heartbeat():
+        while not stopped.wait(HEARTBEAT_INTERVAL):
+            try:
+                send(('heartbeat',))
+            except (OSError, EOFError):
+                return
+
+    def done(jobId, outputDir, future):
+        try:
+            try:
+                results = future.result()
+            except Exception as e:
+                send(('error', jobId, repr(e)))
+                return
+            files = {}
+            for name in os.listdir(outputDir):
+                with open(os.path.join(outputDir, name), 'rb') as f:
+                    files[name] = f.read()
+            send(('result', jobId, results, files))
+        except (OSError, EOFError):
+            stopped.set()
+        finally:
+            shutil.rmtree(outputDir, ignore_errors=True)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=slots, initializer=initializer,
+                                                      initargs=setup)
+    try:
+        while not stopped.is_set():
+            message = connection.recv()
+            if message[0] == 'stop':
+                break
+            if message[0] == 'job':
+                _, jobId, task = message
+                outputDir = tempfile.mkdtemp(prefix='pacman-worker-')
+                future = executor.submit(play, outputDir, task)
+                future.add_done_callback(lambda f, jobId=jobId, outputDir=outputDir: done(jobId, outputDir, f))
+    except (EOFError, OSError):
+        logging.warning("Lost the coordinator")
+    finally:
+        stopped.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        connection.close()
@@ -0,0 +1,517 @@
+# replay.py
+# ---------
+# Reading and writing recorded games.
+
+"""
+The binary replay format.
+
+A replay file starts with a header:
+
+  magic      4 bytes   b'PCRP'
+  version    uint8
+  flags      uint8
+  numAgents  uint8
+  starter    uint8     index of the agent that moved first
+  length     uint32    move limit of the game
+  layout     32 bytes  sha256 of the layout text (layout.layoutFingerprint)
+  then four strings, each a uint32 byte count and UTF-8 text:
+  layout text (lines joined by newlines), red team name, blue team name and
+  the random seed ('' if unknown).
+
+With FLAG_EXTERNAL_LAYOUT set the layout text is left empty and the layout is
+looked up by its fingerprint instead, in a table of layout files named
+<fingerprint>.lay (see detachLayout).  Result archives store every layout
+once that way.
+
+The header is followed by a stream of records.  A byte below RECORD_TAG is a
+move: the agent index in the high five bits, the action (an index into
+ACTIONS) in the low three.  Any other byte is a tag, followed by a uint32
+payload size and the payload; readers skip tags they do not know.  TAG_END
+closes the game and holds the final score and how the game ended.
+
+Every CHECKPOINT_EVERY moves the writer adds a TAG_CHECKPOINT record with a
+snapshot of the game state after the preceding move (see GameState.toBytes).
+Replay.seek restores the nearest checkpoint before a move and simulates the
+few moves after it, so any point of a game can be reached without replaying
+it from the start.
+
+When the engine passes them, the writer also keeps per-move metadata: the
+agent's compute time, warning flags and the sonar readings it was given.
+These are written just before TAG_END as a TAG_MOVE_INFO record of named
+columns with one unsigned LEB128 varint per move (signed values zigzag
+encoded), see Replay.moveInfo.
+
+The writer appends every move as it happens and flushes regularly, so the
+moves played so far survive a crashed process.  All integers are little
+endian.
+
+Replays written by older versions of capture.py are pickled dictionaries.
+loadReplay reads both kinds; only pickles from trusted sources should be
+loaded.
+"""
+
+from game import Directions
+import bisect
+import layout as layoutModule
+import os
+import pickle
+import struct
+
+MAGIC = b'PCRP'
+VERSION = 1
+
+FLAG_EXTERNAL_LAYOUT = 1
+
+# Directory, next to the replays, holding the layouts of detached replays.
+LAYOUT_DIR = 'layouts'
+
+ACTIONS = (Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST, Directions.STOP)
+ACTION_CODES = dict((action, code) for code, action in enumerate(ACTIONS))
+
+RECORD_TAG = 0xF0
+TAG_MOVE_INFO = 0xFD
+TAG_CHECKPOINT = 0xFE
+TAG_END = 0xFF
+
+END_CRASHED = 1
+END_TIMEOUT = 2
+
+# Bits of the per-move flags column.
+MOVE_SLOW = 1        # the move earned a time warning
+MOVE_NO_SONAR = 2    # no sonar readings were recorded for the move
+MOVE_NO_TIME = 4     # no compute time was recorded for the move
+
+# Moves are flushed to disk after this many moves.
+FLUSH_EVERY = 64
+
+# Moves between two state checkpoints.
+CHECKPOINT_EVERY = 100
+
+_HEADER = struct.Struct('<4sBBBBI32s')
+_SIZE = struct.Struct('<I')
+_END = struct.Struct('<iBI')
+
+_MOVES = [None] * 256
+for _byte in range(RECORD_TAG):
+    if _byte & 7 < len(ACTIONS):
+        _MOVES[_byte] = (_byte >> 3, ACTIONS[_byte & 7])
+
+
+class ReplayFormatError(Exception):
+    pass
+
+
+def encodeMove(agentIndex, action):
+    return (agentIndex << 3) | ACTION_CODES[action]
+
+
+def encodeVarints(values, signed=False):
+    """
+    Encodes integers as LEB128 varints, zigzag encoded when signed.
+    """
+    out = bytearray()
+    for value in values:
+        if signed:
+            value = value * 2 if value >= 0 else -value * 2 - 1
+        while value > 0x7F:
+            out.append(value & 0x7F | 0x80)
+            value >>= 7
+        out.append(value)
+    return bytes(out)
+
+
+def decodeVarints(data, pos, count, signed=False):
+    """
+    Decodes count varints from data at pos.  Returns (values, new pos).
+    """
+    values = []
+    for i in range(count):
+        value = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        if signed:
+            value = (value >> 1) ^ -(value & 1)
+        values.append(value)
+    return values, pos
+
+
+# Columns of TAG_MOVE_INFO, apart from one 'sonar<i>' column per agent.
+MOVE_COLUMNS = ('computeTime', 'flags')
+
+
+def _packMoveInfo(columns):
+    parts = [encodeVarints([len(columns)])]
+    for name, values in columns:
+        signed = name.startswith('sonar')
+        encoded = name.encode('utf-8')
+        parts.append(encodeVarints([len(encoded)]) + encoded)
+        parts.append(encodeVarints([len(values)]) + encodeVarints(values, signed))
+    return b''.join(parts)
+
+
+def _unpackMoveInfo(payload):
+    columns = {}
+    (count,), pos = decodeVarints(payload, 0, 1)
+    for i in range(count):
+        (size,), pos = decodeVarints(payload, pos, 1)
+        name = payload[pos:pos + size].decode('utf-8')
+        pos += size
+        (length,), pos = decodeVarints(payload, pos, 1)
+        columns[name], pos = decodeVarints(payload, pos, length, name.startswith('sonar'))
+    return columns
+
+
+def _packString(text):
+    data = text.encode('utf-8')
+    return _SIZE.pack(len(data)) + data
+
+
+class ReplayWriter:
+    """
+    Streams a game to a replay file while it is being played.
+
+    Game.run calls recordMove for every executed move when the writer is
+    set as the game's recorder.
+    """
+
+    def __init__(self, filename, layout, redTeamName, blueTeamName, length,
+                 starter, numAgents=4, seed=None, checkpointEvery=CHECKPOINT_EVERY):
+        self.filename = filename
+        self.checkpointEvery = checkpointEvery
+        self.numAgents = numAgents
+        self.numMoves = 0
+        self._computeTimes = []
+        self._moveFlags = []
+        self._sonar = []
+        self._hasInfo = False
+        self._pending = bytearray()
+        self._file = open(filename, 'wb')
+        header = _HEADER.pack(MAGIC, VERSION, 0, numAgents, starter, length,
+                              bytes.fromhex(layout.fingerprint()))
+        header += _packString('\n'.join(layout.layoutText))
+        header += _packString(redTeamName or '')
+        header += _packString(blueTeamName or '')
+        header += _packString('' if seed is None else str(seed))
+        self._file.write(header)
+
+    def recordMove(self, agentIndex, action, state=None, computeTime=None, slow=False, sonar=None):
+        """
+        Records a move.  state is the state after the move; it is needed for
+        checkpoints, which are skipped without it.  computeTime (seconds),
+        slow (whether the move earned a time warning) and sonar (the noisy
+        distances the agent observed) are kept as move metadata.
+        """
+        self._pending.append(encodeMove(agentIndex, action))
+        self.numMoves += 1
+        flags = MOVE_SLOW if slow else 0
+        if computeTime is None:
+            flags |= MOVE_NO_TIME
+        if not sonar:
+            flags |= MOVE_NO_SONAR
+        if computeTime is not None or sonar or slow:
+            self._hasInfo = True
+        self._computeTimes.append(int(computeTime * 1e6) if computeTime is not None else 0)
+        self._moveFlags.append(flags)
+        self._sonar.append(tuple(sonar)[:self.numAgents] if sonar else ())
+        if state is not None and self.checkpointEvery and self.numMoves % self.checkpointEvery == 0:
+            self.writeRecord(TAG_CHECKPOINT, state.toBytes())
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def writeRecord(self, tag, payload):
+        self._pending.append(tag)
+        self._pending += _SIZE.pack(len(payload))
+        self._pending += payload
+
+    def flush(self):
+        self._file.write(self._pending)
+        self._file.flush()
+        del self._pending[:]
+
+    def close(self, score, crashed=False, timedOut=False):
+        """
+        Ends the game with its final score and closes the file.
+        """
+        if self._hasInfo:
+            columns = [('computeTime', self._computeTimes), ('flags', self._moveFlags)]
+            for index in range(self.numAgents):
+                columns.append(('sonar%d' % index, [int(readings[index]) if index < len(readings) else 0
+                                                    for readings in self._sonar]))
+            self.writeRecord(TAG_MOVE_INFO, _packMoveInfo(columns))
+        flags = (END_CRASHED if crashed else 0) | (END_TIMEOUT if timedOut else 0)
+        self.writeRecord(TAG_END, _END.pack(int(score), flags, self.numMoves))
+        self.flush()
+        self._file.close()
+
+
+def writeReplay(filename, layout, actions, length, redTeamName='', blueTeamName='',
+                score=None, starter=None, seed=None):
+    """
+    Writes a finished game to a binary replay file in one go.
+    """
+    if starter is None:
+        starter = actions[0][0] if actions else 0
+    writer = ReplayWriter(filename, layout, redTeamName, blueTeamName, length,
+                          starter, len(layout.agentPositions), seed)
+    for agentIndex, action in actions:
+        writer.recordMove(agentIndex, action)
+    writer.close(0 if score is None else score)
+
+
+class Replay:
+    """
+    A recorded game.
+
+    score, crashed and timedOut are only known for complete replays; a
+    replay that was cut short has complete == False and score None.
+    """
+
+    def __init__(self, layoutText, actions, length, redTeamName='', blueTeamName='',
+                 starter=0, numAgents=4, seed=None, fingerprint=None):
+        self.layoutText = layoutText
+        self.actions = actions
+        self.length = length
+        self.redTeamName = redTeamName
+        self.blueTeamName = blueTeamName
+        self.starter = starter
+        self.numAgents = numAgents
+        self.seed = seed
+        self.fingerprint = fingerprint or layoutModule.layoutFingerprint(layoutText)
+        self.version = None
+        self.complete = False
+        self.score = None
+        self.crashed = False
+        self.timedOut = False
+        self.records = []
+        self.checkpoints = []
+        self.moveColumns = {}
+        self._layout = None
+
+    def getLayout(self):
+        if self._layout is None:
+            self._layout = layoutModule.Layout(self.layoutText)
+        return self._layout
+
+    def moveInfo(self, moveNumber):
+        """
+        Returns the metadata of a move as a dict with computeTime (seconds),
+        slow and sonar (a tuple of noisy distances), each None if unknown.
+        Replays without metadata return None.
+        """
+        if not self.moveColumns or moveNumber >= len(self.moveColumns.get('flags', ())):
+            return None
+        flags = self.moveColumns['flags'][moveNumber]
+        info = {'computeTime': None, 'slow': bool(flags & MOVE_SLOW), 'sonar': None}
+        if not flags & MOVE_NO_TIME:
+            info['computeTime'] = self.moveColumns['computeTime'][moveNumber] / 1e6
+        if not flags & MOVE_NO_SONAR:
+            info['sonar'] = tuple(self.moveColumns['sonar%d' % index][moveNumber]
+                                  for index in range(self.numAgents)
+                                  if 'sonar%d' % index in self.moveColumns)
+        return info
+
+    def initialState(self):
+        """
+        Returns the state of the game before the first move.
+        """
+        from capture import GameState
+        state = GameState()
+        state.initialize(self.getLayout(), self.numAgents)
+        state.data.timeleft = self.length
+        return state
+
+    def seek(self, moveNumber):
+        """
+        Returns the state after the first moveNumber moves, starting from
+        the nearest checkpoint at or before that move.
+        """
+        moveNumber = max(0, min(moveNumber, len(self.actions)))
+        state = self.initialState()
+        first = 0
+        index = bisect.bisect_right([move for move, payload in self.checkpoints], moveNumber)
+        if index:
+            first, payload = self.checkpoints[index - 1]
+            state = state.fromBytes(state, payload)
+        for agentIndex, action in self.actions[first:moveNumber]:
+            state = state.generateSuccessor(agentIndex, action)
+        return state
+
+    def replayArgs(self):
+        """
+        Returns the keyword arguments for capture.replayGame.
+        """
+        import game
+        return {'layout': self.getLayout(),
+                'agents': [game.Agent() for i in range(self.numAgents)],
+                'actions': self.actions,
+                'length': self.length,
+                'redTeamName': self.redTeamName,
+                'blueTeamName': self.blueTeamName}
+
+    def describe(self):
+        lines = ['%s vs %s' % (self.redTeamName or 'Red', self.blueTeamName or 'Blue'),
+                 'layout:  %s' % self.fingerprint[:16],
+                 'moves:   %d of %d' % (len(self.actions), self.length),
+                 'starter: %d' % self.starter]
+        if self.seed is not None:
+            lines.append('seed:    %s' % self.seed)
+        if self.moveColumns:
+            times = [self.moveColumns['computeTime'][i] for i, flags in enumerate(self.moveColumns['flags'])
+                     if not flags & MOVE_NO_TIME]
+            slow = sum(1 for flags in self.moveColumns['flags'] if flags & MOVE_SLOW)
+            if times:
+                lines.append('compute: %.1fms mean, %.1fms max, %d slow moves'
+                             % (sum(times) / len(times) / 1e3, max(times) / 1e3, slow))
+        if self.complete:
+            ending = ' (crashed)' if self.crashed else ' (timed out)' if self.timedOut else ''
+            lines.append('score:   %d%s' % (self.score, ending))
+        else:
+            lines.append('score:   unknown, replay is incomplete')
+        return '\n'.join(lines)
+
+
+def isBinaryReplay(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _readStrings(data, pos, count):
+    strings = []
+    for i in range(count):
+        size, = _SIZE.unpack_from(data, pos)
+        pos += _SIZE.size
+        strings.append(data[pos:pos + size].decode('utf-8'))
+        pos += size
+    return strings, pos
+
+
+def detachLayout(data):
+    """
+    Takes the layout out of a binary replay.  Returns (fingerprint, layout
+    text, replay bytes without the layout).  The layout text is None if the
+    replay had no layout in it to begin with.
+    """
+    magic, version, flags, numAgents, starter, length, fingerprint = _HEADER.unpack_from(data)
+    if flags & FLAG_EXTERNAL_LAYOUT:
+        return fingerprint.hex(), None, data
+    (layoutText,), pos = _readStrings(data, _HEADER.size, 1)
+    header = _HEADER.pack(magic, version, flags | FLAG_EXTERNAL_LAYOUT, numAgents, starter,
+                          length, fingerprint)
+    return fingerprint.hex(), layoutText, header + _packString('') + data[pos:]
+
+
+def attachLayout(data, layoutText):
+    """
+    Puts the layout back into a replay made by detachLayout.
+    """
+    magic, version, flags, numAgents, starter, length, fingerprint = _HEADER.unpack_from(data)
+    if not flags & FLAG_EXTERNAL_LAYOUT:
+        return data
+    strings, pos = _readStrings(data, _HEADER.size, 1)
+    header = _HEADER.pack(magic, version, flags & ~FLAG_EXTERNAL_LAYOUT, numAgents, starter,
+                          length, fingerprint)
+    return header + _packString(layoutText) + data[pos:]
+
+
+class LayoutDirectory:
+    """
+    The layout table of detached replays: a directory of <fingerprint>.lay
+    files.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get(self, fingerprint):
+        try:
+            with open(os.path.join(self.directory, fingerprint + '.lay'), encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+
+def parseReplay(data, layouts=None):
+    """
+    Parses the bytes of a binary replay into a Replay.  layouts maps
+    fingerprints to layout texts for replays without their own layout.
+    """
+    if len(data) < _HEADER.size or data[:len(MAGIC)] != MAGIC:
+        raise ReplayFormatError('not a binary replay')
+    magic, version, flags, numAgents, starter, length, fingerprint = _HEADER.unpack_from(data)
+    if version > VERSION:
+        raise ReplayFormatError('replay version %d is newer than supported (%d)' % (version, VERSION))
+    (layoutText, redTeamName, blueTeamName, seed), pos = _readStrings(data, _HEADER.size, 4)
+    if flags & FLAG_EXTERNAL_LAYOUT:
+        layoutText = layouts.get(fingerprint.hex()) if layouts is not None else None
+        if layoutText is None or layoutModule.layoutFingerprint(layoutText.split('\n')) != fingerprint.hex():
+            raise ReplayFormatError('layout %s of this replay is not available' % fingerprint.hex())
+
+    actions = []
+    replay = Replay(layoutText.split('\n'), actions, length, redTeamName, blueTeamName,
+                    starter, numAgents, seed or None, fingerprint.hex())
+    replay.version = version
+    end = len(data)
+    while pos < end:
+        byte = data[pos]
+        if byte < RECORD_TAG:
+            move = _MOVES[byte]
+            if move is None:
+                raise ReplayFormatError('invalid move byte %d at offset %d' % (byte, pos))
+            actions.append(move)
+            pos += 1
+            continue
+        if pos + 1 + _SIZE.size > end:
+            break
+        size, = _SIZE.unpack_from(data, pos + 1)
+        start = pos + 1 + _SIZE.size
+        if start + size > end:
+            break
+        payload = data[start:start + size]
+        if byte == TAG_END:
+            replay.score, endFlags, numMoves = _END.unpack_from(payload)
+            replay.complete = True
+            replay.crashed = bool(endFlags & END_CRASHED)
+            replay.timedOut = bool(endFlags & END_TIMEOUT)
+        elif byte == TAG_CHECKPOINT:
+            replay.checkpoints.append((len(actions), payload))
+        elif byte == TAG_MOVE_INFO:
+            replay.moveColumns = _unpackMoveInfo(payload)
+        else:
+            replay.records.append((byte, len(actions), payload))
+        pos = start + size
+    return replay
+
+
+def _fromPickle(recorded):
+    layout = recorded['layout']
+    actions = [(index, action) for index, action in recorded['actions']]
+    replay = Replay(list(layout.layoutText), actions, recorded['length'],
+                    recorded.get('redTeamName', ''), recorded.get('blueTeamName', ''),
+                    actions[0][0] if actions else 0, len(recorded.get('agents', [])) or 4)
+    replay._layout = layout
+    return replay
+
+
+def loadReplay(filename):
+    """
+    Reads a binary or (legacy) pickled replay file.  Detached layouts are
+    looked up in LAYOUT_DIR next to the file.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    layouts = LayoutDirectory(os.path.join(os.path.dirname(filename), LAYOUT_DIR))
+    return loadReplayBytes(data, layouts)
+
+
+def loadReplayBytes(data, layouts=None):
+    """
+    Reads a binary or (legacy) pickled replay from the contents of a file.
+    """
+    if data[:len(MAGIC)] == MAGIC:
+        return parseReplay(data, layouts)
+    return _fromPickle(pickle.loads(data, encoding="bytes"))
@@ -0,0 +1,253 @@
+# replayStore.py
+# --------------
+# Loads replays into an SQLite database for analysis.
+
+"""
+An SQLite store of per-move facts from recorded games.
+
+Replays are re-simulated in a pool of worker processes; the main process
+writes one row per game into games, one row per move into moves and one row
+per agent death into deaths, one transaction per batch of games.  Every
+replay is identified by the sha256 of its bytes, so ingesting the same
+directory again only adds the new games.
+
+Tables:
+
+  games   id, hash, source, red, blue, layout (fingerprint), seed, starter,
+          length, moves, score (simulated final score), stored_score,
+          crashed, timed_out
+  moves   game, move, agent, action, x, y, is_pacman, num_carrying,
+          score_delta, food_eaten, capsule_eaten, food_returned, died, kills
+          (moves are numbered from 1, as in events.py; position and
+          carried food after the move; died is 1 when the moving agent
+          itself was killed, kills counts the opponents it killed)
+  deaths  game, move, agent, x, y, num_carrying (where the agent died and
+          how much food it lost)
+
+The views team_moves and team_deaths add the column team with the name of
+the agent's team.  For example:
+
+  python replayStore.py games.db results/*.zip
+  python replayStore.py games.db --query "SELECT team, COUNT(*) FROM team_deaths
+      WHERE num_carrying > 5 GROUP BY team"
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import sqlite3
+import sys
+import time
+
+from game import Actions
+import verifyReplays
+
+# Games written per transaction.
+BATCH_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY,
+    hash TEXT UNIQUE NOT NULL,
+    source TEXT,
+    red TEXT,
+    blue TEXT,
+    layout TEXT,
+    seed TEXT,
+    starter INTEGER,
+    length INTEGER,
+    moves INTEGER,
+    score INTEGER,
+    stored_score INTEGER,
+    crashed INTEGER,
+    timed_out INTEGER
+);
+CREATE TABLE IF NOT EXISTS moves (
+    game INTEGER NOT NULL REFERENCES games(id),
+    move INTEGER NOT NULL,
+    agent INTEGER NOT NULL,
+    action TEXT,
+    x INTEGER,
+    y INTEGER,
+    is_pacman INTEGER,
+    num_carrying INTEGER,
+    score_delta INTEGER,
+    food_eaten INTEGER,
+    capsule_eaten INTEGER,
+    food_returned INTEGER,
+    died INTEGER,
+    kills INTEGER,
+    PRIMARY KEY (game, move)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS deaths (
+    game INTEGER NOT NULL REFERENCES games(id),
+    move INTEGER NOT NULL,
+    agent INTEGER NOT NULL,
+    x INTEGER,
+    y INTEGER,
+    num_carrying INTEGER
+);
+CREATE INDEX IF NOT EXISTS games_red ON games(red);
+CREATE INDEX IF NOT EXISTS games_blue ON games(blue);
+CREATE INDEX IF NOT EXISTS games_layout ON games(layout);
+CREATE INDEX IF NOT EXISTS moves_agent ON moves(game, agent);
+CREATE INDEX IF NOT EXISTS deaths_game ON deaths(game, agent);
+CREATE INDEX IF NOT EXISTS deaths_carrying ON deaths(num_carrying);
+CREATE VIEW IF NOT EXISTS team_moves AS
+    SELECT moves.*, CASE moves.agent % 2 WHEN 0 THEN games.red ELSE games.blue END AS team
+    FROM moves JOIN games ON games.id = moves.game;
+CREATE VIEW IF NOT EXISTS team_deaths AS
+    SELECT deaths.*, CASE deaths.agent % 2 WHEN 0 THEN games.red ELSE games.blue END AS team
+    FROM deaths JOIN games ON games.id = deaths.game;
+"""
+
+
+def openDatabase(filename):
+    connection = sqlite3.connect(filename)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _position(agentState):
+    x, y = agentState.configuration.pos
+    return int(x), int(y)
+
+
+def gameFacts(data):
+    """
+    Re-simulates a replay.  Returns (game, moves, deaths): a dict of game
+    columns and lists of move and death rows without the game id.
+    """
+    recorded = verifyReplays.loadReplay(data)
+
+    moves = []
+    deaths = []
+    state = recorded.initialState()
+    # Moves are numbered from 1, as in events.py.
+    for number, (agentIndex, action) in enumerate(recorded.actions, 1):
+        before = state.data.agentStates
+        state = state.generateSuccessor(agentIndex, action)
+        after = state.data.agentStates
+        stateData = state.data
+        ate = int(stateData._foodEaten is not None)
+        kills = 0
+        died = 0
+        # Agents die by being sent back to their start.  Like
+        # CaptureRules.moveEvents, place the death where the moving agent
+        # was going, or where the other agent stood.
+        for index, (old, new) in enumerate(zip(before, after)):
+            if index == agentIndex:
+                position = Actions.getSuccessor(old.configuration.pos, action)
+                if new.configuration.pos == position:
+                    continue
+                died = 1
+            elif new.configuration.pos == old.configuration.pos:
+                continue
+            else:
+                position = old.configuration.pos
+                kills += 1
+            carried = old.numCarrying + (ate if index == agentIndex else 0)
+            deaths.append((number, index, int(position[0]), int(position[1]), carried))
+        mover = after[agentIndex]
+        moves.append((number, agentIndex, action) + _position(mover) + (
+            int(mover.isPacman), mover.numCarrying, stateData.scoreChange, ate,
+            int(stateData._capsuleEaten is not None),
+            mover.numReturned - before[agentIndex].numReturned, died, kills))
+
+    game = {'red': recorded.redTeamName, 'blue': recorded.blueTeamName,
+            'layout': recorded.fingerprint, 'seed': recorded.seed,
+            'starter': recorded.starter, 'length': recorded.length,
+            'moves': len(recorded.actions), 'score': state.data.score,
+            'stored_score': recorded.score, 'crashed': int(recorded.crashed),
+            'timed_out': int(recorded.timedOut)}
+    return game, moves, deaths
+
+
+def _factsTask(task):
+    name, digest, data = task
+    try:
+        return name, digest, gameFacts(data), None
+    except Exception as e:
+        return name, digest, None, '%s: %s' % (type(e).__name__, e)
+
+
+def _newReplays(known, paths):
+    # Runs in the pool's task thread, so it must not touch the connection.
+    for name, data in verifyReplays.findReplays(paths):
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in known:
+            known.add(digest)
+            yield name, digest, data
+
+
+def ingest(connection, paths, processes=None, batchSize=BATCH_SIZE):
+    """
+    Adds all replays in paths that are not in the database yet.  Returns
+    the number of games added and a list of (name, error) for replays that
+    could not be read.
+    """
+    added = 0
+    errors = []
+    columns = ('hash', 'source', 'red', 'blue', 'layout', 'seed', 'starter', 'length',
+               'moves', 'score', 'stored_score', 'crashed', 'timed_out')
+    insertGame = 'INSERT INTO games (%s) VALUES (%s)' % (', '.join(columns), ', '.join('?' * len(columns)))
+    known = set(row[0] for row in connection.execute('SELECT hash FROM games'))
+    with multiprocessing.Pool(processes) as pool:
+        pending = 0
+        for name, digest, facts, error in pool.imap_unordered(_factsTask, _newReplays(known, paths), 4):
+            if error is not None:
+                errors.append((name, error))
+                continue
+            game, moves, deaths = facts
+            game.update(hash=digest, source=name)
+            gameId = connection.execute(insertGame, [game[c] for c in columns]).lastrowid
+            connection.executemany('INSERT INTO moves VALUES (%s)' % ', '.join('?' * 14),
+                                   [(gameId,) + row for row in moves])
+            connection.executemany('INSERT INTO deaths VALUES (?, ?, ?, ?, ?, ?)',
+                                   [(gameId,) + row for row in deaths])
+            added += 1
+            pending += 1
+            if pending >= batchSize:
+                connection.commit()
+                pending = 0
+    connection.commit()
+    return added, errors
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="""Loads replays into an
+            SQLite database with one row per move and per death.""")
+    parser.add_argument('database', help="SQLite database file.")
+    parser.add_argument('paths', nargs='*',
+            help="Replay files, directories, glob patterns or result zips.")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+            help="Number of worker processes (default: number of CPUs).")
+    parser.add_argument('-q', '--query', default=None,
+            help="SQL query to run after loading.")
+    args = parser.parse_args(argv)
+
+    connection = openDatabase(args.database)
+    if args.paths:
+        start = time.perf_counter()
+        added, errors = ingest(connection, args.paths, args.jobs)
+        for name, error in errors:
+            print('%s: %s' % (name, error), file=sys.stderr)
+        print('Added %d games in %.1fs' % (added, time.perf_counter() - start))
+    if args.query:
+        start = time.perf_counter()
+        cursor = connection.execute(args.query)
+        rows = cursor.fetchall()
+        elapsed = time.perf_counter() - start
+        if cursor.description:
+            print('\t'.join(column[0] for column in cursor.description))
+        for row in rows:
+            print('\t'.join(str(value) for value in row))
+        print('%d rows in %.1fms' % (len(rows), elapsed * 1e3))
+    connection.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,146 @@
+# resultsCache.py
+# ---------------
+# Results of earlier tournaments, for playing only what changed.
+
+"""
+The results cache of competition.py --incremental.
+
+A tournament that is run again after some teams changed only needs to play
+the pairings with a changed team.  ResultsCache keeps the results and files
+of every task by everything that decides its outcome, so the other tasks
+are taken from it instead.
+"""
+
+import hashlib
+import importlib
+import json
+import os
+import sqlite3
+
+# Modules whose source determines the outcome of a game.
+ENGINE_MODULES = ('capture', 'game', 'layout', 'util', 'captureAgents',
+        'distanceCalculator', 'mazeGenerator', 'agentSandbox')
+
+
+def source_fingerprint(module):
+    """
+    Returns the sha256 of the source of a module: its file, or all Python
+    files of a package.
+    """
+    digest = hashlib.sha256()
+    path = module.__file__
+    if os.path.basename(path) == "__init__.py":
+        files = []
+        for root, dirs, names in os.walk(os.path.dirname(path)):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith(".py"))
+    else:
+        files = [path]
+    for filename in files:
+        digest.update(os.path.relpath(filename, os.path.dirname(path)).encode("utf-8"))
+        with open(filename, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def engine_fingerprint(options):
+    """
+    Returns a digest of everything besides the teams, layout and seed that
+    changes the outcome of a game: the source of ENGINE_MODULES and options,
+    any value with a stable repr such as a tuple of the game options.
+    """
+    digest = hashlib.sha256()
+    for name in ENGINE_MODULES:
+        digest.update(source_fingerprint(importlib.import_module(name)).encode("ascii"))
+    digest.update(repr(options).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultsCache:
+    """
+    Results of the tasks of earlier tournaments, in an SQLite database.
+
+    A task's results are keyed by the source fingerprints of both teams, the
+    layout fingerprint, the seeds of its games (game_seeds(red_name,
+    blue_name, game_numbers)), the engine fingerprint (see
+    engine_fingerprint) and its game numbers.  A pairing in which neither
+    team changed is found again on the next run, whichever side each team
+    plays on.  The files the task wrote (replays, agent output, events and
+    timings) are kept with its results and written again when it is found.
+    """
+    SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    red_hash TEXT NOT NULL,
+    blue_hash TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    seed TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    games TEXT NOT NULL,
+    results TEXT NOT NULL,
+    PRIMARY KEY (red_hash, blue_hash, layout, seed, engine, games)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS files (
+    red_hash TEXT NOT NULL,
+    blue_hash TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    seed TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    games TEXT NOT NULL,
+    name TEXT NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (red_hash, blue_hash, layout, seed, engine, games, name)
+) WITHOUT ROWID;
+"""
+    KEY = "red_hash = ? AND blue_hash = ? AND layout = ? AND seed = ? AND engine = ? AND games = ?"
+
+    def __init__(self, filename, team_hashes, layout_fingerprint, game_seeds, engine):
+        self.team_hashes = team_hashes
+        self.layout = layout_fingerprint
+        self.game_seeds = game_seeds
+        self.engine = engine
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(self.SCHEMA)
+
+    def _key(self, red_name, blue_name, game_numbers):
+        return (self.team_hashes[red_name], self.team_hashes[blue_name], self.layout,
+                ",".join(self.game_seeds(red_name, blue_name, game_numbers)), self.engine,
+                ",".join(str(game) for game in game_numbers))
+
+    def lookup(self, task, output_dir):
+        """
+        Returns the cached results of task and writes its files to
+        output_dir, or returns None.
+        """
+        _, (red_name, _), (blue_name, _), game_numbers = task
+        for red, blue in ((red_name, blue_name), (blue_name, red_name)):
+            key = self._key(red, blue, game_numbers)
+            row = self._connection.execute(
+                    "SELECT results FROM results WHERE " + self.KEY, key).fetchone()
+            if row is not None:
+                for name, data in self._connection.execute(
+                        "SELECT name, data FROM files WHERE " + self.KEY, key):
+                    with open(os.path.join(output_dir, name), "wb") as f:
+                        f.write(data)
+                return [[red, blue] + result[2:] for result in json.loads(row[0])]
+        return None
+
+    def store(self, task, results, output_dir, names):
+        """
+        Stores the results of task and the files of output_dir it wrote,
+        names.
+        """
+        _, (red_name, _), (blue_name, _), game_numbers = task
+        key = self._key(red_name, blue_name, game_numbers)
+        with self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    key + (json.dumps([list(r) for r in results]),))
+            self._connection.execute("DELETE FROM files WHERE " + self.KEY, key)
+            for name in names:
+                with open(os.path.join(output_dir, name), "rb") as f:
+                    self._connection.execute("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            key + (name, f.read()))
+
+    def close(self):
+        self._connection.close()
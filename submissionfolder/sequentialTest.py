@@ -0,0 +1,48 @@
+# sequentialTest.py
+# -----------------
+# Ends matches early once their winner is clear.
+
+"""
+The sequential probability ratio test of competition.py --sprt.
+
+Instead of playing every match to --numGames games, a tournament with --sprt
+stops handing out the games of a match once the test has settled which of
+its two teams is the better one.  See Wald, "Sequential tests of statistical
+hypotheses" (1945).
+"""
+
+import collections
+import math
+
+
+class SequentialTest:
+    """
+    Wald's sequential probability ratio test of the winner of every match.
+
+    The two hypotheses are that one team or the other wins a decisive game
+    with probability p.  Every win of a team adds log(p / (1 - p)) to the log
+    likelihood ratio in its favour; ties add nothing.  A match is settled once
+    the ratio passes log((1 - alpha) / alpha), so the test names the wrong
+    winner with probability at most alpha.  With the defaults a match is
+    settled when one team has won five decisive games more than the other.
+    """
+    def __init__(self, p=0.75, alpha=0.01):
+        self.step = math.log(p / (1 - p))
+        self.bound = math.log((1 - alpha) / alpha)
+        self._balance = collections.Counter()
+
+    @staticmethod
+    def _key(leftTeam, rightTeam):
+        return (leftTeam, rightTeam) if leftTeam < rightTeam else (rightTeam, leftTeam)
+
+    def add_game(self, leftTeam, rightTeam, score):
+        """
+        Adds a game that leftTeam won (score 1), tied (0.5) or lost (0).
+        """
+        if score == 0.5:
+            return
+        key = self._key(leftTeam, rightTeam)
+        self._balance[key] += 1 if (score > 0.5) == (key[0] == leftTeam) else -1
+
+    def settled(self, leftTeam, rightTeam):
+        return abs(self._balance[self._key(leftTeam, rightTeam)]) * self.step >= self.bound
@@ -0,0 +1,117 @@
+# supervisor.py
+# -------------
+# Runs code that may hang or crash in a process that can be killed.
+
+"""
+A supervisor for the games of competition.py.
+
+run(target, limit) calls target in a child process forked from the caller,
+so the child shares everything the caller loaded, and kills it when it runs
+longer than limit seconds.  Code that blocks signals or hangs in C code can
+thus not hang the caller.  The child reports which agent was moving in a
+shared turn marker, so that a killed or crashed game can be blamed on it.
+
+The child sends its log records over the pipe of its result as it makes
+them, so they are logged in order with those of other children.  A killed
+child cannot leave a lock of the caller's logging taken.
+"""
+
+import logging
+import logging.handlers
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Killed(Exception):
+    """
+    The child was killed or died before it returned.  reason says why, and
+    turn is the value the child last set in its turn marker, or None.
+    """
+    def __init__(self, reason, turn=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.turn = turn
+
+
+class PipeHandler(logging.handlers.QueueHandler):
+    """
+    Sends log records as ("log", record) over a multiprocessing Connection.
+    """
+    def enqueue(self, record):
+        self.queue.send(("log", record))
+
+
+def run(target, limit, memory_limit=None):
+    """
+    Returns target(turn) called in a child process, where turn is a shared
+    multiprocessing RawValue('b') that starts at -1.
+
+    The child is killed after limit seconds, and its address space is
+    limited to memory_limit megabytes if given.  Raises Killed if the child
+    does not return, and RuntimeError with the repr of the exception if
+    target raises one.
+    """
+    context = multiprocessing.get_context("fork")
+    turn = context.RawValue('b', -1)
+    receiver, sender = context.Pipe(duplex=False)
+    # The temporary directories of a killed child are removed with scratch.
+    scratch = tempfile.mkdtemp(prefix="pacman-task-")
+    child = context.Process(target=_child,
+            args=(target, turn, sender, scratch, memory_limit))
+    deadline = time.monotonic() + limit
+    try:
+        child.start()
+        sender.close()
+        message = None
+        timed_out = False
+        while True:
+            timed_out = not receiver.poll(max(deadline - time.monotonic(), 0))
+            if timed_out:
+                break
+            try:
+                message = receiver.recv()
+            except EOFError:
+                break
+            if message[0] != "log":
+                break
+            logging.getLogger().handle(message[1])
+            message = None
+        if message is not None:
+            _, status, value = message
+            if status == "error":
+                raise RuntimeError(value)
+            return value
+        if timed_out:
+            reason = "exceeded {:.0f} s".format(limit)
+            child.kill()
+        else:
+            child.join()
+            reason = "died with exit code {}".format(child.exitcode)
+    finally:
+        child.join()
+        receiver.close()
+        shutil.rmtree(scratch, ignore_errors=True)
+    raise Killed(reason, turn.value if turn.value >= 0 else None)
+
+
+def _child(target, turn, sender, scratch, memory_limit):
+    """
+    Body of the child process of run.
+    """
+    tempfile.tempdir = scratch
+    logging.getLogger().handlers = [PipeHandler(sender)]
+    if resource is not None and memory_limit:
+        limit = memory_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    try:
+        status, value = "ok", target(turn)
+    except Exception as e:
+        status, value = "error", repr(e)
+    sender.send(("result", status, value))
@@ -0,0 +1,70 @@
+import glob
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules under test live next to this directory, not in a package.
+sys.path.insert(0, HERE)
+
+
+@pytest.fixture
+def tournament(tmp_path):
+    """
+    A copy of the game in tmp_path with three students that play
+    baselineTeam, for running competition.py in.
+    """
+    for name in glob.glob(os.path.join(HERE, "*.py")):
+        shutil.copy(name, tmp_path)
+    shutil.copytree(os.path.join(HERE, "layouts"), tmp_path / "layouts")
+    students = tmp_path / "students"
+    students.mkdir()
+    teams = ["alpha", "beta", "gamma"]
+    for team in teams:
+        shutil.copy(os.path.join(HERE, "baselineTeam.py"), students / (team + ".py"))
+    (students / "__init__.py").write_text(
+            "_IMPORT_ERRORS = []\nfrom . import {}\n".format(", ".join(teams)))
+    with open(tmp_path / "test.secrets", "wb") as f:
+        pickle.dump({key: "x" for key in ("course_name", "host", "port", "user",
+                "sender", "password", "name", "instructor_mail", "download_url")}, f)
+    return tmp_path
+
+
+def competition_command(*options):
+    return [sys.executable, "competition.py", "-D", "-M", "-Q", "-i", "100",
+            "-s", "test.secrets"] + list(options)
+
+
+def run_competition(directory, *options, timeout=300):
+    subprocess.run(competition_command(*options), cwd=directory, check=True,
+            timeout=timeout, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def play_game(directory, layoutName="defaultCapture", **options):
+    """
+    Plays baselineTeam against itself without a display in directory and
+    returns the game.  options are passed on to capture.runGames.
+    """
+    import baselineTeam
+    import capture
+    import layout
+    import textDisplay
+
+    gameLayout = layout.getLayout(os.path.join(HERE, "layouts", layoutName))
+    red = baselineTeam.createTeam(0, 2, True)
+    blue = baselineTeam.createTeam(1, 3, False)
+    arguments = dict(layouts=[gameLayout], agents=[red[0], blue[0], red[1], blue[1]],
+            display=textDisplay.NullGraphics(), length=1200, numGames=1, record=False,
+            numTraining=0, redTeamName="red", blueTeamName="blue", seed="test")
+    arguments.update(options)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        return capture.runGames(**arguments)[-1]
+    finally:
+        os.chdir(cwd)
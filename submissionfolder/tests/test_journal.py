@@ -0,0 +1,87 @@
+import collections
+import glob
+import json
+import os
+import re
+import signal
+import subprocess
+import time
+import zipfile
+
+import competition
+import journal
+from conftest import competition_command, run_competition
+
+
+def task(red, blue, games, matchno=1):
+    return (matchno, (red, None), (blue, None), list(games))
+
+
+def test_read_skips_cut_off_line(tmp_path):
+    filename = str(tmp_path / "journal.jsonl")
+    results_journal = journal.Journal(filename)
+    results_journal.append(task("alpha", "beta", [0]), [("alpha", "beta", 1, 5, 1)], seed="s")
+    results_journal.close()
+    with open(filename, "a") as f:
+        f.write('{"match": 2, "red": "al')
+
+    entries = journal.Journal.read(filename)
+    assert entries == [{"match": 1, "red": "alpha", "blue": "beta", "games": [0],
+                        "results": [["alpha", "beta", 1, 5, 1]], "seed": "s"}]
+    # Appending after a crash starts on a new line.
+    results_journal = journal.Journal(filename)
+    results_journal.append(task("beta", "gamma", [1], 2), [])
+    results_journal.close()
+    assert [e["match"] for e in journal.Journal.read(filename)] == [1, 2]
+
+
+def test_resume_tasks_keeps_sides_and_skips_played(tmp_path):
+    scoreboard = competition.Scoreboard()
+    scoreboard.register_participants({"alpha": None, "beta": None, "gamma": None})
+    entries = [{"red": "beta", "blue": "alpha", "games": [0], "results": [["beta", "alpha", 2, 5, 1]]},
+               {"red": "beta", "blue": "alpha", "games": [0], "results": [["beta", "alpha", 2, 5, 1]]},
+               {"red": "delta", "blue": "alpha", "games": [0], "results": [["delta", "alpha", 2, 5, 1]]}]
+    tasks = [task("alpha", "beta", [0]), task("alpha", "beta", [1]), task("gamma", "beta", [0], 2)]
+    remaining = competition.resume_tasks(entries, scoreboard, tasks)
+    assert remaining == [task("beta", "alpha", [1]), task("gamma", "beta", [0], 2)]
+    assert scoreboard.records["beta"]["alpha"].win == 1
+    assert "delta" not in scoreboard.records
+
+
+def archived_journal(directory):
+    archive, = glob.glob(os.path.join(directory, "results", "*.zip"))
+    with zipfile.ZipFile(archive) as zf:
+        name, = [name for name in zf.namelist() if name.endswith("journal.jsonl")]
+        return [json.loads(line) for line in zf.read(name).splitlines() if line.strip()]
+
+
+def test_killed_tournament_resumes(tournament):
+    options = ("-n", "4", "-T", "2", "--seed", "1")
+    run_competition(tournament, *options)
+    complete = archived_journal(tournament)
+    for name in glob.glob(os.path.join(tournament, "results", "*")):
+        os.remove(name)
+
+    process = subprocess.Popen(competition_command(*options), cwd=tournament,
+            start_new_session=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 120
+        while True:
+            names = glob.glob(os.path.join(tournament, "results", "*", "journal.jsonl"))
+            if names and len(journal.Journal.read(names[0])) >= 3:
+                break
+            assert time.monotonic() < deadline and process.poll() is None
+            time.sleep(0.05)
+    finally:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    run_competition(tournament, *(options + ("--resume",)))
+
+    with open(tournament / "log.txt") as f:
+        log = f.read()
+    assert re.search(r"Resuming .*: ([1-9]\d*) of \d+ tasks already played", log)
+    entries = archived_journal(tournament)
+    played = collections.Counter((e["red"], e["blue"], tuple(e["games"])) for e in entries)
+    assert set(played.values()) == {1}
+    key = lambda e: (e["red"], e["blue"], e["games"], e["results"])
+    assert sorted(map(key, entries)) == sorted(map(key, complete))
@@ -0,0 +1,25 @@
+import latency
+
+
+def test_bucket_error_is_below_one_32nd():
+    for micros in list(range(0, 5000)) + [10 ** 6 + 7, 123456789]:
+        upper = latency._bucketUpperBound(latency._bucketIndex(micros))
+        assert micros <= upper
+        assert upper - micros <= micros / 32
+
+
+def test_small_values_are_exact():
+    histogram = latency.LatencyHistogram()
+    for micros in range(1, 64):
+        histogram.record(micros / 1e6)
+    assert histogram.percentile(100) == 63 / 1e6
+
+
+def test_merge_adds_counts():
+    a, b = latency.LatencyHistogram(), latency.LatencyHistogram()
+    a.record(0.001)
+    b.record(0.002)
+    b.record(0.5)
+    a.merge(b)
+    assert a.count == 3
+    assert a.max == 500000
@@ -0,0 +1,62 @@
+import gzip
+import logging
+import time
+
+import matchLog
+
+
+def read_log(filename):
+    with open(filename) as f:
+        return f.read()
+
+
+def test_log_is_written_without_stopping(tmp_path):
+    filename = tmp_path / "log.txt"
+    handlers = logging.getLogger().handlers
+    matchLog.start_logging(filename)
+    try:
+        logging.info("first")
+        deadline = time.monotonic() + 10 * matchLog.LOG_FLUSH_INTERVAL
+        while "first" not in read_log(filename):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    finally:
+        matchLog.stop_logging()
+        logging.getLogger().handlers = handlers
+
+
+def test_append(tmp_path):
+    filename = tmp_path / "log.txt"
+    handlers = logging.getLogger().handlers
+    try:
+        for append, message in ((False, "first"), (True, "second")):
+            matchLog.start_logging(filename, append=append)
+            logging.info(message)
+            matchLog.stop_logging()
+        assert "first" in read_log(filename) and "second" in read_log(filename)
+        matchLog.start_logging(filename)
+        matchLog.stop_logging()
+        assert read_log(filename) == ""
+    finally:
+        logging.getLogger().handlers = handlers
+
+
+def test_bounded_stream():
+    stream = matchLog.BoundedStream(5)
+    stream.write("abc")
+    stream.write("defgh")
+    assert stream.getvalue().startswith("abcde")
+    assert "3 more characters dropped" in stream.getvalue()
+
+
+def test_match_log_writes_non_empty_streams(tmp_path):
+    log = matchLog.MatchLog(100)
+    log.stream("engine").write("engine output\n")
+    log.stream("agent 0")
+    filename = tmp_path / "output.txt.gz"
+    log.write(filename)
+    with gzip.open(filename, "rt") as f:
+        assert f.read() == "==> engine <==\nengine output\n\n"
+    empty = tmp_path / "empty.txt.gz"
+    matchLog.MatchLog(100).write(empty)
+    assert not empty.exists()
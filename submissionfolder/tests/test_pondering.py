@@ -0,0 +1,73 @@
+import time
+
+import baselineTeam
+from conftest import play_game
+
+
+class PonderingAgent(baselineTeam.OffensiveReflexAgent):
+    def registerInitialState(self, gameState):
+        baselineTeam.OffensiveReflexAgent.registerInitialState(self, gameState)
+        self.sonar = []
+        self.pondered = []
+
+    def chooseAction(self, gameState):
+        self.sonar.append(gameState.getAgentDistances())
+        return baselineTeam.OffensiveReflexAgent.chooseAction(self, gameState)
+
+    def ponder(self, gameState):
+        self.pondered.append(gameState is self.observationHistory[-1])
+        while not self.shouldStopPondering():
+            time.sleep(0.001)
+
+
+def play(tmp_path, **options):
+    agents = [PonderingAgent(index) for index in range(4)]
+    play_game(tmp_path, agents=agents, length=200, catchExceptions=True, **options)
+    return agents
+
+
+def test_ponder_gets_the_observation_of_the_move(tmp_path):
+    pondering = play(tmp_path, allowPondering=True, chargeCpuTime=True)
+    plain = play(tmp_path, chargeCpuTime=True)
+    for agent in pondering:
+        assert agent.pondered and all(agent.pondered)
+    # Pondering draws no sonar noise of its own.
+    assert [a.sonar for a in pondering] == [a.sonar for a in plain]
+
+
+def test_no_pondering_in_process_on_wall_clock_time(tmp_path):
+    agents = play(tmp_path, allowPondering=True)
+    assert not any(agent.pondered for agent in agents)
+
+
+def test_sandboxed_pondering_is_reproducible(tmp_path):
+    first = play_game(tmp_path, length=200, sandboxAgents=True, allowPondering=True)
+    second = play_game(tmp_path, length=200, sandboxAgents=True, allowPondering=True)
+    assert first.moveHistory == second.moveHistory
+
+
+class StubbornAgent(PonderingAgent):
+    def registerInitialState(self, gameState):
+        PonderingAgent.registerInitialState(self, gameState)
+        self.pondering = False
+        self.raced = False
+
+    def chooseAction(self, gameState):
+        self.raced = self.raced or self.pondering
+        return PonderingAgent.chooseAction(self, gameState)
+
+    def ponder(self, gameState):
+        # Ignores shouldStopPondering.
+        self.pondering = True
+        time.sleep(4)
+        self.pondering = False
+
+
+def test_agent_that_does_not_stop_pondering_times_out(tmp_path):
+    agents = [PonderingAgent(0), StubbornAgent(1), PonderingAgent(2), PonderingAgent(3)]
+    game = play_game(tmp_path, agents=agents, length=200, catchExceptions=True,
+            allowPondering=True, chargeCpuTime=True)
+    assert game.agentCrashed and game.agentTimeout
+    assert game.state.data.score == 1
+    assert not agents[1].raced
+    assert len(agents[1].sonar) == 1
@@ -0,0 +1,131 @@
+import itertools
+import random
+
+import pytest
+
+import competition
+import ratings
+
+
+def test_new_team_has_initial_rating():
+    r = ratings.Ratings()
+    r.add("alpha")
+    assert r.rating("alpha") == (ratings.INITIAL_RATING, ratings.INITIAL_DEVIATION)
+    assert r.rating("unknown") == (ratings.INITIAL_RATING, ratings.INITIAL_DEVIATION)
+    assert r.max_deviation() == ratings.INITIAL_DEVIATION
+
+
+def test_update_is_symmetric_and_shrinks_deviations():
+    r = ratings.Ratings()
+    r.add_game("alpha", "beta", 1)
+    r.end_period()
+    (alpha, alpha_rd), (beta, beta_rd) = r.rating("alpha"), r.rating("beta")
+    assert alpha > ratings.INITIAL_RATING > beta
+    assert alpha - ratings.INITIAL_RATING == pytest.approx(ratings.INITIAL_RATING - beta)
+    assert alpha_rd == pytest.approx(beta_rd) and alpha_rd < ratings.INITIAL_DEVIATION
+
+    # Swapping the sides of a game swaps the outcome.
+    other = ratings.Ratings()
+    other.add_game("beta", "alpha", 0)
+    other.end_period()
+    assert other.rating("alpha") == pytest.approx(r.rating("alpha"))
+
+    tie = ratings.Ratings()
+    tie.add_game("alpha", "beta", 0.5)
+    tie.end_period()
+    assert tie.rating("alpha")[0] == pytest.approx(ratings.INITIAL_RATING)
+    assert tie.rating("alpha")[1] < ratings.INITIAL_DEVIATION
+
+
+def test_games_only_count_at_the_end_of_the_period():
+    r = ratings.Ratings()
+    r.add_game("alpha", "beta", 1)
+    assert r.rating("alpha") == (ratings.INITIAL_RATING, ratings.INITIAL_DEVIATION)
+    r.add_game("alpha", "gamma", 1)
+    r.end_period()
+    # Both games count against the initial ratings of the opponents.
+    assert r.rating("beta") == r.rating("gamma")
+    assert r.rating("alpha")[0] > ratings.INITIAL_RATING
+
+
+def test_expected_score():
+    even = (1500.0, 100.0)
+    assert ratings.Ratings.expected(even, even) == pytest.approx(0.5)
+    strong, weak = (1900.0, 50.0), (1500.0, 50.0)
+    assert ratings.Ratings.expected(strong, weak) == pytest.approx(
+            1 - ratings.Ratings.expected(weak, strong))
+    assert ratings.Ratings.expected(strong, weak) > 0.9
+    # An uncertain opponent pulls the expectation towards one half.
+    assert ratings.Ratings.expected(strong, (1500.0, 350.0)) < ratings.Ratings.expected(strong, weak)
+
+
+def test_ratings_order_teams_by_strength():
+    rng = random.Random(0)
+    strength = {"alpha": 0.9, "beta": 0.5, "gamma": 0.1}
+    r = ratings.Ratings()
+    for _ in range(10):
+        for _ in range(10):
+            left, right = rng.sample(sorted(strength), 2)
+            p = 0.5 + (strength[left] - strength[right]) / 2
+            r.add_game(left, right, float(rng.random() < p))
+        r.end_period()
+    assert [team for team, _, _ in r.ranking()] == ["alpha", "beta", "gamma"]
+    assert r.max_deviation() < 100
+
+
+def scoreboard(teams):
+    board = competition.Scoreboard(rank_by_rating=True)
+    board.rng = random.Random(0)
+    board.register_participants({team: None for team in teams})
+    return board
+
+
+def test_swiss_pairs_neighbours_and_avoids_rematches():
+    board = scoreboard("abcd")
+    # a > b > c > d
+    for winner, loser in itertools.combinations("abcd", 2):
+        board.add_result(winner, loser, 1)
+    board.end_rating_period()
+    pairs = lambda played=(): sorted(
+            sorted(team for team, _ in match) for match in board.make_swiss_pairings(played))
+    assert pairs() == [["a", "b"], ["c", "d"]]
+    played = {frozenset("ab"), frozenset("cd")}
+    assert pairs(played) == [["a", "c"], ["b", "d"]]
+    # Once every rival has been played, rematches are allowed.
+    everything = {frozenset(pair) for pair in itertools.combinations("abcd", 2)}
+    assert pairs(everything) == [["a", "b"], ["c", "d"]]
+
+
+def test_swiss_odd_team_sits_out():
+    board = scoreboard("abcde")
+    for winner, loser in itertools.combinations("abcde", 2):
+        board.add_result(winner, loser, 1)
+    board.end_rating_period()
+    matches = board.make_swiss_pairings()
+    assert len(matches) == 2
+    assert "e" not in {team for match in matches for team, _ in match}
+
+
+def test_swiss_round_does_not_depend_on_the_order_of_results():
+    teams = ["t{}".format(i) for i in range(8)]
+    rng = random.Random(1)
+    first_round = [(a, b, rng.choice([-2, 0, 3])) for a, b in zip(teams[::2], teams[1::2])
+            for _ in range(3)]
+    second_round = [(a, b, rng.choice([-2, 0, 3])) for a, b in zip(teams[:4], teams[4:])
+            for _ in range(3)]
+    boards = []
+    for order in range(2):
+        board = scoreboard(teams)
+        for results in (first_round, second_round):
+            results = list(results)
+            random.Random(order).shuffle(results)
+            for result in results:
+                board.add_result(*result)
+            board.end_rating_period()
+        boards.append(board)
+    first, second = boards
+    assert [first.ratings.rating(team) for team in teams] == [
+            second.ratings.rating(team) for team in teams]
+    pairings = [[[name for name, _ in match] for match in board.make_swiss_pairings()]
+            for board in boards]
+    assert pairings[0] == pairings[1]
@@ -0,0 +1,66 @@
+import collections
+import glob
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import time
+import zipfile
+
+from conftest import competition_command
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def journal_lines(directory):
+    names = glob.glob(os.path.join(directory, "results", "*", "journal.jsonl"))
+    if not names:
+        return 0
+    with open(names[0]) as f:
+        return sum(1 for line in f if line.strip())
+
+
+def test_killed_worker_loses_no_tasks(tournament):
+    env = dict(os.environ, COMPETITION_AUTHKEY="test")
+    address = "127.0.0.1:{}".format(free_port())
+    server = subprocess.Popen(competition_command("-n", "4", "--seed", "1", "--serve", address),
+            cwd=tournament, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Every worker gets a session of its own, so that killing it kills the
+    # processes of its pool too, as if its machine went down.
+    workers = [subprocess.Popen(competition_command("-T", "1", "--worker", address),
+            cwd=tournament, env=env, start_new_session=True,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for _ in range(3)]
+    try:
+        deadline = time.monotonic() + 120
+        while journal_lines(tournament) < 2:
+            assert time.monotonic() < deadline and server.poll() is None
+            time.sleep(0.1)
+        os.killpg(workers[0].pid, signal.SIGKILL)
+        assert server.wait(timeout=300) == 0
+    finally:
+        for worker in workers:
+            try:
+                os.killpg(worker.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            worker.wait()
+
+    with open(tournament / "log.txt") as f:
+        log = f.read()
+    tasks = int(re.search(r"A total of \d+ matches \((\d+) tasks\)", log).group(1))
+    archive, = glob.glob(os.path.join(tournament, "results", "*.zip"))
+    with zipfile.ZipFile(archive) as zf:
+        journal, = [name for name in zf.namelist() if name.endswith("journal.jsonl")]
+        entries = [json.loads(line) for line in zf.read(journal).splitlines() if line.strip()]
+        replays = [name for name in zf.namelist()
+                if re.fullmatch(r"\w+-\w+-\d+", os.path.basename(name))]
+    played = collections.Counter((e["red"], e["blue"], tuple(e["games"])) for e in entries)
+    assert len(played) == tasks
+    assert set(played.values()) == {1}
+    assert len(replays) == sum(len(e["games"]) for e in entries)
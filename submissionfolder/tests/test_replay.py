@@ -0,0 +1,68 @@
+import replay
+from conftest import play_game
+
+
+def test_varints_round_trip():
+    values = [0, 1, 127, 128, 300, 2 ** 32, 2 ** 70]
+    data = replay.encodeVarints(values)
+    assert replay.decodeVarints(data, 0, len(values)) == (values, len(data))
+    signed = [0, -1, 1, -64, 64, -2 ** 40]
+    data = b"xx" + replay.encodeVarints(signed, signed=True)
+    assert replay.decodeVarints(data, 2, len(signed), signed=True) == (signed, len(data))
+
+
+def test_recorded_game_round_trip(tmp_path):
+    game = play_game(tmp_path, record=True, length=400)
+    recorded = replay.loadReplay(str(tmp_path / "replay-0"))
+    assert recorded.complete
+    assert recorded.actions == game.moveHistory
+    assert recorded.score == game.state.data.score
+    assert (recorded.redTeamName, recorded.blueTeamName) == ("red", "blue")
+    assert recorded.starter == game.startingIndex
+    assert recorded.seed == "test-0"
+    assert recorded.length == 400
+    info = recorded.moveInfo(0)
+    assert info["computeTime"] is not None and len(info["sonar"]) == 4
+
+
+def test_cut_off_replay_keeps_its_moves(tmp_path):
+    play_game(tmp_path, record=True, length=400)
+    with open(tmp_path / "replay-0", "rb") as f:
+        data = f.read()
+    whole = replay.parseReplay(data)
+    for size in range(len(data) - 1, 0, -7):
+        cut = replay.parseReplay(data[:size])
+        assert not cut.complete and cut.score is None
+        assert cut.actions == whole.actions[:len(cut.actions)]
+        if len(cut.actions) < len(whole.actions) // 2:
+            break
+    assert cut.actions
+
+
+def test_detached_layout(tmp_path):
+    play_game(tmp_path, record=True, length=100)
+    with open(tmp_path / "replay-0", "rb") as f:
+        data = f.read()
+    fingerprint, layoutText, detached = replay.detachLayout(data)
+    assert len(detached) < len(data)
+    assert replay.attachLayout(detached, layoutText) == data
+    recorded = replay.parseReplay(detached, {fingerprint: layoutText})
+    assert recorded.actions == replay.parseReplay(data).actions
+
+
+def test_checkpoints_and_seek(tmp_path):
+    play_game(tmp_path, record=True, length=400)
+    recorded = replay.loadReplay(str(tmp_path / "replay-0"))
+    assert [move for move, payload in recorded.checkpoints] == list(
+            range(replay.CHECKPOINT_EVERY, len(recorded.actions) + 1, replay.CHECKPOINT_EVERY))
+
+    states = [recorded.initialState()]
+    for agentIndex, action in recorded.actions:
+        states.append(states[-1].generateSuccessor(agentIndex, action))
+    for move, payload in recorded.checkpoints:
+        assert states[0].fromBytes(states[0], payload).toBytes() == states[move].toBytes()
+    for move in (0, 1, 99, 100, 101, 250, 399, 400):
+        seeked = recorded.seek(move)
+        assert seeked == states[move]
+        assert seeked.toBytes() == states[move].toBytes()
+    assert recorded.seek(10 ** 6).toBytes() == states[-1].toBytes()
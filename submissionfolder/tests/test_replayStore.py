@@ -0,0 +1,18 @@
+import json
+
+import replayStore
+from conftest import play_game
+
+
+def test_deaths_match_engine_events(tmp_path):
+    play_game(tmp_path, record=True, recordEvents=True)
+    with open(tmp_path / "replay-0", "rb") as f:
+        game, moves, deaths = replayStore.gameFacts(f.read())
+    with open(tmp_path / "events-0.jsonl") as f:
+        events = [json.loads(line) for line in f]
+
+    assert [row[0] for row in moves] == [e["move"] for e in events if e["type"] == "move"]
+    expected = [(e["move"], e["agent"]) + tuple(e["position"]) + (e["carrying"],)
+            for e in events if e["type"] == "death"]
+    assert expected
+    assert deaths == expected
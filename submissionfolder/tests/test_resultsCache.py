@@ -0,0 +1,98 @@
+import glob
+import os
+import re
+import subprocess
+import zipfile
+
+import competition
+import resultsCache
+from conftest import competition_command, run_competition
+
+HASHES = {"alpha": "a", "beta": "b", "gamma": "c"}
+RESULTS = [("alpha", "beta", 3, 2, 0)]
+
+
+def make_cache(directory, seed="1", hashes=HASHES):
+    return resultsCache.ResultsCache(str(directory / "cache.sqlite"), hashes, "layout",
+            lambda red, blue, games: [competition.game_seed(seed, red, blue, g) for g in games],
+            "engine")
+
+
+def task(red, blue, games=(0,)):
+    return (1, (red, None), (blue, None), list(games))
+
+
+def test_lookup_returns_results_and_files(tmp_path):
+    played, restored = tmp_path / "played", tmp_path / "restored"
+    played.mkdir()
+    restored.mkdir()
+    (played / "alpha-beta-0").write_bytes(b"replay")
+    (played / "alpha-beta-0-output.txt.gz").write_bytes(b"output")
+    (played / "alpha-gamma-0").write_bytes(b"other task")
+    cache = make_cache(tmp_path)
+    cache.store(task("alpha", "beta"), RESULTS, str(played),
+            ["alpha-beta-0", "alpha-beta-0-output.txt.gz"])
+
+    assert cache.lookup(task("alpha", "beta"), str(restored)) == [list(r) for r in RESULTS]
+    assert sorted(os.listdir(restored)) == ["alpha-beta-0", "alpha-beta-0-output.txt.gz"]
+    assert (restored / "alpha-beta-0").read_bytes() == b"replay"
+    assert cache.lookup(task("alpha", "beta", (1,)), str(restored)) is None
+    cache.close()
+
+
+def test_other_seed_or_code_misses(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.store(task("alpha", "beta"), RESULTS, str(tmp_path), [])
+    cache.close()
+    for other in (make_cache(tmp_path, seed="2"), make_cache(tmp_path, hashes=dict(HASHES, beta="x"))):
+        assert other.lookup(task("alpha", "beta"), str(tmp_path)) is None
+        other.close()
+    cache = make_cache(tmp_path)
+    assert cache.lookup(task("alpha", "beta"), str(tmp_path)) is not None
+    cache.close()
+
+
+def test_incremental_needs_seed(tournament):
+    process = subprocess.run(competition_command("--incremental"), cwd=tournament,
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    assert process.returncode != 0
+    assert "--incremental needs --seed" in process.stderr
+
+
+def archived_replays(archive):
+    with zipfile.ZipFile(archive) as zf:
+        return {os.path.basename(name): zf.read(name) for name in zf.namelist()
+                if re.fullmatch(r"\w+-\w+-\d+", os.path.basename(name))}
+
+
+def test_incremental_run_archives_cached_replays(tournament):
+    run_competition(tournament, "-n", "2", "--seed", "1", "--incremental")
+    first, = glob.glob(os.path.join(tournament, "results", "*.zip"))
+    os.rename(first, first + ".first")
+    run_competition(tournament, "-n", "2", "--seed", "1", "--incremental")
+    second, = glob.glob(os.path.join(tournament, "results", "*.zip"))
+    with open(tournament / "log.txt") as f:
+        assert re.search(r"([1-9]\d*) of \1 tasks were cached", f.read())
+    replays = archived_replays(second)
+    assert len(replays) == 6
+    assert replays == archived_replays(first + ".first")
+
+
+def test_task_files(tmp_path):
+    for name in ("alpha-beta-3", "alpha-beta-4", "alpha-beta-3-output.txt.gz",
+            "alpha-beta-events-4.jsonl", "alpha-beta-5", "beta-alpha-3"):
+        (tmp_path / name).write_bytes(b"")
+    assert sorted(competition.task_files(str(tmp_path), task("alpha", "beta", (3, 4)))) == [
+            "alpha-beta-3", "alpha-beta-3-output.txt.gz", "alpha-beta-4", "alpha-beta-events-4.jsonl"]
+
+
+def test_engine_fingerprint_covers_options():
+    assert resultsCache.engine_fingerprint((1200, 2)) == resultsCache.engine_fingerprint((1200, 2))
+    assert resultsCache.engine_fingerprint((1200, 2)) != resultsCache.engine_fingerprint((1200, 3))
+
+
+def test_pondering_misses_the_cache(tournament):
+    run_competition(tournament, "-n", "1", "--seed", "1", "--incremental")
+    run_competition(tournament, "-n", "1", "--seed", "1", "--incremental", "--cpu-time", "--ponder")
+    with open(tournament / "log.txt") as f:
+        assert re.search(r"\b0 of [1-9]\d* tasks were cached", f.read())
@@ -0,0 +1,47 @@
+import baselineTeam
+from conftest import play_game
+
+
+def game_record(game):
+    return game.startingIndex, game.moveHistory, game.state.data.score
+
+
+def test_seed_reproduces_game(tmp_path):
+    first = play_game(tmp_path, length=300)
+    second = play_game(tmp_path, length=300)
+    assert game_record(first) == game_record(second)
+
+
+def test_seed_reproduces_sandboxed_game(tmp_path):
+    first = play_game(tmp_path, length=300, sandboxAgents=True)
+    second = play_game(tmp_path, length=300, sandboxAgents=True)
+    assert game_record(first) == game_record(second)
+    third = play_game(tmp_path, length=300, sandboxAgents=True, seed="other")
+    assert game_record(third) != game_record(first)
+
+
+class SonarAgent(baselineTeam.OffensiveReflexAgent):
+    def registerInitialState(self, gameState):
+        baselineTeam.OffensiveReflexAgent.registerInitialState(self, gameState)
+        self.sonar = []
+
+    def chooseAction(self, gameState):
+        self.sonar.append(gameState.getAgentDistances())
+        return baselineTeam.OffensiveReflexAgent.chooseAction(self, gameState)
+
+
+class PeekingAgent(SonarAgent):
+    def observationFunction(self, gameState):
+        assert not hasattr(gameState, "rng")
+        # Observing again must not change the sonar noise of anybody.
+        for _ in range(5):
+            gameState.makeObservation(self.index)
+        return SonarAgent.observationFunction(self, gameState)
+
+
+def test_agents_cannot_change_the_sonar_noise_of_others(tmp_path):
+    plain = [SonarAgent(index) for index in range(4)]
+    play_game(tmp_path, agents=plain, length=300)
+    peeking = [SonarAgent(0), PeekingAgent(1), SonarAgent(2), SonarAgent(3)]
+    play_game(tmp_path, agents=peeking, length=300)
+    assert [a.sonar for a in plain] == [a.sonar for a in peeking]
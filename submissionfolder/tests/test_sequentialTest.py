@@ -0,0 +1,48 @@
+import math
+
+import pytest
+
+import competition
+import sequentialTest
+
+
+def test_settles_after_five_net_wins_with_defaults():
+    test = sequentialTest.SequentialTest()
+    for _ in range(4):
+        test.add_game("alpha", "beta", 1)
+        assert not test.settled("alpha", "beta")
+    # The sides of a game do not matter.
+    test.add_game("beta", "alpha", 0)
+    assert test.settled("alpha", "beta") and test.settled("beta", "alpha")
+    assert not test.settled("alpha", "gamma")
+
+
+def test_ties_are_ignored_and_wins_cancel():
+    test = sequentialTest.SequentialTest()
+    for _ in range(20):
+        test.add_game("alpha", "beta", 0.5)
+        test.add_game("alpha", "beta", 1)
+        test.add_game("beta", "alpha", 1)
+    assert not test.settled("alpha", "beta")
+
+
+@pytest.mark.parametrize("p, alpha", [(0.75, 0.01), (0.6, 0.05), (0.9, 0.001)])
+def test_bound(p, alpha):
+    # Settles after the fewest net wins whose likelihood ratio reaches
+    # (1 - alpha) / alpha.
+    net = math.ceil(math.log((1 - alpha) / alpha) / math.log(p / (1 - p)))
+    test = sequentialTest.SequentialTest(p, alpha)
+    for _ in range(net - 1):
+        test.add_game("alpha", "beta", 0)
+    assert not test.settled("alpha", "beta")
+    test.add_game("alpha", "beta", 0)
+    assert test.settled("alpha", "beta")
+
+
+def test_game_score():
+    Result = competition.Result
+    assert Result.game_score(3) == 1.0
+    assert Result.game_score(-3) == 0.0
+    assert Result.game_score(0) == 0.5
+    assert Result.game_score(0, Result.WIN, Result.ERROR) == 1.0
+    assert Result.game_score(0, Result.ERROR, Result.ERROR) == 0.5
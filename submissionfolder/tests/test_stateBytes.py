@@ -0,0 +1,66 @@
+import random
+
+import capture
+import layout
+from game import Grid
+from conftest import HERE, play_game
+
+
+def reference_packBits(grid):
+    # Grid.packBits before it was sped up.
+    bits = [grid.width, grid.height]
+    current = 0
+    for i in range(grid.height * grid.width):
+        bit = grid.CELLS_PER_INT - (i % grid.CELLS_PER_INT) - 1
+        x, y = i // grid.height, i % grid.height
+        if grid[x][y]:
+            current += 2 ** bit
+        if (i + 1) % grid.CELLS_PER_INT == 0:
+            bits.append(current)
+            current = 0
+    bits.append(current)
+    return tuple(bits)
+
+
+def random_grid(rng, width, height):
+    grid = Grid(width, height)
+    for x in range(width):
+        for y in range(height):
+            grid[x][y] = rng.random() < 0.3
+    return grid
+
+
+def test_packBits_matches_reference_and_unpacks():
+    rng = random.Random(1)
+    for width, height in ((1, 1), (5, 6), (6, 5), (32, 16), (3, 7)):
+        grid = random_grid(rng, width, height)
+        packed = grid.packBits()
+        assert packed == reference_packBits(grid)
+        assert Grid(width, height, bitRepresentation=packed[2:]) == grid
+
+
+def test_int_round_trip():
+    rng = random.Random(2)
+    grid = random_grid(rng, 32, 16)
+    copy = Grid(32, 16)
+    copy.fromInt(grid.toInt())
+    assert copy == grid
+
+
+def test_state_bytes_round_trip(tmp_path):
+    game = play_game(tmp_path, length=300)
+    gameLayout = layout.getLayout(HERE + "/layouts/defaultCapture")
+    state = capture.GameState()
+    state.initialize(gameLayout, 4)
+    state.data.timeleft = 300
+    states = [state]
+    for agentIndex, action in game.moveHistory:
+        states.append(states[-1].generateSuccessor(agentIndex, action))
+    for state in states[::7] + [states[-1]]:
+        payload = state.toBytes()
+        assert capture.GameState.fromBytes(states[0], payload) == state
+        restored = capture.GameState.fromBytes(gameLayout, payload)
+        assert restored == state and restored.toBytes() == payload
+    # Observations hide the positions of distant opponents.
+    observation = states[-1].makeObservation(0)
+    assert capture.GameState.fromBytes(states[0], observation.toBytes()) == observation
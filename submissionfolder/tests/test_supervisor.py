@@ -0,0 +1,74 @@
+import argparse
+import logging
+import os
+import time
+
+import pytest
+
+import competition
+import supervisor
+
+
+def test_returns_result_and_streams_logs(caplog):
+    def target(turn):
+        logging.getLogger("child").warning("from the child")
+        return [1, 2]
+
+    with caplog.at_level(logging.INFO):
+        assert supervisor.run(target, 10) == [1, 2]
+    record, = [r for r in caplog.records if r.name == "child"]
+    assert record.getMessage() == "from the child"
+    assert record.process != os.getpid()
+
+
+def test_exception_is_raised_in_parent():
+    def target(turn):
+        raise ValueError("bad move")
+
+    with pytest.raises(RuntimeError, match="bad move"):
+        supervisor.run(target, 10)
+
+
+def test_hanging_child_is_killed_and_blamed():
+    def target(turn):
+        turn.value = 3
+        time.sleep(60)
+
+    start = time.monotonic()
+    with pytest.raises(supervisor.Killed) as info:
+        supervisor.run(target, 0.5)
+    assert time.monotonic() - start < 10
+    assert info.value.reason.startswith("exceeded")
+    assert info.value.turn == 3
+
+
+def test_dead_child_outside_agent_code():
+    with pytest.raises(supervisor.Killed) as info:
+        supervisor.run(lambda turn: os._exit(7), 10)
+    assert info.value.reason == "died with exit code 7"
+    assert info.value.turn is None
+
+
+def test_killed_task_counts_against_the_moving_team(monkeypatch):
+    def hang(args, output_dir, task, turn_marker=None):
+        turn_marker.value = 1
+        time.sleep(60)
+
+    monkeypatch.setattr(competition, "play_games", hang)
+    args = argparse.Namespace(
+            game_timeout=0.5, memory_limit=0, numTraining=0)
+    results = competition.play_supervised(args, ".", (1, ("alpha", None), ("beta", None), [0, 1]))
+    Result = competition.Result
+    assert results == [("alpha", "beta", 1, Result.WIN, Result.ERROR)] * 2
+
+
+def test_failed_task_counts_against_both_teams(monkeypatch):
+    def fail(args, output_dir, task, turn_marker=None):
+        raise MemoryError()
+
+    monkeypatch.setattr(competition, "play_games", fail)
+    args = argparse.Namespace(
+            game_timeout=10, memory_limit=0, numTraining=1)
+    results = competition.play_supervised(args, ".", (1, ("alpha", None), ("beta", None), [0, 1, 2]))
+    Result = competition.Result
+    assert results == [("alpha", "beta", 0, Result.ERROR, Result.ERROR)] * 2
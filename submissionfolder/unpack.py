@@ -13,22 +13,30 @@
 
 
 import os, pickle, sys
+import replay
 
 if len(sys.argv) != 3:
   print('Usage: %s stats_file team_name' % sys.argv[0])
   print('Unpacks the stats file of a server into a bunch of replay files.')
+  print('Given a single replay file, prints a summary of the game instead.')
   if len(sys.argv) == 2:
-    d = pickle.load(open(sys.argv[1]))
-    print('Team names:', d.keys())
+    if replay.isBinaryReplay(sys.argv[1]):
+      print(replay.loadReplay(sys.argv[1]).describe())
+    else:
+      d = pickle.load(open(sys.argv[1], 'rb'), encoding="bytes")
+      if 'actions' in d:
+        print(replay.loadReplay(sys.argv[1]).describe())
+      else:
+        print('Team names:', d.keys())
   sys.exit(2)
 
-d = pickle.load(open(sys.argv[1]))
+d = pickle.load(open(sys.argv[1], 'rb'), encoding="bytes")
 user = sys.argv[2]
 k = 0
 print('Unpacking games for', user)
 for g, w in d[user]['gameHistory']:
     k += 1
-    t = {'layout': g.state.data.layout, 'agents': g.agents, 'actions': g.moveHistory, 'length': g.length}
     fname = 'replay_' + user + '_' + str(k)
     print('Game:', fname)
-    pickle.dump(t,open(fname, 'w'))
+    replay.writeReplay(fname, g.state.data.layout, g.moveHistory, g.length,
+                       score=g.state.data.score, starter=g.startingIndex)
@@ -608,32 +608,65 @@ class TimeoutFunctionException(Exception):
     pass
 
 
+# When agents are charged for CPU time, a move is still aborted after this
+# many times its limit in wall-clock time, so an agent that blocks without
+# using the CPU cannot stall the game.
+CPU_TIME_WALL_FACTOR = 2.0
+
 class TimeoutFunction:
-    def __init__(self, function, timeout):
+    """
+    Calls function, raising TimeoutFunctionException when it runs longer
+    than timeout seconds.  Fractions of a second are honoured.
+
+    After every call, wallTime and cpuTime hold the wall-clock time and the
+    CPU time of the calling thread that the call took.  With useCpuTime, the
+    limit applies to the CPU time instead: the call is aborted after
+    CPU_TIME_WALL_FACTOR * timeout wall-clock seconds, and afterwards if it
+    used timeout seconds of CPU time.
+    """
+    def __init__(self, function, timeout, useCpuTime=False):
         self.timeout = timeout
         self.function = function
+        self.useCpuTime = useCpuTime
+        self.wallTime = 0.0
+        self.cpuTime = 0.0
 
     def handle_timeout(self, signum, frame):
         raise TimeoutFunctionException()
 
     def __call__(self, *args, **keyArgs):
+        self.wallTime = 0.0
+        self.cpuTime = 0.0
+        if self.timeout <= 0:
+            self.handle_timeout(None, None)
+        wallLimit = self.timeout
+        if self.useCpuTime:
+            wallLimit *= CPU_TIME_WALL_FACTOR
+        startWall = time.perf_counter()
+        startCpu = time.thread_time()
         # If we have SIGALRM signal, use it to cause an exception if and
         # when this function runs too long.  Otherwise check the time taken
         # after the method has returned, and throw an exception then.
-        if hasattr(signal, 'SIGALRM'):
+        if hasattr(signal, 'setitimer'):
             old = signal.signal(signal.SIGALRM, self.handle_timeout)
-            signal.alarm(self.timeout)
+            signal.setitimer(signal.ITIMER_REAL, wallLimit)
             try:
                 result = self.function(*args, **keyArgs)
             finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
                 signal.signal(signal.SIGALRM, old)
-            signal.alarm(0)
+                self.wallTime = time.perf_counter() - startWall
+                self.cpuTime = time.thread_time() - startCpu
         else:
-            startTime = time.time()
-            result = self.function(*args, **keyArgs)
-            timeElapsed = time.time() - startTime
-            if timeElapsed >= self.timeout:
+            try:
+                result = self.function(*args, **keyArgs)
+            finally:
+                self.wallTime = time.perf_counter() - startWall
+                self.cpuTime = time.thread_time() - startCpu
+            if self.wallTime >= wallLimit:
                 self.handle_timeout(None, None)
+        if self.useCpuTime and self.cpuTime >= self.timeout:
+            self.handle_timeout(None, None)
         return result
 
 
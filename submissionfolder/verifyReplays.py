@@ -0,0 +1,202 @@
+# verifyReplays.py
+# ----------------
+# Re-simulates recorded games in parallel and checks their scores.
+
+"""
+Audits the replays of a tournament.
+
+Every replay is re-simulated from its moves alone, without display, agents
+or delays, and the final score is compared with the score stored in the
+replay when the game was recorded.  Replays are read from files,
+directories, glob patterns and result zips as written by competition.py, and
+are checked by a pool of worker processes.  Each worker parses every layout
+only once.
+
+Games that ended by a crash or timeout are not re-simulated to their
+recorded score, since that score was set by the engine, not by the moves;
+they are reported as such.  Old pickled replays carry no score and are
+reported as unchecked.
+
+Usage: python verifyReplays.py results/2024-01-01.12-00-00.zip results/*/
+"""
+
+import argparse
+import glob
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+
+import replay
+
+OK = 'ok'
+MISMATCH = 'MISMATCH'
+UNCHECKED = 'unchecked'
+CRASHED = 'crashed'
+TIMED_OUT = 'timeout'
+ERROR = 'ERROR'
+
+# Files in result directories that are certainly not replays.
+SKIP_EXTENSIONS = ('.html', '.json', '.csv', '.txt', '.log', '.pstats', '.collapsed')
+
+_layouts = {}
+
+
+def _looksLikeReplay(data):
+    # Binary replays start with the magic, old ones are protocol 2+ pickles.
+    return data[:len(replay.MAGIC)] == replay.MAGIC or data[:1] == b'\x80'
+
+
+def findReplays(paths):
+    """
+    Yields (name, data) for every replay in paths, which may be replay files,
+    directories, glob patterns or zip archives.
+    """
+    for pattern in paths:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        for path in matches:
+            if os.path.isdir(path):
+                for filename in sorted(os.listdir(path)):
+                    full = os.path.join(path, filename)
+                    if os.path.isfile(full):
+                        yield from _fromFile(full)
+            else:
+                yield from _fromFile(path)
+
+
+def _fromFile(path):
+    if path.endswith(SKIP_EXTENSIONS):
+        return
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            layouts = {}
+            for info in archive.infolist():
+                if os.path.basename(os.path.dirname(info.filename)) == replay.LAYOUT_DIR:
+                    fingerprint = os.path.splitext(os.path.basename(info.filename))[0]
+                    layouts[fingerprint] = archive.read(info).decode('utf-8')
+            for info in archive.infolist():
+                if info.is_dir() or info.filename.endswith(SKIP_EXTENSIONS + ('.lay',)):
+                    continue
+                data = archive.read(info)
+                if _looksLikeReplay(data):
+                    yield '%s:%s' % (path, info.filename), _withLayout(data, layouts)
+        return
+    with open(path, 'rb') as f:
+        data = f.read()
+    if _looksLikeReplay(data):
+        directory = replay.LayoutDirectory(os.path.join(os.path.dirname(path), replay.LAYOUT_DIR))
+        yield path, _withLayout(data, directory)
+
+
+def _withLayout(data, layouts):
+    # Workers get self-contained replays, with detached layouts put back.
+    if data[:len(replay.MAGIC)] != replay.MAGIC:
+        return data
+    fingerprint, layoutText, stripped = replay.detachLayout(data)
+    if layoutText is not None:
+        return data
+    layoutText = layouts.get(fingerprint)
+    if layoutText is None:
+        return data
+    return replay.attachLayout(stripped, layoutText)
+
+
+def loadReplay(data):
+    """
+    Reads a replay from bytes, reusing the layouts of earlier replays.
+    """
+    recorded = replay.loadReplayBytes(data)
+    key = recorded.fingerprint
+    if key not in _layouts:
+        _layouts[key] = recorded.getLayout()
+    recorded._layout = _layouts[key]
+    return recorded
+
+
+def verify(data):
+    """
+    Re-simulates one replay.  Returns (status, moves, stored score,
+    simulated score, message).
+    """
+    recorded = loadReplay(data)
+    state = recorded.initialState()
+    for number, (agentIndex, action) in enumerate(recorded.actions):
+        if state.isOver():
+            return ERROR, len(recorded.actions), recorded.score, state.data.score, \
+                'moves after the end of the game (move %d)' % number
+        state = state.generateSuccessor(agentIndex, action)
+    score = state.data.score
+
+    if not recorded.complete:
+        return UNCHECKED, len(recorded.actions), None, score, 'no stored score'
+    if recorded.crashed or recorded.timedOut:
+        status = TIMED_OUT if recorded.timedOut else CRASHED
+        if abs(recorded.score) != 1:
+            return MISMATCH, len(recorded.actions), recorded.score, score, \
+                'a %s game must end with a score of +1 or -1' % status
+        return status, len(recorded.actions), recorded.score, score, ''
+    if score != recorded.score:
+        return MISMATCH, len(recorded.actions), recorded.score, score, ''
+    return OK, len(recorded.actions), recorded.score, score, ''
+
+
+def _verifyTask(task):
+    name, data = task
+    try:
+        return (name,) + verify(data)
+    except Exception as e:
+        return name, ERROR, 0, None, None, '%s: %s' % (type(e).__name__, e)
+
+
+def verifyAll(paths, processes=None, chunksize=8):
+    """
+    Verifies all replays in paths.  Yields result rows in input order:
+    (name, status, moves, stored score, simulated score, message).
+    """
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap(_verifyTask, findReplays(paths), chunksize)
+
+
+def _score(score):
+    return '-' if score is None else str(score)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="""Re-simulates recorded
+            games and compares their final scores with the stored ones.""")
+    parser.add_argument('paths', nargs='+',
+            help="Replay files, directories, glob patterns or result zips.")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+            help="Number of worker processes (default: number of CPUs).")
+    parser.add_argument('-a', '--all', action='store_true',
+            help="List every replay, not only the ones that failed.")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    counts = {}
+    rows = []
+    for row in verifyAll(args.paths, args.jobs):
+        counts[row[1]] = counts.get(row[1], 0) + 1
+        if args.all or row[1] in (MISMATCH, ERROR):
+            rows.append(row)
+    elapsed = time.perf_counter() - start
+
+    if rows:
+        width = max(len(row[0]) for row in rows)
+        print('%-*s %-9s %6s %7s %9s' % (width, 'replay', 'status', 'moves', 'stored', 'simulated'))
+        for name, status, moves, stored, simulated, message in rows:
+            print('%-*s %-9s %6d %7s %9s %s' % (width, name, status, moves,
+                  _score(stored), _score(simulated), message))
+        print()
+
+    total = sum(counts.values())
+    print('%d replays in %.1fs (%.0f per minute)' % (total, elapsed, total * 60.0 / max(elapsed, 1e-9)))
+    for status in (OK, MISMATCH, ERROR, CRASHED, TIMED_OUT, UNCHECKED):
+        if counts.get(status):
+            print('  %-9s %d' % (status, counts[status]))
+    return 1 if counts.get(MISMATCH) or counts.get(ERROR) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))